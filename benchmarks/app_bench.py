@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.app_bench module.
+
+Measures start-up time of command-line tools built on
+:class:`mlabutils.app.CLIAppBase`, each in a new interpreter.
+
+Run from the repository root::
+
+    python benchmarks/app_bench.py [RUNS]
+
+"""
+
+
+import os
+import subprocess
+import sys
+import time
+
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+# Modules mlabutils.app used to import when it was imported itself
+# (daemon and lockfile are included if they are installed)
+EAGER_IMPORTS = "import argparse; import mlabutils.config, mlabutils.watch"
+for name in ("daemon", "lockfile", ):
+    try:
+        __import__(name)
+        EAGER_IMPORTS += "; import " + name
+    except ImportError:
+        pass
+
+HELP_APP = "; ".join([
+    "import mlabutils.app",
+    "mlabutils.app.CLIAppBase('bench').main(['--help'])",
+])
+
+
+def run(code, runs):
+    env = dict(os.environ, PYTHONPATH = SRC)
+    with open(os.devnull, "w") as devnull:
+        best = None
+        for i in range(runs):
+            start = time.time()
+            subprocess.call([ sys.executable, "-c", code ], env = env, stdout = devnull, stderr = devnull)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+
+def bench(label, code, runs):
+    seconds = run(code, runs)
+    print("%-40s %8.1f ms" % (label, seconds * 1e3))
+    return seconds
+
+
+def print_import_times(code, count = 10):
+    """Prints the imports which take longest (cumulatively) when `code`
+    runs, as reported by ``python -X importtime`` (Python 3.7+).
+    """
+    env = dict(os.environ, PYTHONPATH = SRC)
+    process = subprocess.Popen(
+        [ sys.executable, "-X", "importtime", "-c", code ],
+        env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    output = process.communicate()[1].decode("utf-8")
+
+    # Lines are "import time: <self us> | <cumulative us> | <module>"
+    imports = []
+    for line in output.splitlines():
+        fields = line.split(":", 1)[-1].split("|")
+        if line.startswith("import time:") and len(fields) == 3 and fields[1].strip().isdigit():
+            imports.append((int(fields[1]), fields[2].strip()))
+    imports.sort(reverse = True)
+
+    print("Slowest imports of %r (cumulative):" % (code, ))
+    for micros, name in imports[:count]:
+        print("%-40s %8.1f ms" % ("  " + name, micros / 1e3))
+
+
+def main():
+    runs = 10
+    if len(sys.argv) > 1:
+        runs = int(sys.argv[1])
+
+    empty = bench("python -c pass", "pass", runs)
+    eager = bench("import mlabutils.app (+ former imports)", "import mlabutils.app; " + EAGER_IMPORTS, runs)
+    lazy = bench("import mlabutils.app", "import mlabutils.app", runs)
+    print("%-40s %8.2fx" % ("speedup (excluding interpreter)", (eager - empty) / (lazy - empty)))
+    bench("app --help", HELP_APP, runs)
+
+    if sys.version_info >= (3, 7):
+        print("")
+        print_import_times("import mlabutils.app")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.bejson_bench module.
+
+Compares parsing EJSON text with loading the same data from the binary
+format of :mod:`mlabutils.bejson` (and, for reference, :mod:`marshal`),
+using ``tests/radio-observer.json`` scaled up.
+
+Run from the repository root::
+
+    python benchmarks/bejson_bench.py [COPIES]
+
+"""
+
+
+import marshal
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import bejson, ejson
+
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "radio-observer.json")
+
+
+def bench(label, fn, repeat = 3):
+    best = min(timeit.repeat(fn, number = 1, repeat = repeat))
+    print("%-30s %8.3f s" % (label, best))
+    return best
+
+
+def main():
+    copies = 2000
+    if len(sys.argv) > 1:
+        copies = int(sys.argv[1])
+
+    with open(SAMPLE_FILE) as f:
+        sample = f.read()
+    text = "[\n" + ",\n".join([sample] * copies) + "\n]\n"
+
+    value = ejson.Parser().parse_string(text)
+    data = bejson.dumps(value)
+    marshalled = marshal.dumps(value)
+    assert bejson.loads(data) == value
+
+    print("Text: %d bytes, binary: %d bytes, marshal: %d bytes" % (
+        len(text),
+        len(data),
+        len(marshalled),
+    ))
+    print("")
+
+    parse = bench("ejson.Parser.parse_string", lambda: ejson.Parser().parse_string(text))
+    bench("bejson.dumps", lambda: bejson.dumps(value))
+    load = bench("bejson.loads", lambda: bejson.loads(data))
+    marshal_load = bench("marshal.loads", lambda: marshal.loads(marshalled))
+    print("")
+    print("bejson.loads is %.1fx faster than parsing and %.1fx slower than marshal." % (
+        parse / load,
+        load / marshal_load,
+    ))
+
+
+if __name__ == "__main__":
+    main()
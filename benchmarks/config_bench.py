@@ -0,0 +1,222 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.config_bench module.
+
+Benchmarks of :class:`mlabutils.config.Builder` on a generated
+configuration of many stations which share identical sub-configurations.
+
+Run from the repository root::
+
+    python benchmarks/config_bench.py [STATIONS]
+
+"""
+
+
+import copy
+import os
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import config, ejson
+
+from ejson_bench import generate_document
+
+
+class Component(object):
+    """Stands for an application object which takes a while to create
+    (opens files, allocates buffers...).
+    """
+
+    def __init__(self, config):
+        time.sleep(0.0001)
+        self.config = config
+
+
+def bench(label, fn, repeat = 3):
+    best = min(timeit.repeat(fn, number = 1, repeat = repeat))
+    print("%-40s %8.3f s" % (label, best))
+    return best
+
+
+class SlowComponent(object):
+    """Stands for an application object which does slow I/O when it's
+    created (opens a device, connects to JACK...).
+    """
+
+    def __init__(self, config):
+        time.sleep(0.005)
+        self.config = config
+
+
+def make_builder(component = Component, **kwargs):
+    builder = config.Builder(**kwargs)
+    for name in ("pipeline", "waterfall", "snapshot"):
+        builder.add_factory(name, component)
+    return builder
+
+
+def bench_build_cache(value):
+    plain = bench(
+        "Builder.build (no cache)",
+        lambda: make_builder().build(value))
+    cached = bench(
+        "Builder.build (use_cache)",
+        lambda: make_builder(use_cache = True).build(value))
+    print("%-40s %8.2fx" % ("speedup", plain / cached))
+
+    builder = make_builder(use_cache = True)
+    builder.build(value)
+    print("%-40s %5d / %d" % ("  cache hits / misses", builder.cache_hits, builder.cache_misses))
+
+
+def resolve_station(station):
+    # Uses the station and its whole pipeline, as the selected
+    # configuration would be
+    station.resolve()
+    for child in station._config["children"]:
+        child.resolve()
+        for grandchild in child._config["children"]:
+            grandchild.resolve()
+
+
+def bench_lazy(value):
+    eager = bench(
+        "Builder.build (eager)",
+        lambda: make_builder().build(value))
+    lazy = bench(
+        "Builder.build (lazy, one station used)",
+        lambda: resolve_station(make_builder(lazy = True).build(value)["configurations"][0]))
+    print("%-40s %8.2fx" % ("speedup", eager / lazy))
+
+
+def bench_concurrent(value):
+    serial = bench(
+        "Builder.build (serial, 5 ms I/O)",
+        lambda: make_builder(SlowComponent).build(value),
+        repeat = 1)
+    for workers in (4, 16):
+        concurrent = bench(
+            "Builder.build (%d workers, 5 ms I/O)" % (workers, ),
+            lambda: make_builder(SlowComponent, workers = workers).build(value),
+            repeat = 1)
+        print("%-40s %8.2fx" % ("  speedup", serial / concurrent))
+
+
+def bench_rebuild(value):
+    builder = make_builder()
+    previous = builder.rebuild(value)
+    changed = copy.deepcopy(value)
+    changed["configurations"][-1]["children"][0]["overlap"] += 1
+
+    full = bench(
+        "Builder.build (one station changed)",
+        lambda: builder.build(changed))
+    partial = bench(
+        "Builder.rebuild (one station changed)",
+        lambda: builder.rebuild(changed, previous))
+    print("%-40s %8.2fx" % ("speedup", full / partial))
+
+    record = builder.rebuild(changed, previous)
+    print("%-40s %5d / %d" % ("  created / reused", len(record.created), len(record.reused)))
+
+
+def bench_diff():
+    for stations in (500, 1000, 2000, 4000):
+        old = ejson.Parser().parse_string(generate_document(stations))
+        new = ejson.Parser().parse_string(generate_document(stations))
+        new["configurations"][stations // 2]["children"][0]["overlap"] += 1
+        new["configurations"].insert(0, dict(new["configurations"][-1], key = "new"))
+
+        operations = config.diff(old, new)
+        assert config.patch(copy.deepcopy(old), operations) == new
+        seconds = bench(
+            "diff (%d stations, %d operations)" % (stations, len(operations)),
+            lambda: config.diff(old, new))
+        print("%-40s %8.2f us" % ("  per station", seconds * 1e6 / stations))
+
+
+FACTORY_MODULE = """
+import re
+
+PATTERNS = [ re.compile(r"station%d-[a-z]+-(\\d+)" % (i, )) for i in range(20) ]
+
+
+class Component(object):
+    def __init__(self, config):
+        self.config = config
+"""
+
+
+def bench_registry(modules = 200, used = 3):
+    directory = tempfile.mkdtemp()
+    names = [ "bench_factory%d" % (index, ) for index in range(modules) ]
+    for name in names:
+        with open(os.path.join(directory, name + ".py"), "w") as f:
+            f.write(FACTORY_MODULE)
+    value = [ { "factory": name } for name in names[:used] ]
+
+    def unload():
+        for name in names:
+            sys.modules.pop(name, None)
+
+    def eager():
+        unload()
+        builder = config.Builder()
+        for name in names:
+            builder.add_factory(name, __import__(name).Component)
+        return builder.build(value)
+
+    def lazy():
+        unload()
+        builder = config.Builder()
+        for name in names:
+            builder.add_factory(name, name + ".Component")
+        return builder.build(value)
+
+    sys.path.insert(0, directory)
+    try:
+        # Compile the modules first
+        eager()
+
+        eager_time = bench(
+            "add_factory (%d imported modules)" % (modules, ),
+            eager)
+        lazy_time = bench(
+            "add_factory (%d dotted paths, %d used)" % (modules, used),
+            lazy)
+        print("%-40s %8.2fx" % ("speedup", eager_time / lazy_time))
+    finally:
+        unload()
+        sys.path.remove(directory)
+        shutil.rmtree(directory)
+
+
+def main():
+    stations = 500
+    if len(sys.argv) > 1:
+        stations = int(sys.argv[1])
+
+    value = ejson.Parser().parse_string(generate_document(stations))
+    print("Configuration: %d stations" % (stations, ))
+    print("")
+
+    bench_build_cache(value)
+    print("")
+    bench_lazy(value)
+    print("")
+    bench_concurrent(ejson.Parser().parse_string(generate_document(50)))
+    print("")
+    bench_rebuild(value)
+    print("")
+    bench_diff()
+    print("")
+    bench_registry()
+
+
+if __name__ == "__main__":
+    main()
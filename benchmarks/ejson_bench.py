@@ -0,0 +1,383 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.ejson_bench module.
+
+Benchmarks of the :mod:`mlabutils.ejson` module on a large generated
+EJSON document modeled after ``tests/radio-observer.json``.
+
+Run from the repository root::
+
+    python benchmarks/ejson_bench.py [STATIONS]
+
+"""
+
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import ejson, BufferedIterator
+
+
+STATION_TEMPLATE = """
+        {
+            "key":     "station%(index)d",       // configuration identifier
+            "factory": "pipeline",
+
+            /* Backend of the station. */
+            "children": [
+                {
+                    key:       "backend",
+                    factory:   waterfall,
+                    "bins":    32768,       // number of bins used in FFT calculation
+                    "overlap": 24576,
+                    "buffer_chunk_size": 1048576,
+                    "origin": "station-%(index)d",
+                    "iq_gain":        0.125,
+                    "iq_phase_shift": -0.5e-3,
+                    "enabled": true,
+                    "comment": null,
+                    "metadata_path":  "./data/%(index)d",
+                    "bands": [ 10100, 10300, 10900, 11000 ],
+                    "children": [
+                        {
+                            "key":     "recorder",
+                            "factory": "snapshot",
+                            "output_dir": ".",
+                            "output_type": "snap",
+                            "snapshot_length": 60,
+                            "low_freq":      10100,
+                            "hi_freq":       11000,
+                        };
+                    ],
+                },
+            ],
+        },"""
+
+
+class LegacyParser(object):
+    """The original peek/next based parser, kept here for comparison.
+    """
+
+    def parse_tokens(self, tokens):
+        tokens = BufferedIterator(iter(tokens))
+        success, value = self._parse_expression(tokens)
+        if not success:
+            return ejson.ParseError(tokens.peek())
+        t = tokens.peek()
+        if t.type != "EOF":
+            return ejson.ParseError(t)
+        return value
+
+    def _parse_separator(self, tokens):
+        while tokens.peek().type in ("COMMA", "SEMICOLON"):
+            tokens.next()
+        return True, None
+
+    def _parse_expression(self, tokens):
+        for parse in (self._parse_list, self._parse_dict, self._parse_number, self._parse_string):
+            success, value = parse(tokens)
+            if success:
+                return True, value
+        return False, None
+
+    def _parse_number(self, tokens):
+        t = tokens.peek()
+        if not t.type == "NUMBER":
+            return False, None
+        tokens.next()
+        return True, t.value
+
+    def _parse_string(self, tokens):
+        t = tokens.peek()
+        if t.type in ("STRING", "KEYWORD"):
+            tokens.next()
+            return True, t.value
+        return False, None
+
+    def _parse_list(self, tokens):
+        if tokens.peek().type != "LBRACKET":
+            return False, None
+        tokens.next()
+        values = []
+        while True:
+            success, result = self._parse_expression(tokens)
+            if not success:
+                break
+            values.append(result)
+            self._parse_separator(tokens)
+        if tokens.peek().type != "RBRACKET":
+            return True, ejson.ParseError(tokens.peek())
+        tokens.next()
+        return True, values
+
+    def _parse_dict(self, tokens):
+        if tokens.peek().type != "LBRACE":
+            return False, None
+        tokens.next()
+        success, items = self._parse_dict_items(tokens)
+        if not success:
+            return items
+        if tokens.peek().type != "RBRACE":
+            return True, ejson.ParseError(tokens.peek())
+        tokens.next()
+        return True, items
+
+    def _parse_dict_items(self, tokens):
+        elements = {}
+        while True:
+            token = tokens.peek()
+            if not token.type in ("STRING", "KEYWORD"):
+                break
+            tokens.next()
+            if tokens.peek().type in ("COLON", "EQUALS"):
+                tokens.next()
+            success, value = self._parse_expression(tokens)
+            if not success:
+                return False, value
+            elements[token.value] = value
+            self._parse_separator(tokens)
+        return True, elements
+
+
+def generate_document(stations = 2000):
+    """Returns an EJSON document with `stations` configuration entries.
+    """
+    parts = [
+        "{\n",
+        "    \"jack_left_port\":  \"system:capture_1\",      //  JACKd inputs\n",
+        "    \"configuration\": \"station0\",\n",
+        "    \"configurations\": [",
+    ]
+    for index in range(stations):
+        parts.append(STATION_TEMPLATE % { "index": index })
+    parts.append("\n    ],\n}\n")
+    return "".join(parts)
+
+
+def consume(tokens):
+    count = 0
+    for token in tokens:
+        if token.type == "EOF":
+            break
+        count += 1
+    return count
+
+
+def bench(label, fn, repeat = 3):
+    best = min(timeit.repeat(fn, number = 1, repeat = repeat))
+    print("%-40s %8.3f s" % (label, best))
+    return best
+
+
+def bench_lexer(text):
+    sequential = bench(
+        "Lexer (sequential specs)",
+        lambda: consume(ejson.Lexer(compiled = False).scan(text)))
+    compiled = bench(
+        "Lexer (master regex)",
+        lambda: consume(ejson.Lexer(compiled = True, accelerated = False).scan(text)))
+    print("%-40s %8.2fx" % ("speedup", sequential / compiled))
+
+    if not ejson.ACCELERATED:
+        print("%-40s %8s" % ("Lexer (C extension)", "n/a"))
+        return
+    pure = bench(
+        "tokenize (master regex)",
+        lambda: ejson.Lexer(accelerated = False).tokenize(text))
+    accelerated = bench(
+        "tokenize (C extension)",
+        lambda: ejson.Lexer().tokenize(text))
+    print("%-40s %8.2fx" % ("speedup", pure / accelerated))
+
+
+def bench_parser(text):
+    tokens = ejson.Lexer().tokenize(text)
+    assert LegacyParser().parse_tokens(tokens) == ejson.Parser().parse_tokens(tokens)
+
+    legacy = bench(
+        "Parser (legacy peek/next, tokens only)",
+        lambda: LegacyParser().parse_tokens(tokens))
+    current = bench(
+        "Parser (token dispatch, tokens only)",
+        lambda: ejson.Parser().parse_tokens(tokens))
+    print("%-40s %8.2fx" % ("speedup", legacy / current))
+
+
+def bench_incremental(text):
+    parser = ejson.IncrementalParser()
+    parser.parse(text)
+    start = text.index("\"overlap\": 24576", len(text) // 2) + len("\"overlap\": ")
+    values = ["24577", "24576"]
+
+    def edit():
+        values.reverse()
+        parser.edit(start, start + 5, values[0])
+
+    edit()
+    assert parser.value == ejson.Parser().parse_string(parser.text)
+
+    full = bench(
+        "parse_string (whole document)",
+        lambda: ejson.Parser().parse_string(text))
+    incremental = bench(
+        "IncrementalParser.edit (one number)",
+        edit)
+    print("%-40s %8.2fx" % ("speedup", full / incremental))
+
+
+def bench_extract(text):
+    value = ejson.Parser().parse_string(text)
+    assert ejson.extract(text, "configurations[0].children") == [value["configurations"][0]["children"]]
+
+    fn = lambda: ejson.Parser().parse_string(text)
+    full = bench("parse_string (whole document)", fn)
+    print_peak_memory(fn)
+    for path in ("configurations[0].children", "configurations[*].key", "jack_left_port"):
+        fn = lambda: ejson.extract(text, path)
+        current = bench("extract(%s)" % (path, ), fn)
+        print("%-40s %8.2fx" % ("  speedup", full / current))
+        print_peak_memory(fn)
+
+
+def peak_memory(fn):
+    """Returns peak memory (in bytes) allocated by Python while calling `fn`,
+    or None if :mod:`tracemalloc` is not available.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def retained_memory(fn):
+    """Returns memory (in bytes) still allocated by the result of `fn`,
+    or None if :mod:`tracemalloc` is not available.
+    """
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        result = fn()
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_compact(text):
+    for label, options in (
+                ("Parser()", {}),
+                ("Parser(intern_keys = True)", { "intern_keys": True }),
+                ("Parser(compact = True)", { "compact": True }),
+            ):
+        fn = lambda: ejson.Parser(**options).parse_string(text)
+        bench(label, fn)
+        retained = retained_memory(fn)
+        if retained is not None:
+            print("%-40s %8.1f MB" % ("  retained", retained / 1e6))
+
+
+def print_peak_memory(fn):
+    peak = peak_memory(fn)
+    if peak is not None:
+        print("%-40s %8.1f MB" % ("  peak allocated", peak / 1e6))
+
+
+def bench_file(text):
+    fd, file_name = tempfile.mkstemp(suffix = ".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(text)
+
+        for label, use_mmap in (("parse_file (read)", False), ("parse_file (mmap)", True)):
+            fn = lambda: ejson.Parser().parse_file(file_name, use_mmap = use_mmap)
+            bench(label, fn)
+            print_peak_memory(fn)
+    finally:
+        os.remove(file_name)
+
+
+def bench_parse_files(text, count = 64):
+    directory = tempfile.mkdtemp()
+    try:
+        file_names = []
+        for index in range(count):
+            file_name = os.path.join(directory, "station%d.json" % (index, ))
+            with open(file_name, "w") as f:
+                f.write(text)
+            file_names.append(file_name)
+
+        serial = bench(
+            "parse_files (%d files, serial)" % (count, ),
+            lambda: ejson.parse_files(file_names, workers = 1))
+        parallel = bench(
+            "parse_files (%d files, process pool)" % (count, ),
+            lambda: ejson.parse_files(file_names))
+        print("%-40s %8.2fx" % ("speedup", serial / parallel))
+    finally:
+        shutil.rmtree(directory)
+
+
+class NullOutput(object):
+    def write(self, data):
+        pass
+
+
+def bench_writer(text):
+    value = ejson.Parser().parse_string(text)
+
+    for label, indent in (("compact", None), ("indented", 4)):
+        stdlib = bench(
+            "json.dump (%s)" % (label, ),
+            lambda: json.dump(value, NullOutput(), indent = indent))
+        current = bench(
+            "ejson.dump (%s)" % (label, ),
+            lambda: ejson.dump(value, NullOutput(), indent = indent))
+        print("%-40s %8.2fx" % ("  ejson / json", current / stdlib))
+
+
+def main():
+    stations = 2000
+    if len(sys.argv) > 1:
+        stations = int(sys.argv[1])
+
+    text = generate_document(stations)
+    print("Document: %d stations, %d bytes, %d tokens" % (
+        stations,
+        len(text),
+        consume(ejson.Lexer().scan(text)),
+    ))
+    print("")
+
+    bench_lexer(text)
+    print("")
+    bench_parser(text)
+    print("")
+    bench_incremental(text)
+    print("")
+    bench_extract(text)
+    print("")
+    bench_compact(text)
+    print("")
+    bench_file(text)
+    print("")
+    bench_parse_files(generate_document(20))
+    print("")
+    bench_writer(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.iterator_bench module.
+
+Measures the per-element cost of :class:`mlabutils.BufferedIterator`
+while keeping a lookahead of increasing depth.
+
+Run from the repository root::
+
+    python benchmarks/iterator_bench.py
+
+"""
+
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import BufferedIterator
+
+
+ELEMENTS = 20000
+DEPTHS = (1, 10, 100, 1000)
+
+
+class LegacyBufferedIterator(object):
+    """The original list-backed implementation, kept for comparison.
+    """
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.buffer = []
+
+    def peek_list(self, count = 1):
+        while len(self.buffer) < count:
+            value = next(self.iterator)
+            self.buffer.append(value)
+        return self.buffer[:count]
+
+    def next(self):
+        if len(self.buffer) > 0:
+            value = self.buffer[0]
+            self.buffer = self.buffer[1:]
+            return value
+        return next(self.iterator)
+
+
+def walk(cls, depth):
+    iterator = cls(iter(range(ELEMENTS + depth)))
+    for i in range(ELEMENTS):
+        iterator.peek_list(depth)
+        iterator.next()
+
+
+def main():
+    print("%8s %20s %20s" % ("depth", "legacy [us/elem]", "deque [us/elem]"))
+    for depth in DEPTHS:
+        legacy = min(timeit.repeat(lambda: walk(LegacyBufferedIterator, depth), number = 1, repeat = 3))
+        current = min(timeit.repeat(lambda: walk(BufferedIterator, depth), number = 1, repeat = 3))
+        print("%8d %20.3f %20.3f" % (
+            depth,
+            legacy / ELEMENTS * 1e6,
+            current / ELEMENTS * 1e6,
+        ))
+
+
+if __name__ == "__main__":
+    main()
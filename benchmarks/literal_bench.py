@@ -0,0 +1,63 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.literal_bench module.
+
+Per-token cost of decoding EJSON literals with :func:`eval` (as the lexer
+used to) and with :func:`mlabutils.ejson.decode_number` and
+:func:`mlabutils.ejson.decode_string`, on number-heavy arrays such as lists
+of FFT bins.
+
+Run from the repository root::
+
+    python benchmarks/literal_bench.py
+
+"""
+
+
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import ejson
+
+
+COUNT = 100000
+
+
+def bench(label, decode, literals):
+    best = min(timeit.repeat(lambda: [decode(l) for l in literals], number = 1, repeat = 3))
+    per_token = best / len(literals) * 1e6
+    print("%-40s %8.3f us/token" % (label, per_token))
+    return per_token
+
+
+def compare(label, literals, decode):
+    slow = bench(label + " (eval)", eval, literals)
+    fast = bench(label + " (decoder)", decode, literals)
+    print("%-40s %8.1fx" % ("  speedup", slow / fast))
+
+
+def main():
+    rnd = random.Random(0)
+
+    bins = [str(rnd.randint(0, 32768)) for i in range(COUNT)]
+    levels = ["%.6f" % (rnd.uniform(-120.0, 0.0), ) for i in range(COUNT)]
+    exponents = ["%.4e" % (rnd.uniform(-1.0, 1.0), ) for i in range(COUNT)]
+    strings = ["\"station-%d\"" % (i, ) for i in range(COUNT)]
+    escaped = ["\"line %d\\n\\t\\\"quoted\\\"\"" % (i, ) for i in range(COUNT)]
+
+    for label, literals, decode in (
+        ("FFT bin indices", bins, ejson.decode_number),
+        ("FFT levels (fixed)", levels, ejson.decode_number),
+        ("FFT levels (exponent)", exponents, ejson.decode_number),
+        ("plain strings", strings, ejson.decode_string),
+        ("escaped strings", escaped, ejson.decode_string),
+    ):
+        compare(label, literals, decode)
+
+
+if __name__ == "__main__":
+    main()
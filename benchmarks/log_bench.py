@@ -0,0 +1,165 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.log_bench module.
+
+Compares logging straight to a file with logging through
+:mod:`mlabutils.asynclog`: the time the logging threads spend in logging
+calls, their worst case, and the time until all records are written.
+
+Then measures logging to sinks set up by :mod:`mlabutils.logconfig`.
+
+Run from the repository root::
+
+    python benchmarks/log_bench.py [RECORDS]
+
+"""
+
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import asynclog, logconfig
+
+
+THREADS = 4
+
+
+class SlowFile(object):
+    """File whose flush takes `delay` seconds, like a busy disk or a
+    network file system.
+    """
+
+    def __init__(self, file_name, delay):
+        self.file = open(file_name, "a")
+        self.delay = delay
+
+    def write(self, data):
+        self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+        time.sleep(self.delay)
+
+    def close(self):
+        self.file.close()
+
+
+def log_records(logger, records, latencies):
+    worst = 0.0
+    total = 0.0
+    for i in range(records):
+        start = time.time()
+        logger.info("Record %d from %s.", i, "bench")
+        elapsed = time.time() - start
+        total += elapsed
+        if elapsed > worst:
+            worst = elapsed
+    latencies.append((total, worst))
+
+
+def bench(label, handler, records, **kwargs):
+    logger = logging.Logger("bench", logging.INFO)
+    logger.propagate = False
+    handler.setFormatter(logging.Formatter("%(asctime)s   %(process)s  %(name)s  %(levelname)s  %(message)s"))
+    logger.addHandler(handler)
+    async_handler = None
+    if kwargs:
+        async_handler = asynclog.install(logger, **kwargs)
+
+    latencies = []
+    threads = [ threading.Thread(target = log_records, args = (logger, records, latencies)) for i in range(THREADS) ]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logged = time.time() - start
+    if async_handler is not None:
+        async_handler.flush()
+    written = time.time() - start
+
+    dropped = 0
+    if async_handler is not None:
+        dropped = async_handler.dropped
+        asynclog.uninstall(async_handler, logger)
+    handler.close()
+
+    mean = sum(total for total, worst in latencies) / (records * THREADS)
+    worst = max(worst for total, worst in latencies)
+    print("%-32s %8.2f us %10.2f ms %10.1f ms %10.1f ms %8d" % (
+        label, mean * 1e6, worst * 1e3, logged * 1e3, written * 1e3, dropped))
+
+
+def bench_sinks(label, sinks, records, format = logconfig.DEFAULT_FORMAT, flush_delay = None):
+    logger = logging.Logger("bench")
+    logger.propagate = False
+    handlers = logconfig.configure(sinks, logger)
+    for handler in handlers:
+        target = getattr(handler, "target", handler)
+        if format is not None:
+            # A separate plain formatter for each sink, like before
+            target.setFormatter(logging.Formatter(format))
+        if flush_delay is not None and isinstance(target, logging.FileHandler):
+            target.stream.close()
+            target.stream = SlowFile(target.baseFilename, flush_delay)
+
+    start = time.time()
+    for i in range(records):
+        logger.debug("Record %d from %s.", i, "bench")
+    for handler in handlers:
+        handler.flush()
+    elapsed = time.time() - start
+    for handler in handlers:
+        handler.close()
+    print("%-40s %8.2f us" % (label, elapsed / records * 1e6))
+
+
+def main():
+    records = 20000
+    if len(sys.argv) > 1:
+        records = int(sys.argv[1])
+
+    directory = tempfile.mkdtemp()
+    file_name = os.path.join(directory, "bench.log")
+    try:
+        print("%d threads logging %d records each" % (THREADS, records))
+        print("%-32s %11s %13s %13s %13s %8s" % ("", "mean call", "worst call", "logged", "written", "dropped"))
+
+        bench("file", logging.FileHandler(file_name), records)
+        bench("file, async", logging.FileHandler(file_name), records, overflow = asynclog.BLOCK)
+
+        # Only a few records are logged to the slow file, as the
+        # synchronous case flushes after each one
+        slow_records = records // 100
+        bench("slow file", logging.StreamHandler(SlowFile(file_name, 0.001)), slow_records)
+        bench("slow file, async (block)", logging.StreamHandler(SlowFile(file_name, 0.001)), slow_records,
+            overflow = asynclog.BLOCK)
+        bench("slow file, async (drop)", logging.StreamHandler(SlowFile(file_name, 0.001)), slow_records,
+            max_size = 100, overflow = asynclog.DROP)
+
+        print("")
+        print("%d debug records, per record:" % (records, ))
+        stderr = { "file_name": "-", "log_level": "warning" }
+        debug = { "file_name": file_name, "log_level": "debug" }
+        info = { "file_name": file_name, "log_level": "info" }
+        bench_sinks("info file + warning stderr", [ info, stderr ], records)
+        bench_sinks("debug file + warning stderr", [ debug, stderr ], records)
+        bench_sinks("debug file, buffered", [ dict(debug, buffer = 1000), stderr ], records)
+        bench_sinks("debug slow file", [ debug, stderr ], slow_records, flush_delay = 0.001)
+        bench_sinks("debug slow file, buffered", [ dict(debug, buffer = 1000), stderr ], slow_records,
+            flush_delay = 0.001)
+        bench_sinks("2 debug files", [ debug, debug ], records)
+        bench_sinks("2 debug files, shared formatter", [ debug, debug ], records, format = None)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
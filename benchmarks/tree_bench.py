@@ -0,0 +1,269 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""benchmarks.tree_bench module.
+
+Compares :class:`mlabutils.ejson.Parser` and
+:class:`mlabutils.config.Builder` (recursive up to
+``MAX_RECURSION_DEPTH``, explicit stack below) with their former purely
+recursive implementations and with the explicit stack alone, on a real
+config file, and on wide and deep synthetic trees.
+
+Run from the repository root::
+
+    python benchmarks/tree_bench.py [DEPTH]
+
+"""
+
+
+import array
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from mlabutils import config, ejson
+
+
+try:
+    RecursionLimitError = RecursionError
+except NameError:
+    # Python 2
+    RecursionLimitError = RuntimeError
+
+
+class RecursiveParser(ejson.Parser):
+    """The former recursive parser, kept here for comparison.
+    """
+
+    def _parse_value(self):
+        token = self._tokens[self._pos]
+        token_type = token.type
+
+        if token_type in self.SCALAR_TOKENS:
+            self._pos += 1
+            return token.value
+        if token_type == "LBRACKET":
+            return self._parse_list()
+        if token_type == "LBRACE":
+            return self._parse_dict()
+
+        raise ejson.ParseError(token)
+
+    def _parse_list(self):
+        tokens = self._tokens
+        scalars = self.SCALAR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+
+        pos = self._pos + 1
+        values = []
+
+        while True:
+            token = tokens[pos]
+            token_type = token.type
+
+            if token_type in scalars:
+                values.append(token.value)
+                pos += 1
+            elif token_type == "RBRACKET":
+                self._pos = pos + 1
+                return values
+            elif token_type in separators and values:
+                pos += 1
+            elif token_type == "LBRACKET" or token_type == "LBRACE":
+                self._pos = pos
+                values.append(self._parse_value())
+                pos = self._pos
+            else:
+                raise ejson.ParseError(token)
+
+    def _parse_dict(self):
+        tokens = self._tokens
+        scalars = self.SCALAR_TOKENS
+        keys = self.KEY_TOKENS
+        key_separators = self.KEY_SEPARATOR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+
+        pos = self._pos + 1
+        elements = {}
+
+        while True:
+            token = tokens[pos]
+            token_type = token.type
+
+            if token_type == "RBRACE":
+                self._pos = pos + 1
+                return elements
+            elif token_type in separators and elements:
+                pos += 1
+                continue
+            elif token_type not in keys:
+                raise ejson.ParseError(token)
+
+            key = token.value
+            pos += 1
+            if tokens[pos].type in key_separators:
+                pos += 1
+
+            token = tokens[pos]
+            if token.type in scalars:
+                elements[key] = token.value
+                pos += 1
+            else:
+                self._pos = pos
+                elements[key] = self._parse_value()
+                pos = self._pos
+
+
+class RecursiveBuilder(config.Builder):
+    """The former recursive builder, kept here for comparison.
+    """
+
+    def _build(self, config):
+        use_cache = self.use_cache
+
+        if isinstance(config, (list, array.array)):
+            result = []
+            nodes = []
+
+            for item in config:
+                item, node = self._build(item)
+                result.append(item)
+                nodes.append(node)
+
+            if not use_cache or None in nodes:
+                return result, None
+            return result, self._get_node(("list", tuple(nodes)))
+
+        if isinstance(config, (dict, ejson.Record)):
+            new_dict = {}
+            nodes = []
+            for key, value in config.items():
+                new_dict[key], node = self._build(value)
+                nodes.append((key, node))
+
+            node = None
+            if use_cache and not any(node is None for key, node in nodes):
+                node = self._get_node(frozenset(nodes))
+
+            factory_name = self._get_factory_name(config)
+            if factory_name is None:
+                return new_dict, node
+            return self._make_object(factory_name, new_dict, node), node
+
+        if not use_cache:
+            return config, None
+        return config, self._get_value_node(config)
+
+
+class StackParser(ejson.Parser):
+    """Parser which uses the explicit stack at every depth.
+    """
+
+    MAX_RECURSION_DEPTH = 0
+
+
+class StackBuilder(config.Builder):
+    """Builder which uses the explicit stack at every depth.
+    """
+
+    MAX_RECURSION_DEPTH = 0
+
+
+class Component(object):
+    def __init__(self, config):
+        self.config = config
+
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "tests", "radio-observer.json")
+
+
+def config_text():
+    with open(CONFIG_FILE) as f:
+        return f.read()
+
+
+def wide_text(count = 20000):
+    item = "{ key: \"item%d\", factory: component, values: [ 1, 2.5, \"x\" ], options: { a: 1, b: [ 2 ] } }"
+    return "[" + ",\n".join(item % (i, ) for i in range(count)) + "]"
+
+
+def deep_text(depth):
+    return "{ children: [ " * depth + "{ factory: component }" + " ] }" * depth
+
+
+def count_nodes(value):
+    count = 0
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        count += 1
+        if isinstance(value, list):
+            stack.extend(value)
+        elif isinstance(value, dict):
+            stack.extend(value.values())
+    return count
+
+
+def bench(label, fn, nodes, number = 1, repeat = 7):
+    try:
+        best = min(timeit.repeat(fn, number = number, repeat = repeat)) / number
+    except RecursionLimitError:
+        print("%-40s %s" % (label, "recursion limit exceeded"))
+        return None
+    print("%-40s %8.3f ms %8.0f ns/node" % (label, best * 1e3, best * 1e9 / nodes))
+    return best
+
+
+def print_speedups(current, others):
+    for label, seconds in others:
+        if seconds is not None:
+            print("%-40s %8.2fx" % ("  speedup over " + label, seconds / current))
+
+
+def bench_tree(label, text, number = 1):
+    tokens = ejson.Lexer().tokenize(text)
+    value = ejson.Parser().parse_tokens(tokens)
+    nodes = count_nodes(value)
+    print("%s: %d nodes" % (label, nodes, ))
+
+    others = []
+    for name, cls in (("recursive", RecursiveParser), ("explicit stack", StackParser), ):
+        others.append((name, bench(
+            "  Parser (%s)" % (name, ),
+            lambda: cls().parse_tokens(tokens), nodes, number)))
+    current = bench("  Parser", lambda: ejson.Parser().parse_tokens(tokens), nodes, number)
+    print_speedups(current, others)
+
+    def make_builder(cls):
+        builder = cls()
+        builder.add_factory("component", Component)
+        for name in ("pipeline", "waterfall", "snapshot", "bolid", "uploader", ):
+            builder.add_factory(name, Component)
+        return builder
+
+    others = []
+    for name, cls in (("recursive", RecursiveBuilder), ("explicit stack", StackBuilder), ):
+        others.append((name, bench(
+            "  Builder (%s)" % (name, ),
+            lambda: make_builder(cls).build(value), nodes, number)))
+    current = bench("  Builder", lambda: make_builder(config.Builder).build(value), nodes, number)
+    print_speedups(current, others)
+
+
+def main():
+    depth = 10000
+    if len(sys.argv) > 1:
+        depth = int(sys.argv[1])
+
+    bench_tree("radio-observer.json", config_text(), number = 200)
+    print("")
+    bench_tree("Wide tree", wide_text())
+    print("")
+    bench_tree("Deep tree (depth 300)", deep_text(300))
+    print("")
+    bench_tree("Deep tree (depth %d)" % (depth, ), deep_text(depth))
+
+
+if __name__ == "__main__":
+    main()
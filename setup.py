@@ -1,12 +1,35 @@
 #!/usr/bin/python
 # -*- coding: utf8 -*-
 
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
+from setuptools.command.build_ext import build_ext
+from distutils.errors import CCompilerError, DistutilsExecError, DistutilsPlatformError
 import sys
 import os
 import os.path as path
 
 
+class optional_build_ext(build_ext):
+    """Builds C extensions, but only warns if they can't be built.
+    """
+
+    def run(self):
+        try:
+            build_ext.run(self)
+        except DistutilsPlatformError as e:
+            self._warn(e)
+
+    def build_extension(self, ext):
+        try:
+            build_ext.build_extension(self, ext)
+        except (CCompilerError, DistutilsExecError, DistutilsPlatformError, IOError, ValueError) as e:
+            self._warn(e)
+
+    def _warn(self, error):
+        sys.stderr.write("WARNING: Optional C extension could not be built (%s). "
+                         "The pure-Python implementation will be used.\n" % (error, ))
+
+
 os.chdir(path.realpath(path.dirname(__file__)))
 sys.path.insert(1, 'src')
 import mlabutils
@@ -26,6 +49,16 @@ setup(
     package_dir = {'': 'src'},
     provides    = ['mlabutils'],
     install_requires = [ 'python-daemon', 'lockfile' ],
+
+    # Optional accelerated EJSON lexer. If it can't be built,
+    # mlabutils.ejson falls back to the pure-Python implementation.
+    ext_modules = [
+        Extension(
+            'mlabutils._ejson_speedups',
+            ['src/mlabutils/_ejson_speedups.c'],
+        ),
+    ],
+    cmdclass = { 'build_ext': optional_build_ext },
     keywords = ['MLAB', 'library', 'utils', ],
     license     = 'Lesser General Public License v3',
     download_url = 'https://github.com/MLAB-project/python-mlab-utils/archive/0.1.tar.gz',
@@ -9,10 +9,19 @@ Author: Jan Milík <milikjan@fit.cvut.cz>
 __version__ = "0.1.2"
 
 
+import collections
 import itertools
 
 
 class IteratorBase(object):
+    __slots__ = ()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.next()
+
     def next(self):
         raise StopIteration()
 
@@ -21,9 +30,18 @@ class IteratorBase(object):
 
 
 class IteratorWrapper(IteratorBase):
+    """Wrapper around an iterator.
+
+    If `use_stop_element` is true, the wrapper doesn't stop when the wrapped
+    iterator is exhausted and returns `stop_element` instead.
+    """
+
+    __slots__ = ("iterator", "use_stop_element", "stop_element", )
+
     def __init__(self, iterator, use_stop_element = False, stop_element = None):
         IteratorBase.__init__(self)
-        self.iterator = iterator
+        self.iterator = iter(iterator)
+        self.use_stop_element = use_stop_element
         self.stop_element = stop_element
 
     def _next(self):
@@ -35,38 +53,92 @@ class IteratorWrapper(IteratorBase):
         else:
             return next(self.iterator)
 
+    def next(self):
+        return self._next()
+
+    __next__ = next
+
 
 class BufferedIterator(IteratorWrapper):
     """Wrapper around an iterator which provides buffering and peek operations.
+
+    Looked-ahead elements are kept in a :class:`collections.deque`, so
+    consuming an element costs the same regardless of the lookahead depth.
     """
 
+    __slots__ = ("buffer", )
+
     def __init__(self, iterator, use_stop_element = False, stop_element = None):
         IteratorWrapper.__init__(self, iterator, use_stop_element, stop_element)
-        self.buffer = []
-
-    def __iter__(self):
-        return self
+        self.buffer = collections.deque()
 
     def peek(self):
-        if len(self.buffer) > 0:
+        if self.buffer:
             return self.buffer[0]
 
-        value = next(self.iterator)
+        value = self._next()
         self.buffer.append(value)
         return value
 
     def peek_list(self, count = 1):
-        while len(self.buffer) < count:
-            value = next(self.iterator)
-            self.buffer.append(value)
-        return self.buffer[:count]
+        """Returns a :class:`LookaheadView` of the next `count` elements.
+
+        The view doesn't copy the elements. It is only valid until the
+        iterator is advanced; use ``list(view)`` to keep the elements.
+        """
+        buffer = self.buffer
+        while len(buffer) < count:
+            buffer.append(self._next())
+        return LookaheadView(buffer, count)
 
     def next(self):
-        if len(self.buffer) > 0:
-            value = self.buffer[0]
-            self.buffer = self.buffer[1:]
-            return value
-        return next(self.iterator)
+        if self.buffer:
+            return self.buffer.popleft()
+        return self._next()
+
+    __next__ = next
+
+
+class LookaheadView(object):
+    """Read-only sequence view of the first `count` elements of
+    a :class:`BufferedIterator` buffer.
+    """
+
+    __slots__ = ("_buffer", "_count", )
+
+    def __init__(self, buffer, count):
+        self._buffer = buffer
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return itertools.islice(self._buffer, self._count)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("lookahead index out of range")
+        return self._buffer[index]
+
+    def __eq__(self, other):
+        try:
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        except TypeError:
+            return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __repr__(self):
+        return "LookaheadView(%r)" % (list(self), )
 
 
 def main():
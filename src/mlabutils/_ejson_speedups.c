@@ -0,0 +1,569 @@
+/*
+ * mlabutils._ejson_speedups module.
+ *
+ * Accelerated implementation of mlabutils.ejson.Lexer.tokenize. It
+ * produces exactly the same list of tokens as the pure-Python lexer
+ * (see the t_* token specifications of mlabutils.ejson.Lexer) and is
+ * used automatically by mlabutils.ejson when it can be imported.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#if PY_MAJOR_VERSION >= 3
+#define IS_PY3 1
+#define TEXT_FromString PyUnicode_InternFromString
+#else
+#define IS_PY3 0
+#define TEXT_FromString PyString_InternFromString
+#endif
+
+
+/* Source text ********************************************************/
+
+enum {
+    SOURCE_BYTES,      /* Python 2 str */
+    SOURCE_UNICODE,    /* Python 2 unicode */
+    SOURCE_UCS1,       /* Python 3 str */
+    SOURCE_UCS2,
+    SOURCE_UCS4
+};
+
+typedef struct {
+    PyObject *object;
+    int kind;
+    const void *data;
+    Py_ssize_t length;
+} Source;
+
+static int
+source_init(Source *source, PyObject *text)
+{
+    source->object = text;
+#if IS_PY3
+    if (!PyUnicode_Check(text)) {
+        PyErr_SetString(PyExc_TypeError, "text must be str");
+        return -1;
+    }
+    if (PyUnicode_READY(text) < 0)
+        return -1;
+    source->data = PyUnicode_DATA(text);
+    source->length = PyUnicode_GET_LENGTH(text);
+    switch (PyUnicode_KIND(text)) {
+    case PyUnicode_1BYTE_KIND: source->kind = SOURCE_UCS1; break;
+    case PyUnicode_2BYTE_KIND: source->kind = SOURCE_UCS2; break;
+    default: source->kind = SOURCE_UCS4; break;
+    }
+#else
+    if (PyString_Check(text)) {
+        source->kind = SOURCE_BYTES;
+        source->data = PyString_AS_STRING(text);
+        source->length = PyString_GET_SIZE(text);
+    }
+    else if (PyUnicode_Check(text)) {
+        source->kind = SOURCE_UNICODE;
+        source->data = PyUnicode_AS_UNICODE(text);
+        source->length = PyUnicode_GET_SIZE(text);
+    }
+    else {
+        PyErr_SetString(PyExc_TypeError, "text must be str or unicode");
+        return -1;
+    }
+#endif
+    return 0;
+}
+
+static Py_UCS4
+source_char(const Source *source, Py_ssize_t index)
+{
+    switch (source->kind) {
+    case SOURCE_BYTES:
+    case SOURCE_UCS1:
+        return ((const unsigned char *) source->data)[index];
+#if IS_PY3
+    case SOURCE_UCS2:
+        return ((const Py_UCS2 *) source->data)[index];
+    case SOURCE_UCS4:
+        return ((const Py_UCS4 *) source->data)[index];
+#else
+    case SOURCE_UNICODE:
+        return ((const Py_UNICODE *) source->data)[index];
+#endif
+    }
+    return 0;
+}
+
+static PyObject *
+source_slice(const Source *source, Py_ssize_t start, Py_ssize_t end)
+{
+#if IS_PY3
+    return PyUnicode_Substring(source->object, start, end);
+#else
+    if (source->kind == SOURCE_BYTES)
+        return PyString_FromStringAndSize((const char *) source->data + start, end - start);
+    return PyUnicode_FromUnicode((const Py_UNICODE *) source->data + start, end - start);
+#endif
+}
+
+static int
+source_is_space(const Source *source, Py_UCS4 c)
+{
+#if IS_PY3
+    /* \s of str patterns */
+    return Py_UNICODE_ISSPACE(c);
+#else
+    /* \s of patterns without the UNICODE flag */
+    return c == ' ' || (c >= '\t' && c <= '\r');
+#endif
+}
+
+
+/* Token matching *****************************************************/
+
+enum {
+    T_NONE = -1,
+    T_IGNORE,
+    T_COMMENT,
+    T_KEYWORD,
+    T_NUMBER,
+    T_STRING,
+    T_LPAREN,
+    T_RPAREN,
+    T_LBRACKET,
+    T_RBRACKET,
+    T_LBRACE,
+    T_RBRACE,
+    T_COMMA,
+    T_SEMICOLON,
+    T_COLON,
+    T_EQUALS,
+    T_UNKNOWN,
+    T_EOF,
+    T_COUNT
+};
+
+static const char *token_names[T_COUNT] = {
+    "ignore",
+    "comment",
+    "KEYWORD",
+    "NUMBER",
+    "STRING",
+    "LPAREN",
+    "RPAREN",
+    "LBRACKET",
+    "RBRACKET",
+    "LBRACE",
+    "RBRACE",
+    "COMMA",
+    "SEMICOLON",
+    "COLON",
+    "EQUALS",
+    "UNKNOWN",
+    "EOF"
+};
+
+static PyObject *token_types[T_COUNT];
+
+#define IS_DIGIT(c) ((c) >= '0' && (c) <= '9')
+#define IS_ALPHA(c) (((c) >= 'a' && (c) <= 'z') || ((c) >= 'A' && (c) <= 'Z') || (c) == '_')
+
+/* Returns the type of the token at `pos` and stores its end in `end`,
+ * or T_NONE if no token matches there. */
+static int
+match_token(const Source *s, Py_ssize_t pos, Py_ssize_t *end)
+{
+    Py_ssize_t length = s->length;
+    Py_ssize_t p = pos;
+    Py_UCS4 c = source_char(s, p);
+
+    if (source_is_space(s, c)) {
+        p++;
+        while (p < length && source_is_space(s, source_char(s, p)))
+            p++;
+        *end = p;
+        return T_IGNORE;
+    }
+
+    switch (c) {
+    case '(': *end = p + 1; return T_LPAREN;
+    case ')': *end = p + 1; return T_RPAREN;
+    case '[': *end = p + 1; return T_LBRACKET;
+    case ']': *end = p + 1; return T_RBRACKET;
+    case '{': *end = p + 1; return T_LBRACE;
+    case '}': *end = p + 1; return T_RBRACE;
+    case ',': *end = p + 1; return T_COMMA;
+    case ';': *end = p + 1; return T_SEMICOLON;
+    case ':': *end = p + 1; return T_COLON;
+    case '=': *end = p + 1; return T_EQUALS;
+    }
+
+    if (IS_ALPHA(c)) {
+        p++;
+        while (p < length) {
+            c = source_char(s, p);
+            if (!IS_ALPHA(c) && !IS_DIGIT(c))
+                break;
+            p++;
+        }
+        *end = p;
+        return T_KEYWORD;
+    }
+
+    if (c == '-' || IS_DIGIT(c)) {
+        /* -?(0|[1-9][0-9]*)(\.[0-9]*)?([eE][-+]?[0-9]+)? */
+        if (c == '-') {
+            p++;
+            if (p >= length)
+                return T_NONE;
+            c = source_char(s, p);
+        }
+        if (c == '0')
+            p++;
+        else if (IS_DIGIT(c)) {
+            p++;
+            while (p < length && IS_DIGIT(source_char(s, p)))
+                p++;
+        }
+        else
+            return T_NONE;
+
+        if (p < length && source_char(s, p) == '.') {
+            p++;
+            while (p < length && IS_DIGIT(source_char(s, p)))
+                p++;
+        }
+
+        if (p < length && (source_char(s, p) == 'e' || source_char(s, p) == 'E')) {
+            Py_ssize_t q = p + 1;
+            if (q < length && (source_char(s, q) == '-' || source_char(s, q) == '+'))
+                q++;
+            if (q < length && IS_DIGIT(source_char(s, q))) {
+                while (q < length && IS_DIGIT(source_char(s, q)))
+                    q++;
+                p = q;
+            }
+        }
+
+        *end = p;
+        return T_NUMBER;
+    }
+
+    if (c == '"') {
+        /* \"(\\.|[^\"\\\n])*\" */
+        p++;
+        while (p < length) {
+            c = source_char(s, p);
+            if (c == '"') {
+                *end = p + 1;
+                return T_STRING;
+            }
+            if (c == '\n')
+                return T_NONE;
+            if (c == '\\') {
+                if (p + 1 >= length || source_char(s, p + 1) == '\n')
+                    return T_NONE;
+                p += 2;
+            }
+            else
+                p++;
+        }
+        return T_NONE;
+    }
+
+    if (c == '/' && p + 1 < length) {
+        /* (\/\/[^\n]*)|(\/\*[\s\S]*?\*\/) */
+        c = source_char(s, p + 1);
+        if (c == '/') {
+            p += 2;
+            while (p < length && source_char(s, p) != '\n')
+                p++;
+            *end = p;
+            return T_COMMENT;
+        }
+        if (c == '*') {
+            p += 2;
+            while (p + 1 < length) {
+                if (source_char(s, p) == '*' && source_char(s, p + 1) == '/') {
+                    *end = p + 2;
+                    return T_COMMENT;
+                }
+                p++;
+            }
+            return T_NONE;
+        }
+    }
+
+    return T_NONE;
+}
+
+
+/* Token values *******************************************************/
+
+static int
+keyword_equals(const Source *s, Py_ssize_t start, Py_ssize_t end, const char *lower)
+{
+    Py_ssize_t i;
+    for (i = start; i < end; i++, lower++) {
+        Py_UCS4 c = source_char(s, i);
+        if (c >= 'A' && c <= 'Z')
+            c += 'a' - 'A';
+        if (*lower == '\0' || c != (Py_UCS4) *lower)
+            return 0;
+    }
+    return *lower == '\0';
+}
+
+static PyObject *
+keyword_value(const Source *s, Py_ssize_t start, Py_ssize_t end, PyObject *text)
+{
+    if (keyword_equals(s, start, end, "true"))
+        Py_RETURN_TRUE;
+    if (keyword_equals(s, start, end, "false"))
+        Py_RETURN_FALSE;
+    if (keyword_equals(s, start, end, "null"))
+        Py_RETURN_NONE;
+    Py_INCREF(text);
+    return text;
+}
+
+static PyObject *
+number_value(const Source *s, Py_ssize_t start, Py_ssize_t end, PyObject *text)
+{
+    Py_ssize_t i;
+    for (i = start; i < end; i++) {
+        Py_UCS4 c = source_char(s, i);
+        if (c == '.' || c == 'e' || c == 'E')
+#if IS_PY3
+            return PyFloat_FromString(text);
+#else
+            return PyFloat_FromString(text, NULL);
+#endif
+    }
+#if IS_PY3
+    return PyLong_FromUnicodeObject(text, 10);
+#else
+    return PyNumber_Int(text);
+#endif
+}
+
+static PyObject *
+string_value(const Source *s, Py_ssize_t start, Py_ssize_t end, PyObject *text, PyObject *decode_string)
+{
+    Py_ssize_t i;
+    for (i = start + 1; i < end - 1; i++) {
+        if (source_char(s, i) == '\\')
+            return PyObject_CallFunctionObjArgs(decode_string, text, NULL);
+    }
+    return source_slice(s, start + 1, end - 1);
+}
+
+
+/* Tokenizer **********************************************************/
+
+static PyObject *empty_tuple;
+static PyObject *empty_text;
+static PyObject *str_type;
+static PyObject *str_offset;
+static PyObject *str_text;
+static PyObject *str_value;
+
+/* Steals references to `text` and `value`. */
+static PyObject *
+make_token(PyTypeObject *token_class, int type, Py_ssize_t offset, PyObject *text, PyObject *value)
+{
+    PyObject *token = NULL;
+    PyObject *offset_object = NULL;
+
+    if (text == NULL || value == NULL)
+        goto error;
+
+#if IS_PY3
+    offset_object = PyLong_FromSsize_t(offset);
+#else
+    offset_object = PyInt_FromSsize_t(offset);
+#endif
+    if (offset_object == NULL)
+        goto error;
+
+    token = token_class->tp_new(token_class, empty_tuple, NULL);
+    if (token == NULL)
+        goto error;
+
+    if (PyObject_SetAttr(token, str_type, token_types[type]) < 0
+            || PyObject_SetAttr(token, str_offset, offset_object) < 0
+            || PyObject_SetAttr(token, str_text, text) < 0
+            || PyObject_SetAttr(token, str_value, value) < 0)
+        goto error;
+
+    Py_DECREF(offset_object);
+    Py_DECREF(text);
+    Py_DECREF(value);
+    return token;
+
+error:
+    Py_XDECREF(token);
+    Py_XDECREF(offset_object);
+    Py_XDECREF(text);
+    Py_XDECREF(value);
+    return NULL;
+}
+
+static int
+append_token(PyObject *list, PyObject *token)
+{
+    int result;
+    if (token == NULL)
+        return -1;
+    result = PyList_Append(list, token);
+    Py_DECREF(token);
+    return result;
+}
+
+PyDoc_STRVAR(tokenize_doc,
+"tokenize(text, offset, token_class, decode_string) -> list\n\
+\n\
+Returns the list of tokens of `text` starting at `offset`, terminated\n\
+by an EOF token, exactly like mlabutils.ejson.Lexer.tokenize does.");
+
+static PyObject *
+tokenize(PyObject *self, PyObject *args)
+{
+    PyObject *text;
+    Py_ssize_t pos;
+    PyObject *token_class;
+    PyObject *decode_string;
+    PyObject *tokens;
+    Source source;
+
+    if (!PyArg_ParseTuple(args, "OnOO:tokenize", &text, &pos, &token_class, &decode_string))
+        return NULL;
+    if (!PyType_Check(token_class)) {
+        PyErr_SetString(PyExc_TypeError, "token_class must be a class");
+        return NULL;
+    }
+    if (source_init(&source, text) < 0)
+        return NULL;
+    if (pos < 0)
+        pos = 0;
+
+    tokens = PyList_New(0);
+    if (tokens == NULL)
+        return NULL;
+
+    while (pos < source.length) {
+        Py_ssize_t end = pos;
+        int type = match_token(&source, pos, &end);
+        PyObject *token_text;
+        PyObject *value;
+
+        if (type == T_NONE) {
+            token_text = source_slice(&source, pos, source.length);
+            Py_XINCREF(token_text);
+            if (append_token(tokens, make_token((PyTypeObject *) token_class, T_UNKNOWN, pos, token_text, token_text)) < 0)
+                goto error;
+            pos = source.length;
+            break;
+        }
+
+        if (type == T_IGNORE || type == T_COMMENT) {
+            pos = end;
+            continue;
+        }
+
+        token_text = source_slice(&source, pos, end);
+        if (token_text == NULL)
+            goto error;
+
+        switch (type) {
+        case T_KEYWORD:
+            value = keyword_value(&source, pos, end, token_text);
+            break;
+        case T_NUMBER:
+            value = number_value(&source, pos, end, token_text);
+            break;
+        case T_STRING:
+            value = string_value(&source, pos, end, token_text, decode_string);
+            break;
+        default:
+            Py_INCREF(token_text);
+            value = token_text;
+            break;
+        }
+
+        if (append_token(tokens, make_token((PyTypeObject *) token_class, type, pos, token_text, value)) < 0)
+            goto error;
+        pos = end;
+    }
+
+    Py_INCREF(empty_text);
+    Py_INCREF(Py_None);
+    if (append_token(tokens, make_token((PyTypeObject *) token_class, T_EOF, pos, empty_text, Py_None)) < 0)
+        goto error;
+
+    return tokens;
+
+error:
+    Py_DECREF(tokens);
+    return NULL;
+}
+
+
+/* Module *************************************************************/
+
+static PyMethodDef speedups_methods[] = {
+    {"tokenize", tokenize, METH_VARARGS, tokenize_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+PyDoc_STRVAR(module_doc, "Accelerated EJSON lexer used by mlabutils.ejson.");
+
+static int
+init_constants(void)
+{
+    int i;
+    for (i = 0; i < T_COUNT; i++) {
+        token_types[i] = TEXT_FromString(token_names[i]);
+        if (token_types[i] == NULL)
+            return -1;
+    }
+    empty_tuple = PyTuple_New(0);
+    empty_text = TEXT_FromString("");
+    str_type = TEXT_FromString("type");
+    str_offset = TEXT_FromString("offset");
+    str_text = TEXT_FromString("text");
+    str_value = TEXT_FromString("value");
+    if (empty_tuple == NULL || empty_text == NULL || str_type == NULL
+            || str_offset == NULL || str_text == NULL || str_value == NULL)
+        return -1;
+    return 0;
+}
+
+#if IS_PY3
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "_ejson_speedups",
+    module_doc,
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__ejson_speedups(void)
+{
+    if (init_constants() < 0)
+        return NULL;
+    return PyModule_Create(&speedups_module);
+}
+
+#else
+
+PyMODINIT_FUNC
+init_ejson_speedups(void)
+{
+    if (init_constants() < 0)
+        return;
+    Py_InitModule3("_ejson_speedups", speedups_methods, module_doc);
+}
+
+#endif
@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 """mlabutils.app module.
 
+Modules which take long to import (:mod:`argparse`, :mod:`daemon`,
+:mod:`lockfile` and the config modules) are only imported when they are
+needed, so that command-line tools start quickly.
+
 Author: Jan Milík <milikjan@fit.cvut.cz>
 """
 
@@ -9,18 +13,18 @@ Author: Jan Milík <milikjan@fit.cvut.cz>
 import os
 from os import path
 import sys
-import argparse
 import logging
 
-import lockfile
-import daemon
-
-from mlabutils import config
 from mlabutils.utils import getClassLogger
 
 
 class CLIAppBase(object):
     """Base class for comman-line applications.
+
+    The config file found by :meth:`read_config` is loaded when
+    :attr:`config` is first used, so applications which exit early
+    (like with ``--help``) or don't need the configuration don't pay
+    for it.
     """
 
     def __init__(self, app_name = None):
@@ -28,12 +32,22 @@ class CLIAppBase(object):
         if self.app_name is None:
             self.app_name = self._get_app_name()
 
-        self.arg_parser = argparse.ArgumentParser()
+        self._arg_parser = None
         self.args = None
 
         self.read_user_config = True
         self.read_system_config = True
-        self.config = None
+        self._config = None
+        # Config file to be loaded when the config is first used
+        self._config_file_name = None
+
+        # Opt-in asynchronous logging (see mlabutils.asynclog), with
+        # keyword arguments of mlabutils.asynclog.AsyncHandler
+        self.async_logging = False
+        self.async_logging_options = {}
+        self._async_log_handler = None
+        # Logging sinks used by setup_logging
+        self._logging_config = None
 
         self.logger = getClassLogger(self)
 
@@ -46,6 +60,36 @@ class CLIAppBase(object):
             app_name = "app"
         return app_name
 
+    @property
+    def arg_parser(self):
+        if self._arg_parser is None:
+            import argparse
+            self._arg_parser = argparse.ArgumentParser()
+        return self._arg_parser
+
+    @arg_parser.setter
+    def arg_parser(self, value):
+        self._arg_parser = value
+
+    @property
+    def config(self):
+        """Configuration of the application (loaded on first use).
+        """
+        self._load_deferred_config()
+        return self._config
+
+    @config.setter
+    def config(self, value):
+        self._config = value
+        self._config_file_name = None
+
+    def _load_deferred_config(self):
+        file_name = self._config_file_name
+        if file_name is not None:
+            self._config_file_name = None
+            self.logger.info("Reading config file %s...", file_name)
+            self._config = self.load_config(file_name)
+
     def setup_app(self):
         pass
 
@@ -104,16 +148,94 @@ class CLIAppBase(object):
             self.config = {}
             return False
 
-        self.logger.info("Reading config file %s...", file_name)
-        self.config = config.load_file(file_name)
+        self._config = None
+        # Daemons change the working directory before the config is used
+        self._config_file_name = path.abspath(file_name)
         return True
+
+    def load_config(self, file_name):
+        """Loads and builds configuration from file `file_name`.
+        """
+        from mlabutils import config
+        return config.load_file(file_name)
     
+    def get_logging_config(self):
+        """Returns the list of logging sinks from the ``logging`` section
+        of the configuration (see :mod:`mlabutils.logconfig`), or None.
+
+        If the config file hasn't been loaded yet, only the ``logging``
+        section is read from it, so loading of the configuration stays
+        deferred. Syntax errors are reported on standard error output and
+        None is returned (they are reported again when the configuration
+        is loaded).
+        """
+        file_name = self._config_file_name
+        if file_name is None:
+            if not hasattr(self._config, "get"):
+                return None
+            return self._config.get("logging")
+
+        from mlabutils import ejson
+        try:
+            with open(file_name) as f:
+                sections = ejson.extract(f, [ "logging" ])
+        except ejson.ParseError as e:
+            e.file_name = file_name
+            sys.stderr.write("Can't read logging config: %s\n" % (e, ))
+            return None
+        if not sections:
+            return None
+        return sections[0]
+
     def setup_logging(self):
-        logging.root.handlers = []
-        logging.basicConfig(
-            level = logging.INFO,
-            filename = self.get_default_log_filename(),
-            format = "%(asctime)s   %(process)s  %(name)s  %(levelname)s  %(message)s")
+        """Sets up logging to the sinks of the ``logging`` section of the
+        configuration, or to :meth:`get_default_log_filename` if there are
+        none.
+
+        The sinks are read on the first call, with file names relative to
+        the working directory at that time, and reused afterwards (like
+        when a daemon sets up logging again).
+        """
+        self.shutdown_logging()
+        if self._logging_config is None:
+            sinks = []
+            for sink in self.get_logging_config() or []:
+                # "-" stands for standard error output
+                if sink.get("file_name") not in (None, "-"):
+                    sink = dict(sink, file_name = path.abspath(sink["file_name"]))
+                sinks.append(sink)
+            self._logging_config = sinks
+        sinks = self._logging_config
+
+        self.close_log_handlers()
+        if sinks:
+            from mlabutils import logconfig
+            logconfig.configure(sinks)
+        else:
+            logging.basicConfig(
+                level = logging.INFO,
+                filename = self.get_default_log_filename(),
+                format = "%(asctime)s   %(process)s  %(name)s  %(levelname)s  %(message)s")
+        if self.async_logging:
+            from mlabutils import asynclog
+            self._async_log_handler = asynclog.install(**self.async_logging_options)
+
+    def close_log_handlers(self):
+        """Removes handlers of the root logger and closes them, which writes
+        records they buffer.
+        """
+        for handler in list(logging.root.handlers):
+            logging.root.removeHandler(handler)
+            handler.close()
+
+    def shutdown_logging(self):
+        """Writes log records waiting in the queue of asynchronous logging
+        and stops it (log records are written directly afterwards).
+        """
+        if self._async_log_handler is not None:
+            from mlabutils import asynclog
+            asynclog.uninstall(self._async_log_handler)
+            self._async_log_handler = None
     
     def get_default_log_filename(self):
         #return path.abspath(path.join(os.getenv("HOME"), self.app_name + ".log"))
@@ -139,17 +261,57 @@ class CLIAppBase(object):
 
     def exit(self, exit_code = 0):
         self.logger.info("Exiting with code %d." % (exit_code, ))
+        self.shutdown_logging()
         sys.exit(exit_code)
 
 
 class DaemonAppBase(CLIAppBase):
+    """Base class for daemons.
+
+    The config file is loaded before the daemon starts (which changes the
+    working directory and closes the standard streams).
+
+    If :attr:`watch_config` is set to true (in :meth:`setup_app`), the
+    config file is watched while the daemon runs and when it changes,
+    :meth:`config_changed` is called with the changes.
+    """
+
     def setup_app(self):
-        self.daemon_context = daemon.DaemonContext(
-            pidfile = lockfile.FileLock(self.pid_file_name),
-        )
+        self._daemon_context = None
 
         self.pidfile_locked_exit_code = 2
 
+        self.watch_config = False
+        self.config_reloader = None
+
+    @property
+    def daemon_context(self):
+        if self._daemon_context is None:
+            import daemon
+            import lockfile
+            self._daemon_context = daemon.DaemonContext(
+                pidfile = lockfile.FileLock(self.pid_file_name),
+            )
+        return self._daemon_context
+
+    @daemon_context.setter
+    def daemon_context(self, value):
+        self._daemon_context = value
+
+    def load_config(self, file_name):
+        if not self.watch_config:
+            return CLIAppBase.load_config(self, file_name)
+        from mlabutils import watch
+        self.config_reloader = watch.ConfigReloader(file_name)
+        return self.config_reloader.load()
+
+    def config_changed(self, delta):
+        """Called with a :class:`mlabutils.watch.Delta` when the config
+        file changes (in a thread of the config watcher). Override to apply
+        the new configuration and release the removed objects.
+        """
+        self.config = delta.objects
+
     @property
     def pid_file_name(self):
         return "/var/run/%s.pid" % (self.app_name, )
@@ -162,15 +324,34 @@ class DaemonAppBase(CLIAppBase):
             ))
             return self.pidfile_locked_exit_code
 
+        # The config is loaded before forking, so that errors in it are
+        # still reported on the terminal
+        try:
+            self._load_deferred_config()
+        except Exception as e:
+            sys.stderr.write("Can't load config file: %s\n" % (e, ))
+            raise
+
         self.logger.info("Starting daemon...")
+        # The logging thread doesn't survive forking, and the daemon closes
+        # the files of the handlers
+        self.shutdown_logging()
+        self.close_log_handlers()
         with self.daemon_context:
             self.setup_logging()
             self.logger.info("Daemon started with PID %d.", os.getpid())
+            # The watcher has to be started in the daemon process
+            if self.config_reloader is not None:
+                self.config_reloader.start(self.config_changed)
             try:
                 self.run_daemon()
             except Exception as e:
                 self.logger.exception("Uncaught exception occured in daemon. Daemon will exit.")
                 return self.uncaught_exception_exit_code
+            finally:
+                if self.config_reloader is not None:
+                    self.config_reloader.stop()
+                self.shutdown_logging()
 
         self.logger.info("Daemon started.")
 
@@ -0,0 +1,300 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""mlabutils.asynclog module.
+
+Asynchronous logging: log records are put into a bounded queue and
+written by a background thread in batches, so logging doesn't block
+the threads that log on file writes::
+
+    import logging
+    from mlabutils import asynclog
+
+    logging.basicConfig(filename = "app.log", level = logging.INFO)
+    handler = asynclog.install(max_size = 10000, overflow = asynclog.DROP)
+    ...
+    asynclog.uninstall(handler)
+
+If the queue is full, the `overflow` policy decides what happens to new
+records:
+
+* :data:`DROP` -- the record is dropped,
+* :data:`BLOCK` -- the logging thread waits until there is space,
+* :data:`SAMPLE` -- every `sample_every`-th record is kept (waiting
+  for space), the others are dropped.
+
+Records at `keep_level` (by default :data:`logging.WARNING`) and above
+are never dropped. The number of dropped records is logged by the
+background thread.
+
+"""
+
+
+import copy
+import logging
+import threading
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+try:
+    from logging.handlers import QueueHandler
+except ImportError:
+    # Python 2
+    class QueueHandler(logging.Handler):
+        """Puts log records into `queue` (the subset of
+        :class:`logging.handlers.QueueHandler` of Python 3 used here).
+        """
+
+        def __init__(self, queue):
+            logging.Handler.__init__(self)
+            self.queue = queue
+
+        def enqueue(self, record):
+            self.queue.put_nowait(record)
+
+        def prepare(self, record):
+            return record
+
+        def emit(self, record):
+            try:
+                self.enqueue(self.prepare(record))
+            except Exception:
+                self.handleError(record)
+
+
+DROP = "drop"
+BLOCK = "block"
+SAMPLE = "sample"
+
+# Tells the background thread to stop
+_STOP = object()
+
+_exception_formatter = logging.Formatter()
+
+
+def write_batch(handler, records):
+    """Passes log records `records` to `handler`. Records for plain stream
+    and file handlers are written at once and flushed once per batch.
+    """
+    records = [ record for record in records if record.levelno >= handler.level and handler.filter(record) ]
+    if not records:
+        return
+
+    if type(handler) not in (logging.StreamHandler, logging.FileHandler) or not hasattr(handler, "terminator"):
+        for record in records:
+            handler.handle(record)
+        return
+
+    handler.acquire()
+    try:
+        try:
+            if handler.stream is None:
+                # FileHandler with delay = True
+                handler.stream = handler._open()
+            terminator = handler.terminator
+            handler.stream.write("".join(handler.format(record) + terminator for record in records))
+            handler.flush()
+        except Exception:
+            handler.handleError(records[0])
+    finally:
+        handler.release()
+
+
+class AsyncHandler(QueueHandler):
+    """Handler which passes log records to `handlers` in a background
+    thread.
+
+    Records wait in a queue of at most `max_size` records, which are
+    taken by the thread in batches of up to `batch_size`. See the module
+    documentation for `overflow`, `sample_every` and `keep_level`.
+
+    After :meth:`close`, records are passed to `handlers` directly.
+
+    .. attribute:: dropped
+
+       Number of records dropped so far (updated under the handler lock).
+    """
+
+    def __init__(self, handlers, max_size = 10000, overflow = DROP, sample_every = 100,
+            keep_level = logging.WARNING, batch_size = 256):
+        if overflow not in (DROP, BLOCK, SAMPLE):
+            raise ValueError("Unknown overflow policy %r." % (overflow, ))
+
+        QueueHandler.__init__(self, queue.Queue(max_size))
+        self.handlers = list(handlers)
+        self.overflow = overflow
+        self.sample_every = sample_every
+        self.keep_level = keep_level
+        self.batch_size = batch_size
+
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._overflows = 0
+
+        # Records below the levels of all handlers aren't even queued
+        if self.handlers:
+            self.setLevel(min(handler.level for handler in self.handlers))
+
+        self._thread = threading.Thread(target = self._run, name = "AsyncHandler")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def prepare(self, record):
+        # Merges the arguments and the traceback into the record, so that it
+        # doesn't refer to objects which may change before it's written.
+        # (Unlike in QueueHandler, the record isn't formatted here.)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.overflow == BLOCK or record.levelno >= self.keep_level:
+            self.queue.put(record)
+            return
+
+        try:
+            self.queue.put_nowait(record)
+            return
+        except queue.Full:
+            pass
+
+        # The counters are updated under the handler lock. Handler.handle
+        # already holds it around emit, but enqueue may be called without
+        # it (the lock is reentrant).
+        self.acquire()
+        try:
+            keep = False
+            if self.overflow == SAMPLE:
+                self._overflows += 1
+                keep = self._overflows % self.sample_every == 0
+            if not keep:
+                self.dropped += 1
+        finally:
+            self.release()
+        if keep:
+            self.queue.put(record)
+
+    def emit(self, record):
+        if self._thread is None:
+            for handler in self.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+            return
+        QueueHandler.emit(self, record)
+
+    def flush(self):
+        """Waits until all queued records are written.
+        """
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self.queue.join()
+        for handler in self.handlers:
+            handler.flush()
+
+    def close(self):
+        """Writes all queued records and stops the background thread.
+        """
+        thread = self._thread
+        if thread is not None:
+            self.queue.put(_STOP)
+            thread.join()
+            self._thread = None
+            # Records queued while the thread was stopping
+            records = self._take(None)
+            while records:
+                self._write(records)
+                records = self._take(None)
+            for handler in self.handlers:
+                handler.flush()
+        QueueHandler.close(self)
+
+    def _take(self, first):
+        # Returns a batch of queued records, starting with `first`.
+        records = []
+        if first is not None:
+            records.append(first)
+        while len(records) < self.batch_size:
+            try:
+                records.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _run(self):
+        while True:
+            records = self._take(self.queue.get())
+            count = len(records)
+            stop = _STOP in records
+            if stop:
+                records = [ record for record in records if record is not _STOP ]
+            try:
+                self._write(records)
+            except Exception:
+                # Errors in handlers are reported by the handlers, anything
+                # else mustn't stop the thread
+                if records:
+                    self.handleError(records[0])
+            finally:
+                for i in range(count):
+                    self.queue.task_done()
+            if stop:
+                return
+
+    def _write(self, records):
+        # Reads the counter without the handler lock: a logging thread may
+        # hold it while it waits for space in the queue
+        dropped = self.dropped
+        if dropped != self._reported_dropped:
+            records.append(logging.makeLogRecord({
+                "name": type(self).__name__,
+                "levelno": logging.WARNING,
+                "levelname": logging.getLevelName(logging.WARNING),
+                "msg": "%d log records were dropped because the log queue was full.",
+                "args": (dropped - self._reported_dropped, ),
+            }))
+            self._reported_dropped = dropped
+
+        for handler in self.handlers:
+            write_batch(handler, records)
+
+
+def install(logger = None, **kwargs):
+    """Replaces the handlers of `logger` (the root logger by default) with
+    an :class:`AsyncHandler` passing records to them. `kwargs` are passed
+    to :class:`AsyncHandler`. Returns the handler.
+    """
+    if logger is None:
+        logger = logging.getLogger()
+    handler = AsyncHandler(logger.handlers, **kwargs)
+    for target in handler.handlers:
+        logger.removeHandler(target)
+    logger.addHandler(handler)
+    return handler
+
+
+def uninstall(handler, logger = None):
+    """Writes all records queued in `handler` returned by :func:`install`,
+    stops it and puts the original handlers back to `logger`.
+    """
+    if logger is None:
+        logger = logging.getLogger()
+    handler.close()
+    if handler in logger.handlers:
+        logger.removeHandler(handler)
+        for target in handler.handlers:
+            logger.addHandler(target)
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""This is the binary EJSON module of the :mod:`mlabutils` package.
+
+It stores the same data model as :mod:`mlabutils.ejson` (dictionaries,
+lists, numbers, strings, booleans and null) in a compact binary form, so
+that configuration and data files can be shipped precompiled and loaded
+without parsing::
+
+    import mlabutils.ejson
+    import mlabutils.bejson
+
+    value = mlabutils.ejson.Parser().parse_file("radio-observer.json")
+
+    with open("radio-observer.bejson", "wb") as f:
+        mlabutils.bejson.dump(value, f)
+
+    with open("radio-observer.bejson", "rb") as f:
+        assert mlabutils.bejson.load(f) == value
+
+The encoding starts with the :attr:`MAGIC` bytes, followed by a table of
+all distinct strings (keys and values) and a single encoded value. Every
+value starts with a one-byte tag. Strings are stored as indices into the
+string table, containers are prefixed by their item count. All integers
+in the format are little-endian.
+
+Author: Jan Milík <milikjan@fit.cvut.cz>
+"""
+
+
+import array
+import struct
+
+from mlabutils.ejson import Record
+
+
+MAGIC = b"BEJ\x01"
+
+TAG_NULL = 0
+TAG_TRUE = 1
+TAG_FALSE = 2
+TAG_INT = 3
+TAG_BIG_INT = 4
+TAG_FLOAT = 5
+TAG_STRING = 6
+TAG_LIST = 7
+TAG_DICT = 8
+
+_U32 = struct.Struct("<I")
+_TAG_U32 = struct.Struct("<BI")
+_TAG_I64 = struct.Struct("<Bq")
+_TAG_F64 = struct.Struct("<Bd")
+_I64 = struct.Struct("<q")
+_F64 = struct.Struct("<d")
+
+_MIN_I64 = -(1 << 63)
+_MAX_I64 = (1 << 63) - 1
+
+
+if str is bytes:
+    # Python 2
+    _INTEGER_TYPES = (int, long, )
+    _STRING_TYPES = (str, unicode, )
+
+    def _encode_string(value):
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        return value
+
+    def _decode_string(data):
+        return str(data)
+else:
+    _INTEGER_TYPES = (int, )
+    _STRING_TYPES = (str, )
+
+    def _encode_string(value):
+        return value.encode("utf-8")
+
+    def _decode_string(data):
+        return data.decode("utf-8")
+
+
+class Encoder(object):
+    """Encodes values into the binary EJSON format.
+    """
+
+    def __init__(self):
+        self._strings = {}
+        self._parts = []
+
+    def encode(self, value):
+        """Returns `value` encoded as bytes.
+        """
+        self._strings = {}
+        self._parts = []
+        self._encode(value)
+
+        table = [None] * len(self._strings)
+        for string, index in self._strings.items():
+            table[index] = string
+
+        header = [MAGIC, _U32.pack(len(table))]
+        for string in table:
+            data = _encode_string(string)
+            header.append(_U32.pack(len(data)))
+            header.append(data)
+
+        result = b"".join(header + self._parts)
+        self._strings = {}
+        self._parts = []
+        return result
+
+    def _encode(self, value):
+        append = self._parts.append
+
+        if value is None:
+            append(b"\x00")
+        elif value is True:
+            append(b"\x01")
+        elif value is False:
+            append(b"\x02")
+        elif isinstance(value, _STRING_TYPES):
+            index = self._strings.setdefault(value, len(self._strings))
+            append(_TAG_U32.pack(TAG_STRING, index))
+        elif isinstance(value, _INTEGER_TYPES):
+            if _MIN_I64 <= value <= _MAX_I64:
+                append(_TAG_I64.pack(TAG_INT, value))
+            else:
+                data = str(value).encode("ascii")
+                append(_TAG_U32.pack(TAG_BIG_INT, len(data)))
+                append(data)
+        elif isinstance(value, float):
+            append(_TAG_F64.pack(TAG_FLOAT, value))
+        elif isinstance(value, (dict, Record)):
+            append(_TAG_U32.pack(TAG_DICT, len(value)))
+            for key, item in value.items():
+                self._encode(key)
+                self._encode(item)
+        elif isinstance(value, (list, tuple, array.array)):
+            append(_TAG_U32.pack(TAG_LIST, len(value)))
+            for item in value:
+                self._encode(item)
+        else:
+            raise TypeError("Value of type %s can't be encoded: %r." % (
+                type(value).__name__,
+                value,
+            ))
+
+
+class Decoder(object):
+    """Decodes values from the binary EJSON format.
+    """
+
+    def decode(self, data):
+        """Returns the value encoded in bytes-like object `data`.
+        """
+        data = bytearray(data)
+
+        if data[:len(MAGIC)] != bytearray(MAGIC):
+            raise ValueError("Not a binary EJSON document.")
+        pos = len(MAGIC)
+
+        count, = _U32.unpack_from(data, pos)
+        pos += 4
+        strings = []
+        for i in range(count):
+            length, = _U32.unpack_from(data, pos)
+            pos += 4
+            strings.append(_decode_string(data[pos:pos + length]))
+            pos += length
+
+        self._data = data
+        self._strings = strings
+        try:
+            value, pos = self._decode(pos)
+        finally:
+            self._data = None
+            self._strings = None
+
+        if pos != len(data):
+            raise ValueError("Trailing data after binary EJSON value.")
+        return value
+
+    def _decode(self, pos):
+        data = self._data
+        tag = data[pos]
+
+        if tag == TAG_STRING:
+            return self._strings[_U32.unpack_from(data, pos + 1)[0]], pos + 5
+        if tag == TAG_INT:
+            return _I64.unpack_from(data, pos + 1)[0], pos + 9
+        if tag == TAG_DICT:
+            count, = _U32.unpack_from(data, pos + 1)
+            pos += 5
+            result = {}
+            decode = self._decode
+            for i in range(count):
+                key, pos = decode(pos)
+                result[key], pos = decode(pos)
+            return result, pos
+        if tag == TAG_LIST:
+            count, = _U32.unpack_from(data, pos + 1)
+            pos += 5
+            result = [None] * count
+            decode = self._decode
+            for i in range(count):
+                result[i], pos = decode(pos)
+            return result, pos
+        if tag == TAG_FLOAT:
+            return _F64.unpack_from(data, pos + 1)[0], pos + 9
+        if tag == TAG_NULL:
+            return None, pos + 1
+        if tag == TAG_TRUE:
+            return True, pos + 1
+        if tag == TAG_FALSE:
+            return False, pos + 1
+        if tag == TAG_BIG_INT:
+            length, = _U32.unpack_from(data, pos + 1)
+            pos += 5
+            return int(data[pos:pos + length].decode("ascii")), pos + length
+
+        raise ValueError("Unknown tag %d at offset %d." % (tag, pos, ))
+
+
+def dumps(value):
+    """Returns `value` encoded in the binary EJSON format.
+    """
+    return Encoder().encode(value)
+
+
+def loads(data):
+    """Decodes a value from bytes-like object `data`.
+    """
+    return Decoder().decode(data)
+
+
+def dump(value, f):
+    """Writes `value` in the binary EJSON format to binary file object `f`.
+    """
+    f.write(dumps(value))
+
+
+def load(f):
+    """Reads a value in the binary EJSON format from binary file object `f`.
+    """
+    return loads(f.read())
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,10 +6,28 @@
 
     Default :class:`Builder` instance used by some of the functions in this module.
 
+.. attribute:: DEFAULT_CACHE
+
+    Default :class:`ParseCache` instance used by :func:`load_file`. Set it
+    to `None` to disable caching of parsed config files.
+
 """
 
 
+import array
+import collections
+import copy
+import hashlib
+import importlib
 import logging
+import os
+import tempfile
+import threading
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 
 from mlabutils import ejson
 from mlabutils.utils import obj_repr, getClassLogger
@@ -19,56 +37,743 @@ class Builder(object):
     """Builder processes a data structure made of various python data types
     (lists, dictionaries, integers, strings, etc.), possibly loaded from
     a config file, and uses it instantiate application objects.
+
+    The factory of a dictionary is named by the first of
+    :attr:`FACTORY_KEYS` present in it.
+
+    If `lazy` is true, dictionaries with a factory are built into
+    :class:`LazyObject` proxies and their factories are only called when
+    the objects are first used, so parts of the configuration which are
+    never used (such as configurations other than the selected one) cost
+    almost nothing.
+
+    If `workers` is set, objects are created by a pool of `workers`
+    threads, so that factories which do slow I/O run at the same time.
+    An object is created once the objects in its configuration are
+    created and, if its configuration has a `depends_on` key (a key or
+    list of keys), once the sibling objects (items of the same list or
+    dictionary) with those keys in their `key` field are created. The
+    result has the same structure as in the serial mode. Without
+    :mod:`concurrent.futures` the objects are created one by one in the
+    same order. Lazy builders ignore `workers`.
+
+    If `use_cache` is true, objects are built only once for each distinct
+    combination of factory name and configuration (compared by value),
+    and the same instance is returned every time the same configuration
+    appears again, such as for shared backends. If `clone` is set (for
+    example to :func:`copy.copy` or :func:`copy.deepcopy`), it is applied
+    to the cached instance instead, so every occurrence gets its own
+    object without calling the factory again (with `lazy`, every copy of
+    a proxy calls the factory for itself when it's used).
+
+    Factories may be registered lazily, by a dotted path or by a
+    ``setuptools`` entry point (see :meth:`add_factory` and
+    :meth:`add_entry_points`). The module of such a factory is only
+    imported when its name first appears in a configuration, and the
+    imported factory is kept in :attr:`factories` from then on.
+
+    .. attribute:: factories
+
+       Dictionary of factories by name (only those already imported,
+       for factories registered lazily).
+
+    .. attribute:: cache_hits
+
+       Number of objects taken from the build cache.
+
+    .. attribute:: cache_misses
+
+       Number of objects built by factories while the cache was enabled.
     """
 
     FACTORY_KEYS = ("type", "factory", )
 
-    def __init__(self):
+    ENTRY_POINT_GROUP = "mlabutils.factories"
+
+    # Lists and dictionaries nested deeper than this are processed with an
+    # explicit stack instead of recursion, so there is no limit on nesting
+    MAX_RECURSION_DEPTH = 100
+
+    def __init__(self, use_cache = False, clone = None, lazy = False, workers = None):
         self.factories = {}
+        # Factories registered lazily and not imported yet, by name
+        # (dotted paths or entry points)
+        self._pending_factories = {}
+        self._factory_lock = threading.Lock()
+        self.use_cache = use_cache
+        self.lazy = lazy
+        self.workers = workers
+        self.clone = clone
+
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # Built objects, keyed by (factory name, node id)
+        self._cache = {}
+        # Ids of distinct config subtrees, so that a subtree is hashed
+        # as a flat structure of the ids of its children.
+        self._nodes = {}
+        # Incremented whenever node ids are forgotten
+        self._generation = 0
 
         self.logger = getClassLogger(self)
 
     def add_factory(self, name, factory):
-        self.factories[str(name)] = factory
+        """Registers `factory` under `name`.
+
+        `factory` may also be a dotted path of the factory, such as
+        ``"package.module.Class"`` or ``"package.module:Class"``, in which
+        case its module is imported only when `name` first appears in
+        a configuration.
+        """
+        name = str(name)
+        if isinstance(factory, ejson.TEXT_TYPES):
+            self._pending_factories[name] = factory
+            self.factories.pop(name, None)
+        else:
+            self.factories[name] = factory
+            self._pending_factories.pop(name, None)
+        self.clear_cache()
         return factory
 
+    def add_entry_points(self, group = None):
+        """Registers lazily the factories of all entry points in `group`
+        (:attr:`ENTRY_POINT_GROUP` by default) under the entry point
+        names. Returns the registered names.
+
+        An entry point is loaded only when its name first appears in
+        a configuration.
+        """
+        if group is None:
+            group = self.ENTRY_POINT_GROUP
+        names = []
+        for entry_point in _iter_entry_points(group):
+            name = str(entry_point.name)
+            self._pending_factories[name] = entry_point
+            self.factories.pop(name, None)
+            names.append(name)
+        if names:
+            self.clear_cache()
+        return names
+
+    def get_factory(self, name):
+        """Returns the factory registered under `name` (importing it, if
+        it was registered lazily), or None.
+        """
+        factory = self.factories.get(name, None)
+        if factory is not None or name not in self._pending_factories:
+            return factory
+
+        with self._factory_lock:
+            # Another thread may have imported it meanwhile
+            factory = self.factories.get(name, None)
+            if factory is None:
+                factory = _load_factory(self._pending_factories[name])
+                self.factories[name] = factory
+                del self._pending_factories[name]
+        return factory
+
+    def clear_cache(self):
+        """Forgets all objects in the build cache.
+        """
+        self._cache.clear()
+        self._nodes.clear()
+        self._generation += 1
+
     def build(self, config):
         """Builds application objects from configuration data.
         """
+        if self.workers is not None and not self.lazy:
+            return self._build_concurrent(config)
+        return self._build(config)[0]
 
-        if isinstance(config, list):
-            result = []
+    def rebuild(self, config, previous = None):
+        """Builds application objects from configuration data like
+        :meth:`build`, but reuses the objects of `previous`, the
+        :class:`BuildRecord` returned by an earlier call, whose factory name
+        and configuration (compared by value) didn't change. Every previous
+        object is reused at most once.
+
+        Returns a :class:`BuildRecord` of the build. Objects are created
+        one by one, without the build cache.
+        """
+        record = BuildRecord()
+        reusable = {}
+        if previous is not None:
+            if previous._generation == self._generation:
+                for cache_key, instances in previous._instances.items():
+                    reusable[cache_key] = list(instances)
+            else:
+                # Node ids of the previous build are no longer valid
+                reusable[None] = previous.created + previous.reused
+
+        def make_object(factory_name, config, node_id):
+            cache_key = (factory_name, node_id)
+            instances = reusable.get(cache_key)
+            if node_id is not None and instances:
+                instance = instances.pop()
+                record.reused.append(instance)
+            else:
+                instance = self._create(factory_name, config)
+                record.created.append(instance)
+            if node_id is not None:
+                record._instances.setdefault(cache_key, []).append(instance)
+            return instance
+
+        record.result = self._walk(config, make_object, use_nodes = True)[0]
+        record._generation = self._generation
+        for instances in reusable.values():
+            record.removed.extend(instances)
+        return record
+
+    def _build(self, config):
+        # Returns the built object and the node id of the config (None if
+        # the cache is disabled or the config isn't hashable).
+        return self._walk(config, self._make_object)
+
+    def _make_object(self, factory_name, config, node_id):
+        if node_id is None:
+            return self._create(factory_name, config)
+
+        cache_key = (factory_name, node_id)
+        if cache_key in self._cache:
+            self.cache_hits += 1
+            instance = self._cache[cache_key]
+        else:
+            self.cache_misses += 1
+            instance = self._cache[cache_key] = self._create(factory_name, config)
+        if self.clone is not None:
+            instance = self.clone(instance)
+        return instance
 
+    def _walk(self, config, make_object, link_siblings = None, use_nodes = False):
+        # Processes the config children first and returns the result and
+        # node id of the config. Dictionaries with a factory name are
+        # turned into objects by `make_object`. `link_siblings` is called
+        # with the processed items of every list and dictionary. Node ids
+        # are only computed if the cache is enabled or `use_nodes` is true.
+        use_cache = self.use_cache or use_nodes
+        if not isinstance(config, _CONTAINER_TYPES):
+            if use_cache:
+                return config, self._get_value_node(config)
+            return config, None
+        return self._walk_container(config, make_object, link_siblings, use_cache, 1)
+
+    def _walk_container(self, config, make_object, link_siblings, use_cache, depth):
+        # Processes a list or dictionary recursively, which is fastest for
+        # usual configs; those nested deeper than MAX_RECURSION_DEPTH are
+        # processed by _walk_deep.
+        scalar_types = _SCALAR_TYPES
+        container_types = _CONTAINER_TYPES
+        node_ids = [] if use_cache else None
+        node_id = None
+
+        if isinstance(config, (list, array.array)):
+            result = []
             for item in config:
-                result.append(self.build(item))
-
-            return result
-
-        if isinstance(config, dict):
-            # Create new dictionary with processed values
-            new_dict = {}
-            for key, value in config.iteritems():
-                new_dict[key] = self.build(value)
-
-            # Get factory name
-            factory_name = None
-            for factory_name_key in self.FACTORY_KEYS:
-                factory_name = config.get(factory_name_key, None)
-            # If the dict doesn't have a factory name,
-            # just return the dict itself.
+                if type(item) not in scalar_types and isinstance(item, container_types):
+                    if depth >= self.MAX_RECURSION_DEPTH:
+                        item, node_id = self._walk_deep(item, make_object, link_siblings, use_cache)
+                    else:
+                        item, node_id = self._walk_container(item, make_object, link_siblings, use_cache, depth + 1)
+                elif node_ids is not None:
+                    node_id = self._get_value_node(item)
+                result.append(item)
+                if node_ids is not None:
+                    node_ids.append(node_id)
+        else:
+            result = {}
+            for key, item in config.items():
+                if type(item) not in scalar_types and isinstance(item, container_types):
+                    if depth >= self.MAX_RECURSION_DEPTH:
+                        item, node_id = self._walk_deep(item, make_object, link_siblings, use_cache)
+                    else:
+                        item, node_id = self._walk_container(item, make_object, link_siblings, use_cache, depth + 1)
+                elif node_ids is not None:
+                    node_id = self._get_value_node(item)
+                result[key] = item
+                if node_ids is not None:
+                    node_ids.append((key, node_id))
+
+        return self._end_container(config, result, node_ids, make_object, link_siblings)
+
+    def _end_container(self, config, result, node_ids, make_object, link_siblings):
+        # Returns the result and node id of a processed list or dictionary.
+        if link_siblings is not None:
+            link_siblings(result if type(result) is list else list(result.values()))
+
+        node_id = None
+        if type(result) is list:
+            if node_ids is not None and None not in node_ids:
+                node_id = self._get_node(("list", tuple(node_ids)))
+            return result, node_id
+
+        if node_ids is not None and not any(item_id is None for key, item_id in node_ids):
+            node_id = self._get_node(frozenset(node_ids))
+
+        factory_name = self._get_factory_name(config)
+        # If the dict doesn't have a factory name,
+        # just return the dict itself.
+        if factory_name is not None:
+            result = make_object(factory_name, result, node_id)
+        return result, node_id
+
+    def _walk_deep(self, config, make_object, link_siblings, use_cache):
+        # Like _walk_container, but nested lists and dictionaries are kept
+        # on an explicit stack, so there's no limit on their depth. A stack
+        # entry is [config, iterator of its items, result, node ids of the
+        # items (None if not computed), key of the nested item being
+        # processed].
+        scalar_types = _SCALAR_TYPES
+        container_types = _CONTAINER_TYPES
+        value = config
+        stack = []
+
+        while True:
+            # Open a list or a dictionary
+            node_ids = [] if use_cache else None
+            if isinstance(value, (list, array.array)):
+                entry = [value, iter(value), [], node_ids, None]
+            else:
+                entry = [value, iter(value.items()), {}, node_ids, None]
+            stack.append(entry)
+
+            # Process items of the innermost config until a nested list or
+            # dictionary is found
+            while True:
+                result = entry[2]
+                node_ids = entry[3]
+                value = _END
+
+                if type(result) is list:
+                    for item in entry[1]:
+                        if type(item) not in scalar_types and isinstance(item, container_types):
+                            value = item
+                            break
+                        result.append(item)
+                        if node_ids is not None:
+                            node_ids.append(self._get_value_node(item))
+                else:
+                    for key, item in entry[1]:
+                        if type(item) not in scalar_types and isinstance(item, container_types):
+                            entry[4] = key
+                            value = item
+                            break
+                        result[key] = item
+                        if node_ids is not None:
+                            node_ids.append((key, self._get_value_node(item)))
+
+                if value is not _END:
+                    break
+
+                # All items are processed
+                stack.pop()
+                result, node_id = self._end_container(entry[0], result, node_ids, make_object, link_siblings)
+                if not stack:
+                    return result, node_id
+
+                # Add the result to the enclosing config
+                entry = stack[-1]
+                if type(entry[2]) is list:
+                    entry[2].append(result)
+                    if entry[3] is not None:
+                        entry[3].append(node_id)
+                else:
+                    entry[2][entry[4]] = result
+                    if entry[3] is not None:
+                        entry[3].append((entry[4], node_id))
+
+    def _build_concurrent(self, config):
+        nodes = []
+        template = self._plan(config, nodes, {})[0]
+
+        try:
+            import concurrent.futures as futures
+        except ImportError:
+            futures = None
+
+        ready = self._link(nodes)
+        if futures is None:
+            queue = collections.deque(ready)
+            while queue:
+                node = queue.popleft()
+                result = self._call_factory(node.factory_name, self._fill(node.config))
+                self._finish(node, result, queue.append)
+        else:
+            with futures.ThreadPoolExecutor(max_workers = self.workers) as executor:
+                running = {}
+
+                def submit(node):
+                    future = executor.submit(self._call_factory, node.factory_name, self._fill(node.config))
+                    running[future] = node
+
+                try:
+                    for node in ready:
+                        submit(node)
+                    while running:
+                        done, pending = futures.wait(running, return_when = futures.FIRST_COMPLETED)
+                        for future in done:
+                            self._finish(running.pop(future), future.result(), submit)
+                finally:
+                    # Don't start anything else after an error.
+                    for future in running:
+                        future.cancel()
+
+        waiting = [node for node in nodes if not node.done]
+        if waiting:
+            raise ValueError("Dependency cycle among objects: %s." % (
+                ", ".join(repr(node.config.get("key", node.factory_name)) for node in waiting),
+            ))
+        return self._fill(template)
+
+    def _plan(self, config, nodes, planned):
+        # Like _build, but instead of objects returns _BuildNode instances
+        # (appended to `nodes` children first) to be built later.
+        def make_node(factory_name, template, node_id):
+            return self._make_node(factory_name, template, node_id, nodes, planned)
+        return self._walk(config, make_node, self._link_siblings)
+
+    def _make_node(self, factory_name, template, node_id, nodes, planned):
+        cache_key = None
+        if node_id is not None:
+            cache_key = (factory_name, node_id)
+            node = planned.get(cache_key)
+            if node is None and cache_key in self._cache:
+                node = planned[cache_key] = _BuildNode(factory_name, template, cache_key)
+                node.result = self._cache[cache_key]
+                node.done = True
+            if node is not None:
+                self.cache_hits += 1
+                return node
+            self.cache_misses += 1
+
+        node = _BuildNode(factory_name, template, cache_key)
+        node.dependencies = self._find_nodes(template)
+        if cache_key is not None:
+            planned[cache_key] = node
+        nodes.append(node)
+        return node
+
+    def _find_nodes(self, template):
+        # Returns the nodes in a template (but not inside other nodes).
+        found = []
+        stack = [template]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, _BuildNode):
+                found.append(value)
+            elif isinstance(value, list):
+                stack.extend(value)
+            elif isinstance(value, dict):
+                stack.extend(value.values())
+        return found
+
+    def _link_siblings(self, items):
+        # Cached siblings can't depend on anything any more, but other
+        # siblings can still depend on them
+        nodes = [item for item in items if isinstance(item, _BuildNode)]
+        by_key = dict((node.config.get("key"), node) for node in nodes)
+
+        for node in nodes:
+            if node.done:
+                continue
+            names = node.config.get("depends_on")
+            if names is None:
+                continue
+            if isinstance(names, ejson.TEXT_TYPES):
+                names = [names]
+            for name in names:
+                dependency = by_key.get(name)
+                if dependency is None:
+                    raise ValueError("Object %r depends on unknown object %r." % (
+                        node.config.get("key", node.factory_name),
+                        name,
+                    ))
+                node.dependencies.append(dependency)
+
+    def _link(self, nodes):
+        # Returns the nodes which can be built right away.
+        ready = []
+        for node in nodes:
+            node.waiting = 0
+            for dependency in set(node.dependencies):
+                if not dependency.done:
+                    dependency.dependents.append(node)
+                    node.waiting += 1
+            if node.waiting == 0:
+                ready.append(node)
+        return ready
+
+    def _finish(self, node, result, submit):
+        node.result = result
+        node.done = True
+        if node.cache_key is not None:
+            self._cache[node.cache_key] = result
+
+        for dependent in node.dependents:
+            dependent.waiting -= 1
+            if dependent.waiting == 0:
+                submit(dependent)
+
+    def _fill(self, template):
+        # Replaces nodes in a template with the built objects.
+        result = [None]
+        stack = [([template], result)]
+        while stack:
+            source, target = stack.pop()
+            if type(source) is list:
+                items = enumerate(source)
+            else:
+                items = source.items()
+
+            for key, value in items:
+                if isinstance(value, _BuildNode):
+                    if value.cache_key is not None and self.clone is not None:
+                        value = self.clone(value.result)
+                    else:
+                        value = value.result
+                elif type(value) is list:
+                    stack.append((value, [None] * len(value)))
+                    value = stack[-1][1]
+                elif type(value) is dict:
+                    stack.append((value, {}))
+                    value = stack[-1][1]
+                target[key] = value
+        return result[0]
+
+    def _get_node(self, structure):
+        return self._nodes.setdefault(structure, len(self._nodes))
+
+    def _get_value_node(self, value):
+        # Returns the node id of a scalar value (None if it isn't hashable).
+        try:
+            # The type distinguishes values like 1, 1.0 and True.
+            return self._get_node((type(value), value))
+        except TypeError:
+            return None
+
+    def _get_factory_name(self, config):
+        factory_name = None
+        factory_name_key = None
+        for key in self.FACTORY_KEYS:
+            value = config.get(key, None)
+            if value is None:
+                continue
             if factory_name is None:
-                return new_dict
+                factory_name = value
+                factory_name_key = key
+            elif value != factory_name:
+                self.logger.warning(
+                    "Config has both %s %r and %s %r, using %r.",
+                    factory_name_key, factory_name, key, value, factory_name)
+        return factory_name
 
-            # Get the factory itself
-            factory = self.factories.get(factory_name, None)
-            if factory is None:
+    def _create(self, factory_name, config):
+        if self.lazy:
+            return LazyObject(self, factory_name, config)
+        return self._call_factory(factory_name, config)
 
+    def _call_factory(self, factory_name, config):
+        # Get the factory itself (imported factories are looked up
+        # directly, the rest only once)
+        factory = self.factories.get(factory_name, None)
+        if factory is None:
+            factory = self.get_factory(factory_name)
+            if factory is None:
                 factory = FactoryDummy(factory_name)
 
-            # Create the instance using the selected factory
-            return factory(new_dict)
+        # Create the instance using the selected factory
+        return factory(config)
+
+
+def _load_factory(source):
+    # Imports a factory registered by a dotted path or an entry point.
+    if not isinstance(source, ejson.TEXT_TYPES):
+        return source.load()
+
+    if ":" in source:
+        module_name, attributes = source.split(":", 1)
+    else:
+        module_name, _, attributes = source.rpartition(".")
+    if not module_name or not attributes:
+        raise ValueError("Invalid factory path %r." % (source, ))
+
+    factory = importlib.import_module(module_name)
+    for attribute in attributes.split("."):
+        factory = getattr(factory, attribute)
+    return factory
+
+
+def _iter_entry_points(group):
+    # Returns the entry points in `group`, or nothing if neither
+    # importlib.metadata nor pkg_resources is available.
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata is not None:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            return entry_points.select(group = group)
+        return entry_points.get(group, ())
+
+    try:
+        import pkg_resources
+    except ImportError:
+        return ()
+    return pkg_resources.iter_entry_points(group)
+
+
+class BuildRecord(object):
+    """Result of :meth:`Builder.rebuild`.
+
+    .. attribute:: result
 
-        return config
+       The built objects.
+
+    .. attribute:: created
+
+       List of objects created by factories.
+
+    .. attribute:: reused
+
+       List of objects taken from the previous build.
+
+    .. attribute:: removed
+
+       List of objects of the previous build which weren't reused (and
+       are no longer part of the result).
+    """
+
+    def __init__(self):
+        self.result = None
+        self.created = []
+        self.reused = []
+        self.removed = []
+
+        # Created and reused objects, keyed by (factory name, node id)
+        self._instances = {}
+        self._generation = None
+
+
+class _BuildNode(object):
+    """Object to be created by a concurrent :class:`Builder`.
+    """
+
+    __slots__ = (
+        "factory_name", "config", "cache_key", "dependencies", "dependents",
+        "waiting", "result", "done",
+    )
+
+    def __init__(self, factory_name, config, cache_key):
+        self.factory_name = factory_name
+        self.config = config
+        self.cache_key = cache_key
+        self.dependencies = []
+        self.dependents = []
+        self.waiting = 0
+        self.result = None
+        self.done = False
+
+
+_UNRESOLVED = object()
+
+# End of items of a config in Builder._walk_deep
+_END = object()
+
+# Configs processed item by item in Builder._walk
+_CONTAINER_TYPES = (list, array.array, dict, ejson.Record, )
+
+# Types of list item keys matched by diff()
+_KEY_TYPES = ejson.TEXT_TYPES + (int, )
+
+# Types of parsed values that are never containers, checked before the
+# (slower) isinstance test
+_SCALAR_TYPES = frozenset(ejson.TEXT_TYPES + (int, float, bool, type(None), ))
+
+
+class LazyObject(object):
+    """Proxy of an application object built by a lazy :class:`Builder`.
+
+    The object is created by its factory when it's first used: when any
+    of its attributes or items is accessed, when it's called or iterated,
+    or explicitly by :meth:`resolve`. After that, all of these operations
+    are forwarded to the object.
+
+    The factory name and the (built) configuration of the object are
+    available without resolving it as `_factory_name` and `_config`.
+    """
+
+    __slots__ = ("_builder", "_factory_name", "_config", "_instance", )
+
+    def __init__(self, builder, factory_name, config):
+        object.__setattr__(self, "_builder", builder)
+        object.__setattr__(self, "_factory_name", factory_name)
+        object.__setattr__(self, "_config", config)
+        object.__setattr__(self, "_instance", _UNRESOLVED)
+
+    def resolve(self):
+        """Returns the object, creating it if it doesn't exist yet.
+        """
+        instance = self._instance
+        if instance is _UNRESOLVED:
+            instance = self._builder._call_factory(self._factory_name, self._config)
+            object.__setattr__(self, "_instance", instance)
+        return instance
+
+    def is_resolved(self):
+        return self._instance is not _UNRESOLVED
+
+    def __getattr__(self, name):
+        # Don't create the object for special method lookups (such as by
+        # copy or pickle) or for slots which aren't set yet.
+        if (name.startswith("__") and name.endswith("__")) or name in LazyObject.__slots__:
+            raise AttributeError(name)
+        return getattr(self.resolve(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self.resolve(), name, value)
+
+    def __delattr__(self, name):
+        delattr(self.resolve(), name)
+
+    def __getitem__(self, key):
+        return self.resolve()[key]
+
+    def __setitem__(self, key, value):
+        self.resolve()[key] = value
+
+    def __delitem__(self, key):
+        del self.resolve()[key]
+
+    def __contains__(self, item):
+        return item in self.resolve()
+
+    def __iter__(self):
+        return iter(self.resolve())
+
+    def __len__(self):
+        return len(self.resolve())
+
+    def __bool__(self):
+        return bool(self.resolve())
+
+    __nonzero__ = __bool__
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __copy__(self):
+        return LazyObject(self._builder, self._factory_name, self._config)
+
+    def __deepcopy__(self, memo):
+        return LazyObject(self._builder, self._factory_name, copy.deepcopy(self._config, memo))
+
+    def __repr__(self):
+        if self._instance is _UNRESOLVED:
+            return obj_repr(self, self._factory_name, self._config)
+        return repr(self._instance)
 
 
 class FactoryDummy(object):
@@ -104,27 +809,350 @@ class DummyObject(object):
         printer.write(")")
 
 
+class ParseCache(object):
+    """Cache of parsed EJSON files.
+
+    Parsed trees are kept pickled in memory (at most `max_entries` of them,
+    least recently used entries are evicted first) and, if `cache_dir` is
+    set, also on disk, so they survive between processes.
+
+    An entry is valid as long as the path, modification time and size of
+    the file are the same. If `use_hash` is true, the SHA-1 hash of the
+    file contents must match as well, which catches changes that keep both
+    the size and the modification time, at the price of reading the file.
+
+    .. attribute:: hits
+
+       Number of files loaded from the cache.
+
+    .. attribute:: misses
+
+       Number of files which had to be parsed.
+    """
+
+    VERSION = 1
+
+    def __init__(self, max_entries = 64, cache_dir = None, use_hash = False):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        self.use_hash = use_hash
+
+        self.hits = 0
+        self.misses = 0
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.logger = getClassLogger(self)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def parse_file(self, file_name):
+        """Returns the parsed contents of EJSON file `file_name` (see
+        :meth:`mlabutils.ejson.Parser.parse_file`). Each call returns
+        a fresh copy of the tree, so callers are free to modify it.
+        """
+        file_name = os.path.abspath(file_name)
+        key = self._get_key(file_name)
+
+        with self._lock:
+            entry = self._entries.pop(file_name, None)
+            if entry is not None and entry[0] == key:
+                self._entries[file_name] = entry
+                self.hits += 1
+                return pickle.loads(entry[1])
+
+        data = self._read_disk_entry(file_name, key)
+        if data is None:
+            value = ejson.Parser().parse_file(file_name)
+            if isinstance(value, ejson.ParseError):
+                return value
+            with self._lock:
+                self.misses += 1
+            try:
+                data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except RuntimeError:
+                # Pickling is recursive, too deep trees aren't cached
+                # (RecursionError is a RuntimeError)
+                self.logger.debug("Not caching %s, it is nested too deep.", file_name)
+                return value
+            self._write_disk_entry(file_name, key, data)
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._entries[file_name] = (key, data)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last = False)
+
+        return pickle.loads(data)
+
+    def _get_key(self, file_name):
+        stat = os.stat(file_name)
+        key = (stat.st_mtime, stat.st_size, )
+        if self.use_hash:
+            with open(file_name, "rb") as f:
+                key += (hashlib.sha1(f.read()).hexdigest(), )
+        return key
+
+    def _get_disk_file_name(self, file_name):
+        digest = hashlib.sha1(file_name.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest + ".pickle")
+
+    def _read_disk_entry(self, file_name, key):
+        if self.cache_dir is None:
+            return None
+
+        try:
+            with open(self._get_disk_file_name(file_name), "rb") as f:
+                version, cached_file_name, cached_key, data = pickle.load(f)
+            if (version, cached_file_name, cached_key) != (self.VERSION, file_name, key):
+                return None
+            return data
+        except Exception:
+            # Missing or corrupted entry
+            return None
+
+    def _write_disk_entry(self, file_name, key, data):
+        if self.cache_dir is None:
+            return
+
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            fd, temp_name = tempfile.mkstemp(dir = self.cache_dir)
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump((self.VERSION, file_name, key, data), f, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp_name, self._get_disk_file_name(file_name))
+        except (IOError, OSError):
+            self.logger.warning("Failed to write cache entry for %s.", file_name, exc_info = True)
+
+
 DEFAULT_BUILDER = Builder()
 
+DEFAULT_CACHE = ParseCache()
+
 
 def add_factory(name, factory):
     return DEFAULT_BUILDER.add_factory(name, factory)
 
 
+def add_entry_points(group = None):
+    return DEFAULT_BUILDER.add_entry_points(group)
+
+
 def build(config):
     return DEFAULT_BUILDER.build(config)
 
 
-def load_file(file_name):
+def load_file(file_name, use_cache = True):
     """Loads and builds configuration from a EJSON file
     using :class:`mlabutils.ejson.Parser` parser and
     :attr:`DEFAULT_BUILDER` builder.
+
+    Unless `use_cache` is false, the parsed file is looked up in
+    :attr:`DEFAULT_CACHE` first.
     """
-    parser = ejson.Parser()
-    config = parser.parse_file(file_name)
+    if use_cache and DEFAULT_CACHE is not None:
+        config = DEFAULT_CACHE.parse_file(file_name)
+    else:
+        parser = ejson.Parser()
+        config = parser.parse_file(file_name)
     return build(config)
 
 
+def _get_node_ids(value, nodes):
+    # Returns ids of all lists and dictionaries in `value` keyed by their
+    # id(). Equal subtrees (with equal types of scalar values) get equal
+    # ids, as long as the same `nodes` dictionary is used.
+    ids = {}
+    stack = []
+    if isinstance(value, _CONTAINER_TYPES):
+        stack.append((value, False))
+    while stack:
+        value, children_done = stack.pop()
+        if id(value) in ids:
+            continue
+
+        if not children_done:
+            stack.append((value, True))
+            if isinstance(value, (dict, ejson.Record)):
+                items = value.values()
+            elif isinstance(value, list):
+                items = value
+            else:
+                # Arrays contain only numbers
+                items = ()
+            for item in items:
+                if isinstance(item, _CONTAINER_TYPES):
+                    stack.append((item, False))
+            continue
+
+        if isinstance(value, (list, array.array)):
+            structure = ("list", tuple(_get_node_id(item, ids, nodes) for item in value))
+        else:
+            structure = frozenset((key, _get_node_id(item, ids, nodes)) for key, item in value.items())
+        ids[id(value)] = nodes.setdefault(structure, len(nodes))
+    return ids
+
+
+def _get_node_id(value, ids, nodes):
+    if isinstance(value, _CONTAINER_TYPES):
+        return ids[id(value)]
+    # The type distinguishes values like 1, 1.0 and True.
+    return nodes.setdefault((type(value), value), len(nodes))
+
+
+def _get_item_keys(items):
+    # Returns the `key` fields of list items if all of them are
+    # dictionaries with distinct keys, otherwise None.
+    keys = []
+    for item in items:
+        if not isinstance(item, (dict, ejson.Record)):
+            return None
+        key = item.get("key", None)
+        if key is None or not isinstance(key, _KEY_TYPES):
+            return None
+        keys.append(key)
+    if len(set(keys)) != len(keys):
+        return None
+    return keys
+
+
+def diff(old, new):
+    """Returns a patch, which turns parsed configuration `old` into `new`
+    when applied by :func:`patch`.
+
+    The patch is a list of operations `(op, path, value)`, where `path`
+    is a tuple of dictionary keys and list indices (empty for the whole
+    configuration) and `op` is one of:
+
+    * ``"replace"`` -- replace the value at `path` with `value`,
+    * ``"add"`` -- add `value` to a dictionary under the last key of
+      `path`, or insert it to a list at the last index of `path`,
+    * ``"remove"`` -- remove the value at `path` (`value` is None),
+    * ``"move"`` -- move an item of a list from index `value` to the
+      last index of `path`.
+
+    Operations only change the smallest parts of the configuration
+    which differ. Items of lists of dictionaries with distinct `key`
+    fields (such as ``configurations`` and ``children``) are matched by
+    their keys, so adding, removing or reordering them doesn't change
+    the other items. Other lists are compared item by item.
+
+    Identical subtrees of `old` and `new` are recognized by their hashes
+    (computed once for every subtree), so the time taken is close to
+    linear in the size of the configurations.
+    """
+    nodes = {}
+    old_ids = _get_node_ids(old, nodes)
+    new_ids = _get_node_ids(new, nodes)
+
+    operations = []
+    stack = [((), old, new)]
+    while stack:
+        path, old, new = stack.pop()
+        if _get_node_id(old, old_ids, nodes) == _get_node_id(new, new_ids, nodes):
+            continue
+
+        if isinstance(old, (dict, ejson.Record)) and isinstance(new, (dict, ejson.Record)):
+            for key in old:
+                if key not in new:
+                    operations.append(("remove", path + (key, ), None))
+            for key, value in new.items():
+                if key not in old:
+                    operations.append(("add", path + (key, ), value))
+                else:
+                    stack.append((path + (key, ), old[key], value))
+        elif isinstance(old, (list, array.array)) and isinstance(new, (list, array.array)):
+            old_keys = _get_item_keys(old)
+            new_keys = _get_item_keys(new)
+            if old_keys is None or new_keys is None:
+                _diff_items(path, old, new, operations, stack)
+            else:
+                _diff_keyed_items(path, old, new, old_keys, new_keys, operations, stack)
+        else:
+            operations.append(("replace", path, new))
+
+    return operations
+
+
+def _diff_items(path, old, new, operations, stack):
+    # Compares lists item by item.
+    for index in range(min(len(old), len(new))):
+        stack.append((path + (index, ), old[index], new[index]))
+    for index in range(len(old) - 1, len(new) - 1, -1):
+        operations.append(("remove", path + (index, ), None))
+    for index in range(len(old), len(new)):
+        operations.append(("add", path + (index, ), new[index]))
+
+
+def _diff_keyed_items(path, old, new, old_keys, new_keys, operations, stack):
+    # Matches list items by their keys. Operations of the items themselves
+    # are added after those of the list, with the final indices.
+    new_key_set = set(new_keys)
+    old_items = dict(zip(old_keys, old))
+
+    current = []
+    for index in range(len(old_keys) - 1, -1, -1):
+        if old_keys[index] not in new_key_set:
+            operations.append(("remove", path + (index, ), None))
+        else:
+            current.append(old_keys[index])
+    current.reverse()
+
+    for index, key in enumerate(new_keys):
+        if index >= len(current) or current[index] != key:
+            if key not in old_items:
+                operations.append(("add", path + (index, ), new[index]))
+                current.insert(index, key)
+                continue
+            source = current.index(key, index)
+            operations.append(("move", path + (index, ), source))
+            current.insert(index, current.pop(source))
+        stack.append((path + (index, ), old_items[key], new[index]))
+
+
+def patch(config, operations):
+    """Applies `operations` returned by :func:`diff` to parsed
+    configuration `config` in place (values are inserted without
+    copying). Returns the patched configuration, which is a new object
+    only if the whole configuration is replaced.
+
+    Configurations parsed in compact mode (with read-only records) can't
+    be patched.
+    """
+    for op, path, value in operations:
+        if not path:
+            if op != "replace":
+                raise ValueError("Invalid patch operation %r at the root." % (op, ))
+            config = value
+            continue
+
+        parent = config
+        for step in path[:-1]:
+            parent = parent[step]
+        step = path[-1]
+
+        if op == "replace":
+            parent[step] = value
+        elif op == "add":
+            if isinstance(parent, (list, array.array)):
+                parent.insert(step, value)
+            else:
+                parent[step] = value
+        elif op == "remove":
+            del parent[step]
+        elif op == "move":
+            parent.insert(step, parent.pop(value))
+        else:
+            raise ValueError("Unknown patch operation %r." % (op, ))
+    return config
+
+
 def main():
     print(__doc__)
 
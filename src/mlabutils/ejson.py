@@ -52,9 +52,127 @@ Author: Jan Milík <milikjan@fit.cvut.cz>
 """
 
 
+import array
+import bisect
+import collections
+import keyword
+import mmap
+import os
 import re
 
-from mlabutils import BufferedIterator
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+try:
+    from mlabutils import _ejson_speedups
+except ImportError:
+    _ejson_speedups = None
+
+
+#: Number of characters read at once by :meth:`Lexer.scan_file`.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+#: Smallest number of files for which :func:`parse_files` starts a process
+#: pool; smaller batches are parsed serially.
+PARALLEL_MIN_FILES = 8
+
+#: True if the accelerated lexer (the :mod:`mlabutils._ejson_speedups`
+#: C extension) is available.
+ACCELERATED = _ejson_speedups is not None
+
+
+if str is bytes:
+    # Python 2
+    TEXT_TYPES = (str, unicode, )
+
+    def _decode(data):
+        if isinstance(data, str):
+            return data
+        if isinstance(data, memoryview):
+            return data.tobytes()
+        return str(data)
+else:
+    TEXT_TYPES = (str, )
+
+    def _decode(data):
+        return str(data, "utf-8")
+
+
+if str is bytes:
+    # Python 2 (unichr doesn't support code points above 0xFFFF on narrow
+    # builds)
+    def _code_point_to_unicode(code_point):
+        return ("\\U%08x" % (code_point, )).decode("unicode-escape")
+
+    def _code_point_to_native(code_point):
+        return _code_point_to_unicode(code_point).encode("utf-8")
+else:
+    _code_point_to_native = _code_point_to_unicode = chr
+
+
+_STRING_ESCAPE_PATTERN = re.compile(
+    r"\\(?:u([0-9a-fA-F]{4})(?:\\u([dD][c-fC-F][0-9a-fA-F]{2}))?|(.))")
+
+_STRING_ESCAPES = {
+    "\"": "\"",
+    "\\": "\\",
+    "/": "/",
+    "b": "\b",
+    "f": "\f",
+    "n": "\n",
+    "r": "\r",
+    "t": "\t",
+}
+
+
+def _decode_escape(match, code_point_to_text = _code_point_to_native):
+    code, low_surrogate, char = match.groups()
+
+    if char is not None:
+        # Unknown escape sequences are kept as they are
+        return _STRING_ESCAPES.get(char, match.group())
+
+    code = int(code, 16)
+    if low_surrogate is None:
+        return code_point_to_text(code)
+
+    low_surrogate = int(low_surrogate, 16)
+    if 0xD800 <= code <= 0xDBFF:
+        return code_point_to_text(0x10000 + ((code - 0xD800) << 10) + (low_surrogate - 0xDC00))
+    return code_point_to_text(code) + code_point_to_text(low_surrogate)
+
+
+def _decode_unicode_escape(match):
+    return _decode_escape(match, _code_point_to_unicode)
+
+
+def decode_number(text):
+    """Returns the value of number literal `text`: an :class:`int` unless
+    it contains a fraction or an exponent, a :class:`float` otherwise.
+    """
+    if "." in text or "e" in text or "E" in text:
+        return float(text)
+    return int(text)
+
+
+def decode_string(text):
+    """Returns the value of string literal `text` (including the quotes).
+
+    Handles the JSON escape sequences (``\\"``, ``\\\\``, ``\\/``,
+    ``\\b``, ``\\f``, ``\\n``, ``\\r``, ``\\t`` and ``\\uXXXX``, including
+    surrogate pairs). Other escape sequences are left untouched. On Python
+    2, the result is a UTF-8 encoded :class:`str`, or :class:`unicode`
+    if `text` is.
+    """
+    text = text[1:-1]
+    if "\\" not in text:
+        return text
+    if isinstance(text, str):
+        return _STRING_ESCAPE_PATTERN.sub(_decode_escape, text)
+    # Unicode text on Python 2
+    return _STRING_ESCAPE_PATTERN.sub(_decode_unicode_escape, text)
 
 
 class TextLoc(object):
@@ -70,7 +188,7 @@ class TextLoc(object):
 
     .. attribute:: column
 
-       Column within the line of the location.
+       Column within the line of the location counted starting from 1.
 
     """
 
@@ -87,6 +205,45 @@ class TextLoc(object):
         )
 
 
+_NEWLINE_PATTERN = re.compile("\n")
+_NEWLINE_BYTES_PATTERN = re.compile(b"\n")
+
+
+class LineIndex(object):
+    """Maps offsets in a text to :class:`TextLoc` locations.
+
+    Offsets of the beginnings of all lines are found once, when the index
+    is created; locations are then looked up by binary search.
+
+    The index can also cover just a part of a larger text: `base` is the
+    offset of `text[0]`, `first_line` is the number of the line containing
+    it and `first_line_start` is the offset where that line begins.
+    """
+
+    def __init__(self, text, base = 0, first_line = 1, first_line_start = None):
+        if isinstance(text, TEXT_TYPES):
+            pattern = _NEWLINE_PATTERN
+        else:
+            pattern = _NEWLINE_BYTES_PATTERN
+
+        if first_line_start is None:
+            first_line_start = base
+
+        self.base = base
+        self.first_line = first_line
+        self.line_starts = [first_line_start]
+        self.line_starts.extend(base + m.end() for m in pattern.finditer(text))
+
+    def location(self, offset):
+        """Returns :class:`TextLoc` of `offset`. Line and column are `None`
+        if the offset lies before the indexed text.
+        """
+        if offset < self.base:
+            return TextLoc(offset, None, None)
+        index = bisect.bisect_right(self.line_starts, offset) - 1
+        return TextLoc(offset, self.first_line + index, offset - self.line_starts[index] + 1)
+
+
 class Token(object):
     """EJSON token.
 
@@ -94,9 +251,10 @@ class Token(object):
 
        Type of the token (such as `NUMBER`, `KEYWORD` or `EOF`).
 
-    .. attribute:: location
+    .. attribute:: offset
 
-       Text location at which the token was found. Instance of :class:`TextLoc`.
+       Offset from the beginning of the text at which the token was found.
+       Use :meth:`Lexer.get_location` to get its line and column.
 
     .. attribute:: text
 
@@ -108,16 +266,16 @@ class Token(object):
        this would be an integer or float.
     """
 
-    def __init__(self, type, location, text, value):
+    def __init__(self, type, offset, text, value):
         self.type = type
-        self.location = location
+        self.offset = offset
         self.text = text
         self.value = value
 
     def __repr__(self):
         return "Token(%r, %r, %r, %r)" % (
             self.type,
-            self.location,
+            self.offset,
             self.text,
             self.value,
         )
@@ -126,6 +284,33 @@ class Token(object):
         return self.text
 
 
+class BufferToken(Token):
+    """Token found in a bytes-like buffer (such as :class:`mmap.mmap`).
+
+    Its text (and value, which is the same) is sliced from the buffer only
+    when it is accessed.
+    """
+
+    def __init__(self, type, offset, buffer, end):
+        self.type = type
+        self.offset = offset
+        self.buffer = buffer
+        self.end = end
+
+    @property
+    def text(self):
+        return _decode(self.buffer[self.offset:self.end])
+
+    @property
+    def value(self):
+        return self.text
+
+    def detach(self):
+        """Returns a plain :class:`Token` which doesn't reference the buffer.
+        """
+        return Token(self.type, self.offset, self.text, self.value)
+
+
 class Lexer(object):
     """Extended JSON lexer.
     """
@@ -144,13 +329,13 @@ class Lexer(object):
         return t
 
     def t_NUMBER(self, t):
-        r"-?(0|[1-9][0-9]*)(\.[0-9]*)?([eE][-+]?[0-9]*)?"
-        t.value = eval(t.text)
+        r"-?(0|[1-9][0-9]*)(\.[0-9]*)?([eE][-+]?[0-9]+)?"
+        t.value = decode_number(t.text)
         return t
 
     def t_STRING(self, t):
-        r"""\"(\\\"|[^\"\n])*\""""
-        t.value = eval(t.text)
+        r"""\"(\\.|[^\"\\\n])*\""""
+        t.value = decode_string(t.text)
         return t
 
     t_LPAREN = r"\("
@@ -166,18 +351,56 @@ class Lexer(object):
     t_EQUALS = r"\="
 
     def t_comment(self, t):
-        r"(\/\/[^\n]*)|(\/\*.*?\*\/)"
+        r"(\/\/[^\n]*)|(\/\*[\s\S]*?\*\/)"
         return None
 
     def t_ignore(self, t):
         r"\s+"
-        self.line += t.value.count("\n")
         return None
 
-    def __init__(self):
+    # Number of characters after a token which may change what it matches
+    # (``1e`` followed by ``3``), see :meth:`scan_file`
+    lookahead = 2
+
+    # Beginnings of long tokens which don't match until they are complete
+    # (an unterminated string or comment), cut off by the end of the text.
+    # Subclasses adding such tokens extend it.
+    partial_token = r"""\"(\\.|[^\"\\\n])*\\?\Z|\/\*[\s\S]*\Z"""
+
+    def __init__(self, compiled = True, accelerated = True):
+        """Constructor.
+
+        If `compiled` is true (the default), :meth:`scan` matches all token
+        specifications at once using a single master regular expression
+        (see :attr:`pattern`). Otherwise the specifications are tried one
+        after another at every offset.
+
+        If `accelerated` is true (the default) and :data:`ACCELERATED` is
+        true, strings are scanned by the C extension, which produces the same
+        tokens. Subclasses, which may override the `t_*` methods, always use
+        the pure-Python implementation.
+        """
+        self.compiled = compiled
+        self.accelerated = bool(
+            accelerated and compiled and ACCELERATED and type(self) is Lexer)
+
         self.token_specs = []
         self.ignore_token = None
 
+        self.pattern = None
+        self.buffer_pattern = None
+        self.partial_pattern = None
+        self.token_functions = {}
+
+        self.offset = 0
+
+        # Text being scanned (for scan_file, the part of it kept in memory)
+        self._source = None
+        self._source_base = 0
+        self._source_line = 1
+        self._source_line_start = 0
+        self._line_index = None
+
         self._reflect()
 
     def _reflect(self):
@@ -197,23 +420,269 @@ class Lexer(object):
 
             self.token_specs.append(self._reflect_token(token_name, attr_value))
 
+        self._compile()
+
     def _reflect_token(self, name, value):
         if isinstance(value, str):
-            return (name, re.compile(value), lambda t: t)
+            return (name, re.compile(value), _identity)
         return (name, re.compile(value.__doc__), value)
 
-    def scan(self, text, location = None):
-        current_loc = location or TextLoc(0, 1, 1)
+    def _compile(self):
+        # Join all token specifications into a single alternation of named
+        # groups (the way :class:`re.Scanner` does it). The ignore token goes
+        # first and the rest keep their order, so the first alternative which
+        # matches is the same one the sequential scan would pick.
+        specs = list(self.token_specs)
+        if self.ignore_token is not None:
+            specs.insert(0, self.ignore_token)
+
+        self.pattern = re.compile("|".join(
+            "(?P<%s>%s)" % (name, pattern.pattern)
+            for name, pattern, fn in specs
+        ))
+        self.token_functions = dict(
+            (name, None if fn is _identity else fn)
+            for name, pattern, fn in specs
+        )
 
-        self.offset = current_loc.offset
-        self.line = current_loc.line
-        self.column = current_loc.column
+        self.partial_pattern = re.compile(self.partial_token)
+
+        if isinstance(self.pattern.pattern, bytes):
+            self.buffer_pattern = self.pattern
+        else:
+            self.buffer_pattern = re.compile(self.pattern.pattern.encode("ascii"))
+
+    def _set_source(self, text, base = 0, line = 1, line_start = 0):
+        self._source = text
+        self._source_base = base
+        self._source_line = line
+        self._source_line_start = line_start
+        self._line_index = None
+
+    def get_location(self, offset):
+        """Returns :class:`TextLoc` (with line and column numbers)
+        of `offset` in the text being scanned.
+
+        Line numbers are computed only when this method is first called. For
+        :meth:`scan_file`, only offsets in the part of the file which is
+        still kept in memory get line and column numbers.
+        """
+        if self._source is None:
+            return TextLoc(offset, None, None)
+        if self._line_index is None:
+            self._line_index = LineIndex(
+                self._source,
+                self._source_base,
+                self._source_line,
+                self._source_line_start)
+        return self._line_index.location(offset)
+
+    def scan(self, text, offset = 0):
+        """Returns an iterator of tokens found in `text`, starting at
+        `offset`.
+
+        After the whole text is consumed, the iterator keeps yielding `EOF`
+        tokens. If no token matches at some point, a single `UNKNOWN` token
+        containing the rest of the text is yielded instead.
+
+        Besides strings, `text` can be a UTF-8 encoded bytes-like object
+        (such as :class:`mmap.mmap` or :class:`memoryview`). Such buffer is
+        matched directly without being converted to a string, offsets are
+        in bytes and tokens are :class:`BufferToken` instances unless
+        they are processed by a `t_*` method.
+        """
+        self.offset = offset
 
+        if not isinstance(text, TEXT_TYPES):
+            if str is bytes and isinstance(text, memoryview):
+                # Python 2 regular expressions don't support memoryview.
+                text = text.tobytes()
+            self._set_source(text)
+            return self._scan_buffer(text)
+
+        self._set_source(text)
+        if self.accelerated:
+            return self._scan_accelerated(text)
+        if self.compiled:
+            return self._scan_compiled(text)
+        return self._scan_sequential(text)
+
+    def tokenize(self, text, offset = 0):
+        """Scans the whole `text` and returns a list of its tokens.
+
+        The list always ends with a single `EOF` token (preceded by an
+        `UNKNOWN` token if the text contains something which is not a valid
+        token).
+        """
+        if self.accelerated and isinstance(text, TEXT_TYPES):
+            self._set_source(text)
+            tokens = _ejson_speedups.tokenize(text, offset, Token, decode_string)
+            self.offset = tokens[-1].offset
+            return tokens
+
+        tokens = []
+        append = tokens.append
+        for token in self.scan(text, offset):
+            append(token)
+            if token.type == "EOF":
+                return tokens
+            if token.type == "UNKNOWN":
+                break
+        append(Token("EOF", len(text), "", None))
+        return tokens
+
+    def scan_file(self, f, chunk_size = DEFAULT_CHUNK_SIZE):
+        """Returns an iterator of tokens read from file object `f`.
+
+        The file is read in chunks of `chunk_size` characters. Tokens
+        (including strings and comments) may straddle chunk boundaries;
+        only the unconsumed tail of the text is kept in memory. Token
+        offsets are relative to the beginning of the file. Where no token
+        matches, the `UNKNOWN` token holds the text read so far rather
+        than the rest of the file.
+        """
+        self.offset = 0
+        self._set_source("")
+
+        return self._scan_file(f, chunk_size)
+
+    def _scan_file(self, f, chunk_size):
+        match = self.pattern.match
+        partial = self.partial_pattern.match
+        lookahead = self.lookahead
+        functions = self.token_functions
+
+        text = ""
+        pos = 0
+        # Offset of text[0] from the beginning of the file
+        base = 0
+        # Line containing text[0] and offset at which the line starts
+        line = 1
+        line_start = 0
+        at_eof = False
+
+        while True:
+            m = match(text, pos)
+
+            # A token that is cut off by the end of the buffer either doesn't
+            # match at all or extends (almost) up to the end of the buffer.
+            # Either way, read more text and try again. If nothing matches
+            # and the rest can't be the beginning of a token, it is UNKNOWN
+            # regardless of what follows.
+            if m is not None:
+                cut_off = m.end() + lookahead >= len(text)
+            else:
+                cut_off = pos + lookahead >= len(text) or partial(text, pos) is not None
+            if not at_eof and cut_off:
+                chunk = f.read(chunk_size)
+                if chunk:
+                    newlines = text.count("\n", 0, pos)
+                    if newlines:
+                        line += newlines
+                        line_start = base + text.rindex("\n", 0, pos) + 1
+                    base += pos
+                    text = text[pos:] + chunk
+                    pos = 0
+                    self._set_source(text, base, line, line_start)
+                else:
+                    at_eof = True
+                continue
+
+            if pos >= len(text):
+                break
+
+            self.offset = base + pos
+
+            if m is None:
+                yield Token("UNKNOWN", self.offset, text[pos:], text[pos:])
+                return
+
+            token_type = m.lastgroup
+            token_text = m.group()
+
+            token = Token(token_type, self.offset, token_text, token_text)
+            fn = functions[token_type]
+            if fn is not None:
+                token = fn(token)
+            if token is not None:
+                yield token
+            pos = m.end()
+
+        self.offset = base + pos
+        while True:
+            yield Token("EOF", self.offset, "", None)
+
+    def _scan_buffer(self, buffer):
+        match = self.buffer_pattern.match
+        functions = self.token_functions
+        length = len(buffer)
+
+        while self.offset < length:
+            m = match(buffer, self.offset)
+            if m is None:
+                text = _decode(buffer[self.offset:])
+                yield Token("UNKNOWN", self.offset, text, text)
+                return
+
+            token_type = m.lastgroup
+            end = m.end()
+
+            fn = functions[token_type]
+            if fn is None:
+                yield BufferToken(token_type, self.offset, buffer, end)
+            else:
+                text = _decode(buffer[self.offset:end])
+                token = fn(Token(token_type, self.offset, text, text))
+                if token is not None:
+                    yield token
+            self.offset = end
+
+        while True:
+            yield Token("EOF", self.offset, "", None)
+
+    def _scan_accelerated(self, text):
+        tokens = _ejson_speedups.tokenize(text, self.offset, Token, decode_string)
+        for token in tokens[:-1]:
+            self.offset = token.offset
+            yield token
+
+        self.offset = tokens[-1].offset
+        while True:
+            yield Token("EOF", self.offset, "", None)
+
+    def _scan_compiled(self, text):
+        match = self.pattern.match
+        functions = self.token_functions
+        length = len(text)
+
+        while self.offset < length:
+            m = match(text, self.offset)
+            if m is None:
+                yield Token("UNKNOWN", self.offset, text[self.offset:], text[self.offset:])
+                return
+
+            token_type = m.lastgroup
+            end = m.end()
+            token_text = m.group()
+
+            token = Token(token_type, self.offset, token_text, token_text)
+            fn = functions[token_type]
+            if fn is not None:
+                token = fn(token)
+            if token is not None:
+                yield token
+            self.offset = end
+
+        while True:
+            yield Token("EOF", self.offset, "", None)
+
+    def _scan_sequential(self, text):
         while self.offset < len(text):
             if not self.ignore_token is None:
                 token_spec, pattern, fn = self.ignore_token
                 match = pattern.match(text, self.offset)
                 if match is not None:
+                    fn(Token(token_spec, self.offset, match.group(0), match.group(0)))
                     self.offset = match.end()
                     continue
 
@@ -221,151 +690,1411 @@ class Lexer(object):
                 match = pattern.match(text, self.offset)
                 if match is not None:
                     start, end = match.span()
-                    token = fn(Token(token_type, TextLoc(self.offset, self.line, self.column), match.group(0), match.group(0)))
+                    token = fn(Token(token_type, self.offset, match.group(0), match.group(0)))
                     if token is not None:
                         yield token
                     self.offset = end
                     break
             else:
-                yield Token("UNKNOWN", TextLoc(self.offset, self.line, self.column), text[self.offset:], text[self.offset:])
+                yield Token("UNKNOWN", self.offset, text[self.offset:], text[self.offset:])
                 return
 
         while True:
-            yield Token("EOF", TextLoc(self.offset, self.line, self.column), "", None)
+            yield Token("EOF", self.offset, "", None)
+
+
+def _identity(t):
+    return t
+
+
+class ParseError(Exception):
+    """Syntax error found by :class:`Parser`.
+
+    :meth:`Parser.parse_string` and :meth:`Parser.parse_file` return
+    (rather than raise) instances of this class.
+
+    .. attribute:: token
+
+       The unexpected :class:`Token`.
+
+    .. attribute:: location
 
+       :class:`TextLoc` of the token, or `None` if the source text is not
+       known (such as when parsing a list of tokens).
 
-class ParseError(object):
-    def __init__(self, token):
+    .. attribute:: file_name
+
+       Name of the parsed file, or `None` if not parsing a file.
+    """
+
+    def __init__(self, token, location = None, file_name = None):
+        Exception.__init__(self, token)
         self.token = token
+        self.location = location
+        self.file_name = file_name
 
     def __str__(self):
-        return "Unexpected token at line %d: %r." % (
-            self.token.location.line,
-            self.token.text,
-        )
+        if self.location is None or self.location.line is None:
+            message = "Unexpected token at offset %d: %r." % (
+                self.token.offset,
+                self.token.text,
+            )
+        else:
+            message = "Unexpected token at line %d, column %d: %r." % (
+                self.location.line,
+                self.location.column,
+                self.token.text,
+            )
+        if self.file_name is not None:
+            message = "%s: %s" % (self.file_name, message, )
+        return message
+
+
+_IDENTIFIER_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9_]*\Z")
+
+
+class Record(object):
+    """Read-only mapping with a fixed set of keys stored in slots.
+
+    :class:`Parser` in compact mode returns records instead of
+    dictionaries whose keys are all identifiers (not starting with an
+    underscore and not clashing with the methods of this class). All
+    records with the same set of keys share one subclass, so a record
+    takes a fraction of the memory of the equivalent dictionary.
+
+    Records support the read-only part of the dictionary interface (they
+    are registered as :class:`~collections.abc.Mapping`), their values
+    can also be read as attributes, and they compare equal to
+    dictionaries with the same items. Keys are ordered alphabetically.
+    """
+
+    __slots__ = ()
+
+    _fields = ()
+    _field_set = frozenset()
+    _setters = ()
+
+    def __getitem__(self, key):
+        if key not in self._field_set:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._fields)
+
+    def __len__(self):
+        return len(self._fields)
+
+    def __contains__(self, key):
+        return key in self._field_set
+
+    def get(self, key, default = None):
+        if key not in self._field_set:
+            return default
+        return getattr(self, key)
+
+    def keys(self):
+        return list(self._fields)
+
+    def values(self):
+        return [getattr(self, field) for field in self._fields]
+
+    def items(self):
+        return list(zip(self._fields, self.values()))
+
+    def __eq__(self, other):
+        if isinstance(other, (dict, Record)):
+            return dict(self.items()) == dict(other.items())
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Record is read-only.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Record is read-only.")
+
+    def __reduce__(self):
+        return (_make_record, (self._fields, tuple(self.values())))
+
+    def __repr__(self):
+        return "Record(%s)" % (", ".join(
+            "%s=%r" % (field, getattr(self, field))
+            for field in self._fields
+        ), )
+
+
+Mapping.register(Record)
+
+_RECORD_TYPES = {}
+
+
+def _field_name(key):
+    """Returns the :class:`Record` field name for dictionary key `key`,
+    or an empty string if it can't be a field.
+    """
+    if not isinstance(key, TEXT_TYPES) or _IDENTIFIER_PATTERN.match(key) is None:
+        return ""
+    # The key is ASCII, so this only converts unicode keys in Python 2
+    name = str(key)
+    if keyword.iskeyword(name) or hasattr(Record, name):
+        return ""
+    return name
+
+
+def _make_record(fields, values):
+    """Returns a :class:`Record` with sorted keys `fields` and `values`.
+    """
+    cls = _RECORD_TYPES.get(fields)
+    if cls is None:
+        cls = type("Record", (Record, ), {
+            "__slots__": fields,
+            "_fields": fields,
+            "_field_set": frozenset(fields),
+        })
+        cls._setters = tuple(cls.__dict__[field].__set__ for field in fields)
+        cls = _RECORD_TYPES.setdefault(fields, cls)
+
+    record = object.__new__(cls)
+    for setter, value in zip(cls._setters, values):
+        setter(record, value)
+    return record
+
+
+def _compact_list(values):
+    """Returns `values` as :class:`array.array` if they are all integers
+    or all floats.
+    """
+    item_type = type(values[0])
+    if item_type is int:
+        typecode = "l"
+    elif item_type is float:
+        typecode = "d"
+    else:
+        return values
+
+    for value in values:
+        if type(value) is not item_type:
+            return values
+    try:
+        return array.array(typecode, values)
+    except OverflowError:
+        return values
+
+
+def _get_function(method):
+    # Returns the function of a method (unbound methods of Python 2 are
+    # created anew on every access).
+    return getattr(method, "__func__", method)
+
+
+class _TokenWindow(object):
+    """Tokens of `scanner` (an iterator returned by :meth:`Lexer.scan`)
+    which :class:`Parser` can index like a list. Tokens are scanned as
+    they are indexed, and those before the last indexed position are
+    dropped from time to time, so positions must not decrease (by more
+    than the tokens since the last drop).
+    """
+
+    __slots__ = ("_lexer", "_scanner", "_tokens", "_base", )
+
+    # Number of tokens kept before dropping those already parsed
+    WINDOW = 4096
+
+    def __init__(self, lexer, scanner):
+        self._lexer = lexer
+        self._scanner = scanner
+        self._tokens = []
+        # Position of _tokens[0]
+        self._base = 0
+
+    def __getitem__(self, pos):
+        tokens = self._tokens
+        index = pos - self._base
+        if index >= self.WINDOW:
+            del tokens[:index]
+            self._base = pos
+            index = 0
+        while index >= len(tokens):
+            try:
+                tokens.append(next(self._scanner))
+            except StopIteration:
+                # The scanner stops after an UNKNOWN token
+                tokens.append(Token("EOF", self._lexer.offset, "", None))
+        return tokens[index]
 
 
 class Parser(object):
     """Extended JSON parser.
+
+    The parser works on a list of tokens produced by :meth:`Lexer.tokenize`
+    and dispatches directly on the type of the current token.
+
+    If `intern_keys` is true, equal dictionary keys share a single string
+    object across the whole parsed document.
+
+    If `compact` is true, dictionaries with identifier keys are returned
+    as :class:`Record` objects and non-empty lists of only integers or
+    only floats as :class:`array.array`. Both take much less memory than
+    dictionaries and lists, but can't be modified (arrays can, but only
+    hold numbers of their type).
     """
 
+    SCALAR_TOKENS = frozenset(("NUMBER", "STRING", "KEYWORD", ))
+    KEY_TOKENS = frozenset(("STRING", "KEYWORD", ))
+    KEY_SEPARATOR_TOKENS = frozenset(("COLON", "EQUALS", ))
+    SEPARATOR_TOKENS = frozenset(("COMMA", "SEMICOLON", ))
+
+    # Lists and dictionaries nested deeper than this are parsed with an
+    # explicit stack instead of recursion, so there is no limit on nesting
+    MAX_RECURSION_DEPTH = 100
+
+    def __init__(self, intern_keys = False, compact = False):
+        self.intern_keys = intern_keys
+        self.compact = compact
+
+        self._tokens = None
+        self._pos = 0
+        self._keys = None
+        self._field_names = None
+        self._call_hooks = True
+
     def parse_string(self, text):
+        """Parses EJSON `text` and returns the value it contains
+        or a :class:`ParseError` instance.
+        """
+        lexer = Lexer()
+        value = self.parse_tokens(lexer.tokenize(text))
+        if isinstance(value, ParseError):
+            value.location = lexer.get_location(value.token.offset)
+        return value
+
+    def parse_buffer(self, buffer):
+        """Parses UTF-8 encoded EJSON from a bytes-like object, such as
+        :class:`mmap.mmap` or :class:`memoryview`, without copying it
+        into a string.
+
+        Tokens are parsed as they are scanned and only a window of them is
+        kept in memory, rather than the list of all tokens (unless a
+        subclass overrides :meth:`_end_list` or :meth:`_end_dict`, which
+        get token positions).
+        """
         lexer = Lexer()
-        tokens = BufferedIterator(lexer.scan(text))
-        success, value = self._parse_expression(tokens)
-        if not success:
-            return ParseError(tokens.peek())
+        if self._overrides_hooks():
+            tokens = lexer.tokenize(buffer)
+        else:
+            tokens = _TokenWindow(lexer, lexer.scan(buffer))
+        value = self.parse_tokens(tokens)
+        if isinstance(value, ParseError):
+            value.location = lexer.get_location(value.token.offset)
+            if isinstance(value.token, BufferToken):
+                # Don't keep the buffer alive (or fail if it's closed later).
+                value.token = value.token.detach()
+                value.args = (value.token, )
+        return value
 
-        t = tokens.peek()
-        if t.type != "EOF":
-            return ParseError(t)
+    def parse_file(self, file_name, use_mmap = False):
+        """Parses EJSON file `file_name`.
+
+        If `use_mmap` is true, the file is memory-mapped and parsed with
+        :meth:`parse_buffer` instead of being read into memory.
+        """
+        if use_mmap:
+            with open(file_name, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    # Empty files can't be mapped.
+                    return self.parse_string("")
+                buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+                try:
+                    value = self.parse_buffer(buffer)
+                finally:
+                    buffer.close()
+        else:
+            with open(file_name, "r") as f:
+                value = self.parse_string(f.read())
+
+        if isinstance(value, ParseError):
+            value.file_name = file_name
+        return value
 
+    def iterparse(self, f, items = False, chunk_size = DEFAULT_CHUNK_SIZE):
+        """Parses EJSON values from file object `f` incrementally.
+
+        Yields top-level values one at a time as soon as they are complete.
+        The values may be separated by commas or semicolons. If `items` is
+        true, the document must consist of a single list and its elements
+        are yielded instead.
+
+        Only the tokens of the value being parsed are kept in memory, so
+        memory usage doesn't depend on the size of the file.
+
+        Unlike :meth:`parse_string`, syntax errors are raised as
+        :class:`ParseError`.
+        """
+        lexer = Lexer()
+        tokens = lexer.scan_file(f, chunk_size)
+
+        if items:
+            token = next(tokens)
+            if token.type != "LBRACKET":
+                raise ParseError(token, lexer.get_location(token.offset))
+
+        scalars = self.SCALAR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+        value_tokens = []
+        depth = 0
+        # Separators are only allowed after a value
+        has_value = False
+
+        for token in tokens:
+            token_type = token.type
+
+            if depth > 0:
+                value_tokens.append(token)
+                if token_type == "LBRACKET" or token_type == "LBRACE":
+                    depth += 1
+                elif token_type == "RBRACKET" or token_type == "RBRACE":
+                    depth -= 1
+                    if depth == 0:
+                        yield self._parse_value_tokens(value_tokens, token, lexer)
+                        value_tokens = []
+                        has_value = True
+                elif token_type == "EOF" or token_type == "UNKNOWN":
+                    raise ParseError(token, lexer.get_location(token.offset))
+            elif token_type in scalars:
+                value_tokens.append(token)
+                yield self._parse_value_tokens(value_tokens, token, lexer)
+                value_tokens = []
+                has_value = True
+            elif token_type == "LBRACKET" or token_type == "LBRACE":
+                value_tokens.append(token)
+                depth = 1
+            elif token_type in separators and has_value:
+                pass
+            elif items and token_type == "RBRACKET":
+                token = next(tokens)
+                if token.type != "EOF":
+                    raise ParseError(token, lexer.get_location(token.offset))
+                return
+            elif token_type == "EOF" and not items:
+                return
+            else:
+                raise ParseError(token, lexer.get_location(token.offset))
+
+    def _parse_value_tokens(self, tokens, last_token, lexer):
+        tokens.append(Token("EOF", last_token.offset, "", None))
+        value = self.parse_tokens(tokens)
+        if isinstance(value, ParseError):
+            value.location = lexer.get_location(value.token.offset)
+            raise value
         return value
 
-    def parse_file(self, file_name):
-        with open(file_name, "r") as f:
-            contents = f.read()
-            return self.parse_string(contents)
-
-    def _parse_separator(self, tokens):
-        while tokens.peek().type in ("COMMA", "SEMICOLON"):
-            tokens.next()
-        return True, None
-
-    def _parse_expression(self, tokens):
-        success, value = self._parse_list(tokens)
-        if success:
-            return True, value
-
-        success, value = self._parse_dict(tokens)
-        if success:
-            return True, value
-
-        success, value = self._parse_number(tokens)
-        if success:
-            return True, value
-
-        success, value = self._parse_string(tokens)
-        if success:
-            return True, value
-
-        return False, None
-
-    def _parse_number(self, tokens):
-        t = tokens.peek()
-        if not t.type == "NUMBER":
-            return False, None
-        tokens.next()
-        return True, t.value
-
-    def _parse_string(self, tokens):
-        t = tokens.peek()
-        if t.type in ("STRING", "KEYWORD"):
-            tokens.next()
-            return True, t.value
-        return False, None
-
-    def _parse_list(self, tokens):
-        # Parse left bracket
-        if tokens.peek().type != "LBRACKET":
-            return False, None
-        tokens.next()
-
-        # Parse list items
+    def parse_tokens(self, tokens):
+        """Parses a list of tokens terminated by an `EOF` token (see
+        :meth:`Lexer.tokenize`).
+        """
+        self._tokens = tokens
+        self._pos = 0
+        # The hooks are only called if they do anything
+        self._call_hooks = self.compact or self._overrides_hooks()
+        if self.intern_keys:
+            self._keys = {}
+        if self.compact:
+            self._field_names = {}
+        try:
+            value = self._parse_value()
+            token = tokens[self._pos]
+            if token.type != "EOF":
+                raise ParseError(token)
+            return value
+        except ParseError as e:
+            return e
+        finally:
+            self._tokens = None
+            self._keys = None
+            self._field_names = None
+
+    def _parse_value(self):
+        # Containers are parsed recursively, which is fastest for usual
+        # documents; those nested deeper than MAX_RECURSION_DEPTH are parsed
+        # by _parse_deep.
+        token = self._tokens[self._pos]
+        token_type = token.type
+
+        if token_type in self.SCALAR_TOKENS:
+            self._pos += 1
+            return token.value
+        if token_type == "LBRACKET":
+            return self._parse_list(1)
+        if token_type == "LBRACE":
+            return self._parse_dict(1)
+
+        raise ParseError(token)
+
+    def _parse_list(self, depth):
+        tokens = self._tokens
+        scalars = self.SCALAR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+
+        # Skip the left bracket
+        start = self._pos
+        pos = start + 1
         values = []
+
         while True:
-            success, result = self._parse_expression(tokens)
-            if not success:
-                break
-            values.append(result)
+            token = tokens[pos]
+            token_type = token.type
+
+            if token_type in scalars:
+                values.append(token.value)
+                pos += 1
+            elif token_type == "RBRACKET":
+                self._pos = pos + 1
+                if self._call_hooks:
+                    return self._end_list(values, start, pos)
+                return values
+            elif token_type in separators and values:
+                # Any number of separators may follow a list item
+                pos += 1
+            elif token_type == "LBRACKET" or token_type == "LBRACE":
+                self._pos = pos
+                if depth >= self.MAX_RECURSION_DEPTH:
+                    values.append(self._parse_deep())
+                elif token_type == "LBRACKET":
+                    values.append(self._parse_list(depth + 1))
+                else:
+                    values.append(self._parse_dict(depth + 1))
+                pos = self._pos
+            else:
+                raise ParseError(token)
+
+    def _parse_dict(self, depth):
+        tokens = self._tokens
+        scalars = self.SCALAR_TOKENS
+        keys = self.KEY_TOKENS
+        key_separators = self.KEY_SEPARATOR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+
+        interned_keys = self._keys
+
+        # Skip the left brace
+        start = self._pos
+        pos = start + 1
+        elements = {}
 
-            self._parse_separator(tokens)
+        while True:
+            token = tokens[pos]
+            token_type = token.type
+
+            if token_type == "RBRACE":
+                self._pos = pos + 1
+                if self._call_hooks:
+                    return self._end_dict(elements, start, pos)
+                return elements
+            elif token_type in separators and elements:
+                # Any number of separators may follow a key-value pair
+                pos += 1
+                continue
+            elif token_type not in keys:
+                raise ParseError(token)
+
+            key = token.value
+            if interned_keys is not None:
+                key = interned_keys.setdefault(key, key)
+            pos += 1
+
+            # Optional colon or equal sign
+            if tokens[pos].type in key_separators:
+                pos += 1
+
+            token = tokens[pos]
+            token_type = token.type
+            if token_type in scalars:
+                elements[key] = token.value
+                pos += 1
+            elif token_type == "LBRACKET" or token_type == "LBRACE":
+                self._pos = pos
+                if depth >= self.MAX_RECURSION_DEPTH:
+                    elements[key] = self._parse_deep()
+                elif token_type == "LBRACKET":
+                    elements[key] = self._parse_list(depth + 1)
+                else:
+                    elements[key] = self._parse_dict(depth + 1)
+                pos = self._pos
+            else:
+                raise ParseError(token)
+
+    def _parse_deep(self):
+        # Parses the value at self._pos like _parse_value, but lists and
+        # dictionaries being parsed are kept on an explicit stack (rather
+        # than parsed recursively), so any depth of nesting can be parsed.
+        # A stack entry is [container, start, key], where `start` is the
+        # position of its opening bracket and `key` is the key of the nested
+        # value being parsed in a dictionary.
+        tokens = self._tokens
+        scalars = self.SCALAR_TOKENS
+        keys = self.KEY_TOKENS
+        key_separators = self.KEY_SEPARATOR_TOKENS
+        separators = self.SEPARATOR_TOKENS
+        interned_keys = self._keys
+
+        pos = self._pos
+        token = tokens[pos]
+        token_type = token.type
+
+        if token_type in scalars:
+            self._pos = pos + 1
+            return token.value
+
+        stack = []
 
-        # Parse right bracket
-        if tokens.peek().type != "RBRACKET":
-            return True, ParseError(tokens.peek())
-        tokens.next()
+        while True:
+            # Open a list or a dictionary
+            if token_type == "LBRACKET":
+                container = []
+            elif token_type == "LBRACE":
+                container = {}
+            else:
+                raise ParseError(token)
+            entry = [container, pos, None]
+            stack.append(entry)
+            pos += 1
+            token = tokens[pos]
+            token_type = token.type
+
+            # Parse items of the innermost container until a nested one
+            # is opened
+            while True:
+                if type(container) is list:
+                    while True:
+                        if token_type in scalars:
+                            container.append(token.value)
+                        elif not (token_type in separators and container):
+                            # Any number of separators may follow a list item
+                            break
+                        pos += 1
+                        token = tokens[pos]
+                        token_type = token.type
+
+                    if token_type != "RBRACKET":
+                        break
+                    value = self._end_list(container, entry[1], pos)
+                else:
+                    while True:
+                        if token_type == "RBRACE":
+                            break
+                        elif token_type in separators and container:
+                            # Any number of separators may follow a key-value pair
+                            pos += 1
+                            token = tokens[pos]
+                            token_type = token.type
+                            continue
+                        elif token_type not in keys:
+                            raise ParseError(token)
+
+                        key = token.value
+                        if interned_keys is not None:
+                            key = interned_keys.setdefault(key, key)
+                        pos += 1
+
+                        # Optional colon or equal sign
+                        if tokens[pos].type in key_separators:
+                            pos += 1
+
+                        token = tokens[pos]
+                        token_type = token.type
+                        if token_type not in scalars:
+                            if token_type != "LBRACKET" and token_type != "LBRACE":
+                                raise ParseError(token)
+                            entry[2] = key
+                            break
+                        container[key] = token.value
+                        pos += 1
+                        token = tokens[pos]
+                        token_type = token.type
+
+                    if token_type != "RBRACE":
+                        break
+                    value = self._end_dict(container, entry[1], pos)
+
+                # The container is parsed, add it to the enclosing one
+                pos += 1
+                stack.pop()
+                if not stack:
+                    self._pos = pos
+                    return value
+                entry = stack[-1]
+                container = entry[0]
+                if type(container) is list:
+                    container.append(value)
+                else:
+                    container[entry[2]] = value
+                token = tokens[pos]
+                token_type = token.type
+
+    def _overrides_hooks(self):
+        cls = type(self)
+        return (_get_function(cls._end_list) is not _get_function(Parser._end_list)
+            or _get_function(cls._end_dict) is not _get_function(Parser._end_dict))
+
+    def _end_list(self, values, start, end):
+        """Called with each parsed list and positions of its brackets.
+        Returns the value to use instead.
+        """
+        if self.compact and values:
+            return _compact_list(values)
+        return values
+
+    def _end_dict(self, elements, start, end):
+        """Called with each parsed dictionary and positions of its braces.
+        Returns the value to use instead.
+        """
+        if self.compact and elements:
+            return self._compact_dict(elements)
+        return elements
+
+    def _compact_dict(self, elements):
+        field_names = self._field_names
+        fields = []
+        for key, value in elements.items():
+            name = field_names.get(key)
+            if name is None:
+                name = field_names[key] = _field_name(key)
+            if not name:
+                return elements
+            fields.append((name, value))
+
+        fields.sort(key = lambda field: field[0])
+        return _make_record(
+            tuple(name for name, value in fields),
+            [value for name, value in fields])
+
+
+class _Span(object):
+    """Extent of a list or dictionary in the text parsed by
+    :class:`IncrementalParser`. `end` is the offset after its closing
+    bracket.
+    """
 
-        # Return result
-        return True, values
+    __slots__ = ("start", "end", "value", "parent", "children", )
 
-    def _parse_dict(self, tokens):
-        if tokens.peek().type != "LBRACE":
-            return False, None
-        tokens.next()
+    def __init__(self, start, parent):
+        self.start = start
+        self.end = None
+        self.value = None
+        self.parent = parent
+        self.children = []
 
-        success, items = self._parse_dict_items(tokens)
-        if not success:
-            return items
+    def shift(self, delta):
+        stack = [self]
+        while stack:
+            span = stack.pop()
+            span.start += delta
+            span.end += delta
+            stack.extend(span.children)
 
-        if tokens.peek().type != "RBRACE":
-            return True, ParseError(tokens.peek())
-        tokens.next()
 
-        return True, items
+class _SpanParser(Parser):
+    """Parser which records a :class:`_Span` of every container it parses.
+    Offsets of the tokens are relative to `base`.
+    """
 
-    def _parse_dict_items(self, tokens):
-        elements = {}
+    def __init__(self, base = 0):
+        Parser.__init__(self)
+        self.base = base
+        self.root = None
+        # Spans of parsed containers whose parent isn't parsed yet
+        self._spans = []
+
+    def _end_list(self, values, start, end):
+        return self._add_span(Parser._end_list(self, values, start, end), start, end)
+
+    def _end_dict(self, elements, start, end):
+        return self._add_span(Parser._end_dict(self, elements, start, end), start, end)
+
+    def _add_span(self, value, start, end):
+        # Containers end children first, so the children of this one are
+        # the spans parsed since its start.
+        spans = self._spans
+        span = _Span(self.base + self._tokens[start].offset, None)
+        span.end = self.base + self._tokens[end].offset + 1
+        span.value = value
+
+        first = len(spans)
+        while first > 0 and spans[first - 1].start > span.start:
+            first -= 1
+        span.children = spans[first:]
+        del spans[first:]
+        for child in span.children:
+            child.parent = span
+
+        spans.append(span)
+        self.root = span
+        return value
+
+
+class IncrementalParser(object):
+    """Keeps a parsed EJSON value up to date as its text is edited.
+
+    Besides the value, the parser keeps the extent of every list and
+    dictionary in the text. :meth:`edit` only reparses the smallest of
+    them that contains the edit (without its brackets) and puts the new
+    value in place of the old one in the cached tree; if that part no
+    longer parses on its own, its parent is tried, up to the whole text::
+
+        parser = IncrementalParser()
+        config = parser.parse(text)
+        config = parser.edit(start, end, "42")
+
+    The lists and dictionaries outside of the reparsed part are modified
+    in place, so the same objects are returned after every successful
+    edit.
+
+    .. attribute:: text
+
+       The current text.
+
+    .. attribute:: value
+
+       The current value, or a :class:`ParseError` if the text doesn't
+       parse.
+
+    .. attribute:: reparsed
+
+       `(start, end)` of the part of the text reparsed by the last call of
+       :meth:`parse` or :meth:`edit`.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.value = None
+        self.reparsed = None
+        self._root = None
+
+    def parse(self, text):
+        """Parses the whole `text` and returns the value it contains
+        or a :class:`ParseError` instance.
+        """
+        self.text = text
+        self.reparsed = (0, len(text))
+
+        lexer = Lexer()
+        parser = _SpanParser()
+        value = parser.parse_tokens(lexer.tokenize(text))
+        if isinstance(value, ParseError):
+            value.location = lexer.get_location(value.token.offset)
+            self._root = None
+        else:
+            self._root = parser.root
+        self.value = value
+        return value
+
+    def edit(self, start, end, text):
+        """Replaces `self.text[start:end]` with `text` and returns the
+        updated value or a :class:`ParseError` instance.
+        """
+        self.text = self.text[:start] + text + self.text[end:]
+        delta = len(text) - (end - start)
+
+        span = self._find_span(start, end)
+        while span is not None:
+            if self._reparse(span, delta):
+                return self.value
+            span = span.parent
+
+        return self.parse(self.text)
+
+    def _find_span(self, start, end):
+        span = self._root
+        if span is None or not (span.start < start and end < span.end):
+            return None
 
         while True:
-            token = tokens.peek()
+            for child in span.children:
+                if child.start >= start:
+                    return span
+                if end < child.end:
+                    span = child
+                    break
+            else:
+                return span
+
+    def _reparse(self, span, delta):
+        start = span.start
+        end = span.end + delta
+
+        parent = span.parent
+        parser = _SpanParser(start)
+        value = parser.parse_tokens(Lexer().tokenize(self.text[start:end]))
+        if isinstance(value, ParseError):
+            return False
+        new_span = parser.root
+        # The closing bracket could have become a part of a comment.
+        if new_span is None or new_span.end != end:
+            return False
+
+        new_span.parent = parent
+        if parent is None:
+            self.value = value
+            self._root = new_span
+        else:
+            index = parent.children.index(span)
+            container = parent.value
+            if isinstance(container, list):
+                keys = range(len(container))
+            else:
+                keys = container.keys()
+            for key in keys:
+                if container[key] is span.value:
+                    container[key] = value
+                    break
+            else:
+                # The container was overridden by a duplicate key.
+                return False
 
-            if not token.type in ("STRING", "KEYWORD"):
-                break
-            tokens.next()
+            parent.children[index] = new_span
 
-            if tokens.peek().type in ("COLON", "EQUALS"):
-                tokens.next()
+            # Move everything after the edited container.
+            while parent is not None:
+                parent.end += delta
+                for sibling in parent.children[index + 1:]:
+                    sibling.shift(delta)
+                if parent.parent is not None:
+                    index = parent.parent.children.index(parent)
+                parent = parent.parent
+
+        self.reparsed = (start, end)
+        return True
+
+
+class _Wildcard(object):
+    def __repr__(self):
+        return "WILDCARD"
 
-            success, value = self._parse_expression(tokens)
-            if not success:
-                return False, value
 
-            elements[token.value] = value
+#: Path step of :func:`extract` which matches every item of a list and
+#: every value of a dictionary.
+WILDCARD = _Wildcard()
 
-            self._parse_separator(tokens)
+_PATH_STEP_PATTERN = re.compile(r"""
+    (?:^|\.)(?P<key>[^.\[\]"]+)
+  | \[(?P<index>[0-9]+)\]
+  | \[(?P<quoted>"(?:\\.|[^"\\])*")\]
+  | \[(?P<wildcard>\*)\]
+""", re.VERBOSE)
 
-        return True, elements
+# Matches everything up to the next bracket, except for brackets inside
+# strings and comments.
+_SKIP_PATTERN = re.compile(r"""(?:[^"\[\]{}/]+|"(?:\\.|[^"\\\n])*"|//[^\n]*|/\*[\s\S]*?\*/)*""")
+_SPACE_PATTERN = re.compile(r"(?:\s+|//[^\n]*|/\*[\s\S]*?\*/)*")
+_CLOSING_BRACKETS = {
+    "[": "]",
+    "{": "}",
+}
+
+
+def parse_path(path):
+    """Splits :func:`extract` path `path` into a list of steps: keys
+    (strings), list indices (integers) and :data:`WILDCARD`.
+    """
+    steps = []
+    pos = 0
+    while pos < len(path):
+        m = _PATH_STEP_PATTERN.match(path, pos)
+        if m is None:
+            raise ValueError("Invalid path %r at offset %d." % (path, pos, ))
+
+        kind = m.lastgroup
+        if kind == "key":
+            step = m.group("key")
+            if step == "*":
+                step = WILDCARD
+        elif kind == "index":
+            step = int(m.group("index"))
+        elif kind == "quoted":
+            step = decode_string(m.group("quoted"))
+        else:
+            step = WILDCARD
+        steps.append(step)
+        pos = m.end()
+    return steps
+
+
+class _Extractor(object):
+    """Finds values selected by a path in EJSON text (see :func:`extract`).
+
+    Tokens are only created for the containers on the path; other values
+    are skipped by counting brackets and only the selected values are
+    parsed.
+    """
+
+    def __init__(self, text):
+        self.text = text
+
+        lexer = Lexer(accelerated = False)
+        self.pattern = lexer.pattern
+        self.token_functions = lexer.token_functions
+
+    def extract(self, steps):
+        token = self._token(0)
+        end, results = self._find(token, steps)
+        token = self._token(end)
+        if token.type != "EOF":
+            raise self._error(token)
+        return results
+
+    def _token(self, pos):
+        text = self.text
+        pos = _SPACE_PATTERN.match(text, pos).end()
+        if pos >= len(text):
+            return Token("EOF", len(text), "", None)
+
+        m = self.pattern.match(text, pos)
+        if m is None:
+            return Token("UNKNOWN", pos, text[pos:], text[pos:])
+        token_type = m.lastgroup
+        token = Token(token_type, pos, m.group(), m.group())
+        fn = self.token_functions[token_type]
+        if fn is not None:
+            token = fn(token)
+        return token
+
+    def _error(self, token, base = 0):
+        token.offset += base
+        return ParseError(token, LineIndex(self.text).location(token.offset))
+
+    def _find(self, token, steps):
+        """Returns the offset after the value starting with `token` and
+        a list of values in it selected by `steps`.
+        """
+        if not steps:
+            return self._extract(token)
+
+        step = steps[0]
+        if token.type == "LBRACKET" and (step is WILDCARD or isinstance(step, int)):
+            return self._find_in_list(token, step, steps[1:])
+        if token.type == "LBRACE" and not isinstance(step, int):
+            return self._find_in_dict(token, step, steps[1:])
+        return self._skip(token), []
+
+    def _find_in_list(self, token, step, steps):
+        results = []
+        index = 0
+        pos = token.offset + 1
+
+        while True:
+            token = self._token(pos)
+            token_type = token.type
+
+            if token_type == "RBRACKET":
+                return token.offset + 1, results
+            elif token_type in Parser.SEPARATOR_TOKENS and index > 0:
+                pos = token.offset + 1
+                continue
+
+            if step is WILDCARD or step == index:
+                pos, found = self._find(token, steps)
+                results.extend(found)
+                if step == index:
+                    # The rest of the list can't match.
+                    return self._skip_rest(pos, "["), results
+            else:
+                pos = self._skip(token)
+            index += 1
+
+    def _find_in_dict(self, token, step, steps):
+        # As in the parsed dictionary, the last value of a repeated key wins.
+        results = collections.OrderedDict()
+        entries = 0
+        pos = token.offset + 1
+
+        while True:
+            token = self._token(pos)
+            token_type = token.type
+
+            if token_type == "RBRACE":
+                return token.offset + 1, [
+                    value
+                    for found in results.values()
+                    for value in found
+                ]
+            elif token_type in Parser.SEPARATOR_TOKENS and entries > 0:
+                pos = token.offset + 1
+                continue
+            elif token_type not in Parser.KEY_TOKENS:
+                raise self._error(token)
+
+            key = token.value
+            token = self._token(token.offset + len(token.text))
+            if token.type in Parser.KEY_SEPARATOR_TOKENS:
+                token = self._token(token.offset + 1)
+
+            if step is WILDCARD or step == key:
+                pos, results[key] = self._find(token, steps)
+            else:
+                pos = self._skip(token)
+            entries += 1
+
+    def _skip(self, token):
+        """Returns the offset after the value starting with `token`.
+        """
+        if token.type in Parser.SCALAR_TOKENS:
+            return token.offset + len(token.text)
+        if token.type != "LBRACKET" and token.type != "LBRACE":
+            raise self._error(token)
+        return self._skip_rest(token.offset + 1, token.text)
+
+    def _skip_rest(self, pos, bracket):
+        """Returns the offset after the end of the container opened by
+        `bracket`, `pos` being inside it.
+        """
+        text = self.text
+        skip = _SKIP_PATTERN.match
+        closing = _CLOSING_BRACKETS
+        stack = [bracket]
+
+        while True:
+            pos = skip(text, pos).end()
+            c = text[pos:pos + 1]
+            if c == "[" or c == "{":
+                stack.append(c)
+            elif c and c == closing[stack[-1]]:
+                stack.pop()
+                if not stack:
+                    return pos + 1
+            else:
+                raise self._error(self._token(pos))
+            pos += 1
+
+    def _extract(self, token):
+        if token.type in Parser.SCALAR_TOKENS:
+            return token.offset + len(token.text), [token.value]
+
+        start = token.offset
+        end = self._skip(token)
+        value = Parser().parse_tokens(Lexer().tokenize(self.text[start:end]))
+        if isinstance(value, ParseError):
+            raise self._error(value.token, start)
+        return end, [value]
+
+
+_ESCAPE_PATTERN = re.compile(r'[\\"\n\r\t\x08\x0c]')
+_ESCAPES = {
+    "\\": "\\\\",
+    "\"": "\\\"",
+    "\n": "\\n",
+    "\r": "\\r",
+    "\t": "\\t",
+    "\x08": "\\b",
+    "\x0c": "\\f",
+}
+
+
+def _escape_match(match):
+    return _ESCAPES[match.group()]
+
+
+if str is bytes:
+    # Python 2
+    _INTEGER_TYPES = (int, long, )
+
+    def _native_string(value):
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        return value
+else:
+    _INTEGER_TYPES = (int, )
+
+    def _native_string(value):
+        return value
+
+
+class Writer(object):
+    """Extended JSON writer.
+
+    Writes values in a form which :class:`Parser` reads back as equal
+    values.
+
+    If `indent` is `None` (the default), the output is compact. Otherwise
+    every list item and dictionary entry goes on its own line and nested
+    values are indented by `indent` (a string or a number of spaces).
+
+    If `sort_keys` is true, dictionary entries are written ordered by key;
+    it can also be a function which returns a sort key for each dictionary
+    key.
+
+    :meth:`dump` writes the output to the file in chunks as it goes (one
+    write per `chunk_size` / 8 pending pieces, which is roughly `chunk_size`
+    characters), so the whole output is never held in memory.
+    """
+
+    def __init__(self, indent = None, sort_keys = False, chunk_size = DEFAULT_CHUNK_SIZE):
+        if isinstance(indent, int):
+            indent = " " * indent
+        self.indent = indent
+        self.sort_keys = sort_keys
+        self.chunk_size = chunk_size
+
+        self._parts = []
+        self._size = 0
+        self._output = None
+
+    def dumps(self, value):
+        """Returns `value` formatted as EJSON string.
+        """
+        self._parts = []
+        self._output = None
+        try:
+            self._write(value, 0)
+            return "".join(self._parts)
+        finally:
+            self._parts = []
+
+    def dump(self, value, f):
+        """Writes `value` formatted as EJSON to file object `f`.
+        """
+        self._parts = []
+        self._size = 0
+        self._output = f
+        try:
+            self._write(value, 0)
+            self._flush()
+        finally:
+            self._parts = []
+            self._output = None
+
+    def _flush(self):
+        self._output.write("".join(self._parts))
+        self._parts = []
+        self._size = 0
+
+    def _write(self, value, level):
+        parts = self._parts
+
+        if isinstance(value, TEXT_TYPES):
+            parts.append("\"" + _ESCAPE_PATTERN.sub(_escape_match, _native_string(value)) + "\"")
+        elif value is None:
+            parts.append("null")
+        elif value is True:
+            parts.append("true")
+        elif value is False:
+            parts.append("false")
+        elif isinstance(value, _INTEGER_TYPES):
+            parts.append(str(value))
+        elif isinstance(value, float):
+            if value != value or value in (float("inf"), float("-inf")):
+                raise ValueError("Value %r can't be written as EJSON." % (value, ))
+            parts.append(repr(value))
+        elif isinstance(value, (dict, Record)):
+            self._write_dict(value, level)
+        elif isinstance(value, (list, tuple, array.array)):
+            self._write_list(value, level)
+        else:
+            raise TypeError("Value of type %s can't be written as EJSON: %r." % (
+                type(value).__name__,
+                value,
+            ))
+
+    def _write_list(self, value, level):
+        parts = self._parts
+        if not value:
+            parts.append("[]")
+            return
+
+        if self.indent is None:
+            separator = ","
+            parts.append("[")
+        else:
+            separator = ",\n" + self.indent * (level + 1)
+            parts.append("[\n" + self.indent * (level + 1))
+
+        first = True
+        for item in value:
+            if first:
+                first = False
+            else:
+                parts.append(separator)
+            self._write(item, level + 1)
+            if self._output is not None and len(parts) >= self.chunk_size // 8:
+                self._flush()
+                parts = self._parts
+
+        if self.indent is None:
+            parts.append("]")
+        else:
+            parts.append("\n" + self.indent * level + "]")
+
+    def _write_dict(self, value, level):
+        parts = self._parts
+        if not value:
+            parts.append("{}")
+            return
+
+        if self.indent is None:
+            separator = ","
+            key_separator = ":"
+            parts.append("{")
+        else:
+            separator = ",\n" + self.indent * (level + 1)
+            key_separator = ": "
+            parts.append("{\n" + self.indent * (level + 1))
+
+        items = value.items()
+        if self.sort_keys:
+            if callable(self.sort_keys):
+                sort_key = self.sort_keys
+            else:
+                sort_key = None
+            items = sorted(items, key = lambda item: item[0] if sort_key is None else sort_key(item[0]))
+
+        first = True
+        for key, item in items:
+            if first:
+                first = False
+            else:
+                parts.append(separator)
+
+            if isinstance(key, TEXT_TYPES):
+                parts.append("\"" + _ESCAPE_PATTERN.sub(_escape_match, _native_string(key)) + "\"")
+            elif key is None or key is True or key is False:
+                # Keyword keys, such as in { true: 1 }
+                self._write(key, level + 1)
+            else:
+                raise TypeError("Dictionary key %r can't be written as EJSON." % (key, ))
+
+            parts.append(key_separator)
+            self._write(item, level + 1)
+            if self._output is not None and len(parts) >= self.chunk_size // 8:
+                self._flush()
+                parts = self._parts
+
+        if self.indent is None:
+            parts.append("}")
+        else:
+            parts.append("\n" + self.indent * level + "}")
+
+
+def dumps(value, indent = None, sort_keys = False):
+    """Returns `value` formatted as EJSON string (see :class:`Writer`).
+    """
+    return Writer(indent, sort_keys).dumps(value)
+
+
+def dump(value, f, indent = None, sort_keys = False, chunk_size = DEFAULT_CHUNK_SIZE):
+    """Writes `value` formatted as EJSON to file object `f` (see
+    :class:`Writer`).
+    """
+    Writer(indent, sort_keys, chunk_size).dump(value, f)
+
+
+def iterparse(f, items = False, chunk_size = DEFAULT_CHUNK_SIZE):
+    """Shortcut for :meth:`Parser.iterparse`. `f` can be a file object
+    or a file name.
+    """
+    if isinstance(f, TEXT_TYPES):
+        with open(f, "r") as opened:
+            for value in Parser().iterparse(opened, items, chunk_size):
+                yield value
+        return
+
+    for value in Parser().iterparse(f, items, chunk_size):
+        yield value
+
+
+def _parse_file_checked(file_name):
+    value = Parser().parse_file(file_name)
+    if isinstance(value, ParseError):
+        raise value
+    return value
+
+
+def _iter_parsed_files(file_names, workers, as_completed, min_parallel):
+    futures = None
+    if workers != 1 and len(file_names) >= min_parallel:
+        try:
+            import concurrent.futures as futures
+        except ImportError:
+            pass
+
+    if futures is None:
+        for index, file_name in enumerate(file_names):
+            yield index, _parse_file_checked(file_name)
+        return
+
+    with futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        pending = dict(
+            (executor.submit(_parse_file_checked, file_name), index)
+            for index, file_name in enumerate(file_names)
+        )
+        try:
+            if as_completed:
+                for future in futures.as_completed(pending):
+                    yield pending[future], future.result()
+            else:
+                for future, index in sorted(pending.items(), key = lambda item: item[1]):
+                    yield index, future.result()
+        finally:
+            # Don't wait for the rest of the batch after an error.
+            for future in pending:
+                future.cancel()
+
+
+def parse_files(file_names, workers = None, as_completed = False, min_parallel = PARALLEL_MIN_FILES):
+    """Parses many EJSON files using a pool of `workers` processes
+    (by default one per CPU).
+
+    Returns a list of the parsed values in the order of `file_names`.
+    If `as_completed` is true, returns an iterator of `(file_name, value)`
+    pairs in the order in which the files are parsed instead.
+
+    Syntax errors are raised as :class:`ParseError` with its
+    :attr:`~ParseError.file_name` set; other errors (such as a missing
+    file) propagate unchanged.
+
+    Batches of fewer than `min_parallel` files, `workers` equal to 1
+    and Python versions without :mod:`concurrent.futures` parse the files
+    serially in the calling process, since starting the pool would take
+    longer than parsing.
+    """
+    file_names = list(file_names)
+    results = _iter_parsed_files(file_names, workers, as_completed, min_parallel)
+
+    if as_completed:
+        return ((file_names[index], value) for index, value in results)
+    return [value for index, value in results]
+
+
+def extract(source, path):
+    """Returns a list of the values selected by `path` in EJSON `source`
+    (a string or a file object), without parsing the rest of it.
+
+    The path is a sequence of steps: `.key` selects a value from
+    a dictionary (the first key doesn't need the dot), `[n]` an item of
+    a list and `*` or `[*]` all values of a dictionary or list; keys
+    containing special characters can be written as `["key"]`::
+
+        extract(text, "configurations[0].children[*].key")
+
+    The path can also be a list of steps (see :func:`parse_path`).
+    Values which don't have the selected key or item are skipped. An
+    empty path selects the whole document.
+
+    The parts of the document outside of the selected values are only
+    checked for balanced brackets, strings and comments. Syntax errors
+    are raised as :class:`ParseError`.
+    """
+    if hasattr(source, "read"):
+        source = source.read()
+    if isinstance(path, TEXT_TYPES):
+        path = parse_path(path)
+    return _Extractor(source).extract(list(path))
 
 
 def main():
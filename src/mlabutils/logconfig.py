@@ -0,0 +1,212 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""mlabutils.logconfig module.
+
+Logging setup from the ``logging`` section of configuration files, a list
+of sinks::
+
+    "logging": [
+        { "file_name": "radio-observer.log", "log_level": "debug",
+          "buffer": 1000, "max_bytes": 10485760, "backup_count": 5 },
+        { "file_name": "-", "log_level": "warning" },
+    ],
+
+Options of a sink:
+
+* ``file_name`` -- log file, ``"-"`` stands for standard error output,
+* ``log_level`` -- least level of logged records (``"debug"``,
+  ``"info"``, ``"warning"``, ``"error"``, ``"critical"`` or a number),
+  ``"info"`` by default,
+* ``format`` -- :class:`logging.Formatter` format string,
+* ``max_bytes`` and ``backup_count`` -- the file is rotated when it
+  reaches `max_bytes` bytes, keeping `backup_count` old files (5 by
+  default),
+* ``buffer`` -- records are kept in memory and written in batches of this
+  many records, or as soon as a record of ``flush_level`` (``"error"`` by
+  default) comes.
+
+Records are checked against the level of each sink before they are
+formatted, and the logger level is set to the lowest level of the sinks,
+so records no sink wants aren't even created. Sinks with the same format
+share a :class:`Formatter` which formats each record only once. To defer
+expensive computation of message arguments until a sink actually writes
+the record, wrap it in :class:`Lazy`::
+
+    logger.debug("Spectrum: %s", Lazy(format_spectrum, spectrum))
+
+"""
+
+
+import logging
+import logging.handlers
+import sys
+
+from mlabutils.asynclog import write_batch
+
+
+DEFAULT_FORMAT = "%(asctime)s   %(process)s  %(name)s  %(levelname)s  %(message)s"
+
+# File name of the standard error output
+STDERR = "-"
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "warning": logging.WARNING,
+    "warn": logging.WARNING,
+    "error": logging.ERROR,
+    "critical": logging.CRITICAL,
+}
+
+SINK_OPTIONS = ("file_name", "log_level", "format", "max_bytes", "backup_count", "buffer", "flush_level", )
+
+
+def get_level(level):
+    """Returns the number of logging level `level`, given by its name
+    (case insensitive) or number.
+    """
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[level.lower()]
+    except (KeyError, AttributeError):
+        raise ValueError("Unknown log level %r." % (level, ))
+
+
+class Lazy(object):
+    """Log message argument which calls `function` with `args` and
+    `kwargs` only when the message is formatted. The result is kept.
+    """
+
+    __slots__ = ("function", "args", "kwargs", "_value", )
+
+    _MISSING = object()
+
+    def __init__(self, function, *args, **kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self._value = self._MISSING
+
+    @property
+    def value(self):
+        if self._value is self._MISSING:
+            self._value = self.function(*self.args, **self.kwargs)
+        return self._value
+
+    def __str__(self):
+        return str(self.value)
+
+    def __repr__(self):
+        return repr(self.value)
+
+
+class Formatter(logging.Formatter):
+    """:class:`logging.Formatter` which keeps the text of the last record
+    it formatted, so that handlers sharing it format the record only
+    once.
+    """
+
+    def format(self, record):
+        formatted = record.__dict__.get("_formatted")
+        if formatted is not None and formatted[0] is self:
+            return formatted[1]
+        text = logging.Formatter.format(self, record)
+        record._formatted = (self, text, )
+        return text
+
+
+class BufferedHandler(logging.handlers.MemoryHandler):
+    """:class:`logging.handlers.MemoryHandler` which writes the buffered
+    records to its target in one batch (see
+    :func:`mlabutils.asynclog.write_batch`). Closing it closes the target
+    as well.
+    """
+
+    def flush(self):
+        self.acquire()
+        try:
+            if self.target is not None and self.buffer:
+                write_batch(self.target, self.buffer)
+                self.buffer = []
+        finally:
+            self.release()
+
+    def close(self):
+        target = self.target
+        # Flushes the buffer and forgets the target
+        logging.handlers.MemoryHandler.close(self)
+        if target is not None:
+            target.close()
+
+
+def create_handler(sink, formatter = None):
+    """Returns a handler for logging sink `sink` (a dictionary of options
+    described in the module documentation). The handler uses `formatter`
+    if given, otherwise a new :class:`Formatter` of the sink's format.
+    """
+    unknown = [ key for key in sink if key not in SINK_OPTIONS ]
+    if unknown:
+        raise ValueError("Unknown logging sink options: %s." % (", ".join(sorted(unknown)), ))
+
+    file_name = sink.get("file_name")
+    if file_name is None:
+        raise ValueError("Logging sink without file_name.")
+    level = get_level(sink.get("log_level", "info"))
+
+    if file_name == STDERR:
+        handler = logging.StreamHandler(sys.stderr)
+    elif sink.get("max_bytes"):
+        handler = logging.handlers.RotatingFileHandler(
+            file_name,
+            maxBytes = sink["max_bytes"],
+            backupCount = sink.get("backup_count", 5))
+    else:
+        handler = logging.FileHandler(file_name)
+
+    if formatter is None:
+        formatter = Formatter(sink.get("format", DEFAULT_FORMAT))
+    handler.setFormatter(formatter)
+
+    if sink.get("buffer"):
+        # The buffer filters the records, so that it only fills up with
+        # records which will be written
+        handler = BufferedHandler(
+            sink["buffer"],
+            flushLevel = get_level(sink.get("flush_level", "error")),
+            target = handler)
+    handler.setLevel(level)
+    return handler
+
+
+def configure(sinks, logger = None, format = DEFAULT_FORMAT):
+    """Adds handlers for logging sinks `sinks` (the ``logging`` section of
+    configuration) to `logger` (the root logger by default) and sets its
+    level to the lowest level of the sinks. `format` is the default format
+    of the sinks. Returns the handlers.
+    """
+    if logger is None:
+        logger = logging.getLogger()
+
+    formatters = {}
+    handlers = []
+    for sink in sinks:
+        sink_format = sink.get("format", format)
+        formatter = formatters.get(sink_format)
+        if formatter is None:
+            formatter = formatters[sink_format] = Formatter(sink_format)
+        handlers.append(create_handler(sink, formatter))
+
+    for handler in handlers:
+        logger.addHandler(handler)
+    if handlers:
+        logger.setLevel(min(handler.level for handler in handlers))
+    return handlers
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,405 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""mlabutils.watch module.
+
+Watching of config files and reloading of changed configuration in
+running applications::
+
+    from mlabutils import watch
+
+    reloader = watch.ConfigReloader("radio-observer.json")
+    objects = reloader.load()
+
+    while True:
+        delta = reloader.wait(1.0)
+        if delta is not None:
+            for obj in delta.removed:
+                obj.close()
+            objects = delta.objects
+
+Changes are detected with inotify on Linux and by polling the
+modification time of the file elsewhere. Only objects whose configuration
+changed are built again, the rest is reused from the previous build.
+
+"""
+
+
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+from mlabutils import config, ejson
+from mlabutils.utils import getClassLogger
+
+
+# inotify constants from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# Events in the directory of a watched file which may change the file.
+# (Editors often write a new file and rename it over the old one.)
+# IN_MODIFY is left out, so that half-written files aren't read.
+INOTIFY_MASK = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+    if _libc is None:
+        library = ctypes.util.find_library("c")
+        if library is None:
+            raise OSError("C library not found.")
+        libc = ctypes.CDLL(library, use_errno = True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify is not available.")
+        _libc = libc
+    return _libc
+
+
+def _fs_encode(file_name):
+    if isinstance(file_name, bytes):
+        return file_name
+    return file_name.encode(sys.getfilesystemencoding() or "utf-8")
+
+
+class PollingWatcher(object):
+    """Detects changes of file `file_name` by checking its modification
+    time, size and inode every `interval` seconds.
+    """
+
+    def __init__(self, file_name, interval = 1.0):
+        self.file_name = file_name
+        self.interval = interval
+        self._key = self._get_key()
+
+    def _get_key(self):
+        try:
+            stat = os.stat(self.file_name)
+        except OSError:
+            return None
+        return (stat.st_mtime, stat.st_size, stat.st_ino, )
+
+    def wait(self, timeout = None):
+        """Waits until the file (possibly) changes or `timeout` seconds
+        pass. Returns true if it changed.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            key = self._get_key()
+            if key != self._key:
+                self._key = key
+                return True
+
+            delay = self.interval
+            if deadline is not None:
+                delay = min(delay, deadline - time.time())
+                if delay <= 0:
+                    return False
+            time.sleep(delay)
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher(object):
+    """Detects changes of file `file_name` with inotify (Linux only).
+
+    The directory of the file is watched, so that the file may also be
+    replaced, deleted or created again. Raises :class:`OSError` if inotify
+    is not available.
+    """
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._name = _fs_encode(os.path.basename(file_name))
+
+        libc = _get_libc()
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+
+        directory = _fs_encode(os.path.dirname(os.path.abspath(file_name)))
+        if libc.inotify_add_watch(self._fd, ctypes.c_char_p(directory), INOTIFY_MASK) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            self._fd = None
+            raise OSError(error, os.strerror(error), directory)
+
+    def wait(self, timeout = None):
+        """Waits until the file (possibly) changes or `timeout` seconds
+        pass. Returns true if it changed.
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            remaining = None
+            if deadline is not None:
+                remaining = max(0, deadline - time.time())
+            try:
+                readable = select.select([self._fd], [], [], remaining)[0]
+            except select.error as e:
+                if e.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not readable:
+                return False
+            if self._read_events():
+                return True
+
+    def _read_events(self):
+        # Reads all pending events, returns true if any is about the file.
+        changed = False
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EINTR):
+                    return changed
+                raise
+
+            pos = 0
+            while pos < len(data):
+                wd, mask, cookie, length = _INOTIFY_EVENT.unpack_from(data, pos)
+                pos += _INOTIFY_EVENT.size
+                name = data[pos:pos + length].rstrip(b"\0")
+                pos += length
+                if mask & IN_Q_OVERFLOW or name == self._name:
+                    changed = True
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def create_watcher(file_name, interval = 1.0):
+    """Returns an :class:`InotifyWatcher` of file `file_name` if inotify is
+    available, otherwise a :class:`PollingWatcher` checking the file every
+    `interval` seconds.
+    """
+    try:
+        return InotifyWatcher(file_name)
+    except (OSError, AttributeError):
+        return PollingWatcher(file_name, interval)
+
+
+class Delta(object):
+    """Changes of configuration found by :class:`ConfigReloader`.
+
+    .. attribute:: patch
+
+       Patch from the old to the new parsed configuration, as returned
+       by :func:`mlabutils.config.diff`.
+
+    .. attribute:: config
+
+       The new parsed configuration.
+
+    .. attribute:: objects
+
+       Objects built from the new configuration.
+
+    .. attribute:: created
+
+       List of objects created for the new configuration.
+
+    .. attribute:: removed
+
+       List of objects of the old configuration which aren't part of the
+       new one. The application should release them.
+    """
+
+    def __init__(self, patch, config, record):
+        self.patch = patch
+        self.config = config
+        self.objects = record.result
+        self.created = record.created
+        self.removed = record.removed
+
+
+class ConfigReloader(object):
+    """Reloads configuration file `file_name` when it changes.
+
+    The file is parsed again only if its contents changed (not just its
+    modification time). Objects are built by `builder` (by default
+    :attr:`mlabutils.config.DEFAULT_BUILDER`) with
+    :meth:`~mlabutils.config.Builder.rebuild`, so only the objects whose
+    configuration changed are created again.
+
+    Symbolic links in `file_name` are resolved first, so the file they
+    point to is watched.
+
+    .. attribute:: config
+
+       The current parsed configuration.
+
+    .. attribute:: objects
+
+       Objects built from the current configuration.
+    """
+
+    def __init__(self, file_name, builder = None, interval = 1.0):
+        self.file_name = os.path.realpath(file_name)
+        self.builder = builder
+        if self.builder is None:
+            self.builder = config.DEFAULT_BUILDER
+        self.interval = interval
+
+        self.config = None
+        self.objects = None
+
+        self._record = None
+        self._digest = None
+        self._watcher = None
+        self._thread = None
+        self._stop = threading.Event()
+
+        self.logger = getClassLogger(self)
+
+    def load(self):
+        """Reads, parses and builds the config file. Returns the built
+        objects. Syntax errors are raised as
+        :class:`mlabutils.ejson.ParseError`.
+        """
+        digest, value = self._read()
+        if isinstance(value, ejson.ParseError):
+            raise value
+        self._apply(digest, value)
+        return self.objects
+
+    def check(self):
+        """Reloads the config file if it changed since it was last loaded.
+
+        Returns a :class:`Delta` of the changes, or None if the file
+        didn't change. If the file can't be read, parsed or built, the
+        error is logged and the current configuration is kept.
+        """
+        try:
+            digest, value = self._read()
+        except (IOError, OSError) as e:
+            self.logger.warning("Can't read config file %s: %s", self.file_name, e)
+            return None
+        except Exception:
+            self.logger.exception("Can't parse config file %s.", self.file_name)
+            return None
+        if digest == self._digest:
+            return None
+        if isinstance(value, ejson.ParseError):
+            self.logger.warning("Can't parse config file: %s", value)
+            return None
+
+        old = self.config
+        try:
+            self._apply(digest, value)
+        except Exception:
+            self.logger.exception(
+                "Can't build configuration from %s, keeping the previous one.", self.file_name)
+            return None
+        delta = Delta(config.diff(old, value), value, self._record)
+        self.logger.info(
+            "Reloaded config file %s: %d changes, %d objects created, %d removed.",
+            self.file_name, len(delta.patch), len(delta.created), len(delta.removed))
+        return delta
+
+    def wait(self, timeout = None):
+        """Waits until the config file changes (and reloads it) or
+        `timeout` seconds pass. Returns a :class:`Delta` of the changes,
+        or None.
+        """
+        if self._watcher is None:
+            self._watcher = create_watcher(self.file_name, self.interval)
+        if not self._watcher.wait(timeout):
+            return None
+        return self.check()
+
+    def start(self, callback):
+        """Starts a daemon thread which reloads the config file whenever it
+        changes and calls `callback` with the :class:`Delta` (in that
+        thread).
+        """
+        if self._watcher is None:
+            self._watcher = create_watcher(self.file_name, self.interval)
+        self._stop.clear()
+        self._thread = threading.Thread(target = self._run, args = (callback, ))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the thread started by :meth:`start` and the watcher.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+
+    def _run(self, callback):
+        # Catch changes made before the watcher was created
+        delta = self.check()
+        while not self._stop.is_set():
+            if delta is not None:
+                try:
+                    callback(delta)
+                except Exception:
+                    self.logger.exception("Error while applying changed configuration.")
+            try:
+                delta = self.wait(self.interval)
+            except Exception:
+                # Errors in the config file are handled by check(), keep
+                # watching after anything else too
+                self.logger.exception("Error while watching config file %s.", self.file_name)
+                delta = None
+                self._stop.wait(self.interval)
+
+    def _read(self):
+        with open(self.file_name, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).digest()
+        if digest == self._digest:
+            return digest, None
+
+        if not isinstance(data, str):
+            data = data.decode("utf-8")
+        value = ejson.Parser().parse_string(data)
+        if isinstance(value, ejson.ParseError):
+            value.file_name = self.file_name
+        return digest, value
+
+    def _apply(self, digest, value):
+        self._record = self.builder.rebuild(value, self._record)
+        self._digest = digest
+        self.config = value
+        self.objects = self._record.result
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
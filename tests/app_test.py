@@ -6,11 +6,27 @@
 """
 
 
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
 import unittest
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 from mlabutils import app
 
 
+# Modules which mlabutils.app must not import until they are needed
+HEAVY_MODULES = ("argparse", "daemon", "lockfile", "mlabutils.config", "mlabutils.ejson", "mlabutils.watch", )
+
+
 class CLIAppBaseTest(unittest.TestCase):
     APP_NAME = "test_app"
 
@@ -27,6 +43,213 @@ class DaemonAppBase(CLIAppBaseTest):
     APP_NAME = "test_daemon"
 
 
+class ConfigApp(app.CLIAppBase):
+    def setup_app(self):
+        self.loads = 0
+        self.loads_before_run = None
+
+    def setup_logging(self):
+        pass
+
+    def load_config(self, file_name):
+        self.loads += 1
+        return app.CLIAppBase.load_config(self, file_name)
+
+    def run(self):
+        self.loads_before_run = self.loads
+        return self.config["value"]
+
+
+class FakeDaemonContext(object):
+    """Changes the working directory like :class:`daemon.DaemonContext`,
+    but doesn't fork.
+    """
+
+    def __init__(self):
+        self.pidfile = self
+
+    def is_locked(self):
+        return False
+
+    def __enter__(self):
+        self.cwd = os.getcwd()
+        os.chdir("/")
+
+    def __exit__(self, *exc_info):
+        os.chdir(self.cwd)
+
+
+class ConfigDaemon(app.DaemonAppBase):
+    def setup_app(self):
+        app.DaemonAppBase.setup_app(self)
+        self.daemon_context = FakeDaemonContext()
+        self.value = None
+
+    def setup_logging(self):
+        pass
+
+    def run_daemon(self):
+        self.value = self.config["value"]
+
+
+class StartupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "app.conf")
+        with open(self.file_name, "w") as f:
+            f.write("{ value: 3 }")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lazy_imports(self):
+        src = os.path.dirname(os.path.dirname(os.path.abspath(app.__file__)))
+        code = "; ".join([
+            "import sys",
+            "import mlabutils.app",
+            "app = mlabutils.app.CLIAppBase('test')",
+            "print(' '.join(name for name in %r if name in sys.modules))" % (HEAVY_MODULES, ),
+        ])
+        env = dict(os.environ, PYTHONPATH = src)
+        output = subprocess.check_output([ sys.executable, "-c", code ], env = env)
+        self.assertEquals("", output.decode("ascii").strip())
+
+    def test_deferred_config(self):
+        test_app = ConfigApp(app_name = "test_app")
+        self.assertRaises(SystemExit, test_app.main, [ "-c", self.file_name ])
+        self.assertEquals(0, test_app.loads_before_run)
+        self.assertEquals(1, test_app.loads)
+        self.assertEquals({ "value": 3 }, test_app.config)
+        self.assertEquals(1, test_app.loads)
+
+    def test_daemon_relative_config(self):
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            test_app = ConfigDaemon(app_name = "test_daemon")
+            test_app.main([ "-c", "app.conf" ])
+        finally:
+            os.chdir(cwd)
+        self.assertEquals(3, test_app.value)
+
+    def test_config_setter(self):
+        test_app = ConfigApp(app_name = "test_app")
+        test_app.setup_app()
+        test_app.parse_args([ "-c", self.file_name ])
+        self.assertTrue(test_app.read_config())
+        test_app.config = { "value": 4 }
+        self.assertEquals({ "value": 4 }, test_app.config)
+        self.assertEquals(0, test_app.loads)
+
+
+class LoggingApp(app.CLIAppBase):
+    def setup_app(self):
+        self.loads = 0
+
+    def get_default_log_filename(self):
+        return self.log_file_name
+
+    def load_config(self, file_name):
+        self.loads += 1
+        return app.CLIAppBase.load_config(self, file_name)
+
+    def run(self):
+        for i in range(100):
+            self.logger.info("Record %d.", i)
+        self.logger.warning("Warning.")
+        return 0
+
+
+class LoggingTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.handlers = logging.root.handlers
+        self.level = logging.root.level
+
+    def tearDown(self):
+        for handler in logging.root.handlers:
+            handler.close()
+        logging.root.handlers = self.handlers
+        logging.root.setLevel(self.level)
+        shutil.rmtree(self.directory)
+
+    def test_async_logging(self):
+        test_app = LoggingApp(app_name = "test_app")
+        test_app.log_file_name = os.path.join(self.directory, "test_app.log")
+        test_app.async_logging = True
+        test_app.async_logging_options = { "batch_size": 16 }
+
+        self.assertRaises(SystemExit, test_app.main, [])
+        self.assertIsNone(test_app._async_log_handler)
+        self.assertEquals([ logging.FileHandler ], [ type(handler) for handler in logging.root.handlers ])
+
+        with open(test_app.log_file_name) as f:
+            lines = f.read().splitlines()
+        self.assertEquals(
+            [ "Record %d." % (i, ) for i in range(100) ] + [ "Warning.", "Exiting with code 0." ],
+            [ line.split("  ")[-1] for line in lines ])
+
+    def test_logging_section(self):
+        test_app = LoggingApp(app_name = "test_app")
+        test_app.log_file_name = os.path.join(self.directory, "default.log")
+        log_file_name = os.path.join(self.directory, "test_app.log")
+        config_file_name = os.path.join(self.directory, "app.conf")
+        with open(config_file_name, "w") as f:
+            f.write("{ logging: [ { file_name: %s, log_level: warning, format: \"%%(message)s\" } ] }" % (
+                json.dumps(log_file_name), ))
+
+        self.assertRaises(SystemExit, test_app.main, [ "-c", config_file_name ])
+        self.assertEquals(0, test_app.loads)
+        self.assertFalse(os.path.exists(test_app.log_file_name))
+        with open(log_file_name) as f:
+            self.assertEquals("Warning.\n", f.read())
+
+    def test_broken_config(self):
+        test_app = LoggingApp(app_name = "test_app")
+        test_app.log_file_name = os.path.join(self.directory, "default.log")
+        config_file_name = os.path.join(self.directory, "app.conf")
+        with open(config_file_name, "w") as f:
+            f.write("{ a: 1, b: }")
+
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, test_app.main, [ "-c", config_file_name ])
+            output = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertIn(
+            "Can't read logging config: %s: Unexpected token at line 1, column 12: '}'.\n" % (config_file_name, ),
+            output)
+        with open(test_app.log_file_name) as f:
+            self.assertTrue(f.read().splitlines()[-1].endswith("  Exiting with code 0."))
+
+    def test_setup_logging_again(self):
+        config_file_name = os.path.join(self.directory, "app.conf")
+        with open(config_file_name, "w") as f:
+            f.write("{ logging: [ { file_name: \"app.log\", format: \"%(message)s\", buffer: 100 } ] }")
+
+        cwd = os.getcwd()
+        os.chdir(self.directory)
+        try:
+            test_app = LoggingApp(app_name = "test_app")
+            test_app.setup_app()
+            test_app.parse_args([ "-c", "app.conf" ])
+            test_app.read_config()
+            test_app.setup_logging()
+            test_app.logger.info("Before.")
+        finally:
+            os.chdir(cwd)
+
+        # Like in a daemon, which changes the working directory
+        test_app.setup_logging()
+        test_app.logger.info("After.")
+        test_app.close_log_handlers()
+
+        with open(os.path.join(self.directory, "app.log")) as f:
+            self.assertEquals("Before.\nAfter.\n", f.read())
+
+
 def main():
     print(__doc__)
 
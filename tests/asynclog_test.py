@@ -0,0 +1,221 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.asynclog_test module.
+"""
+
+
+import logging
+import threading
+import unittest
+
+from mlabutils import asynclog
+
+
+class ListHandler(logging.Handler):
+    """Collects formatted messages. Once `gate` is set, it waits until
+    the gate opens before handling each record.
+    """
+
+    def __init__(self, level = logging.NOTSET):
+        logging.Handler.__init__(self, level)
+        self.messages = []
+        self.gate = None
+        self.entered = threading.Event()
+
+    def emit(self, record):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.messages.append(self.format(record))
+
+
+class CountingStream(object):
+    def __init__(self):
+        self.writes = []
+        self.gate = None
+        self.entered = threading.Event()
+
+    def write(self, data):
+        self.entered.set()
+        if self.gate is not None:
+            self.gate.wait()
+        self.writes.append(data)
+
+    def flush(self):
+        pass
+
+
+class AsyncHandlerTest(unittest.TestCase):
+    def setUp(self):
+        # Not registered in the logging module, so no one else adds handlers
+        self.logger = logging.Logger("asynclog_test", logging.DEBUG)
+        self.logger.propagate = False
+        self.target = ListHandler()
+        self.logger.addHandler(self.target)
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+            handler.close()
+
+    def install(self, **kwargs):
+        handler = asynclog.install(self.logger, **kwargs)
+        self.addCleanup(asynclog.uninstall, handler, self.logger)
+        return handler
+
+    def block_target(self):
+        # Makes the background thread wait in the target handler
+        self.target.gate = threading.Event()
+        self.logger.info("first")
+        self.assertTrue(self.target.entered.wait(5))
+
+    def test_install(self):
+        handler = self.install()
+        self.assertEquals([ handler ], self.logger.handlers)
+
+        shared = [ 1 ]
+        self.logger.info("record %d %s", 1, shared)
+        shared.append(2)
+        try:
+            raise ValueError("error")
+        except ValueError:
+            self.logger.exception("failed")
+        handler.flush()
+
+        self.assertEquals("record 1 [1]", self.target.messages[0])
+        self.assertTrue(self.target.messages[1].startswith("failed\nTraceback"))
+        self.assertIn("ValueError: error", self.target.messages[1])
+
+        asynclog.uninstall(handler, self.logger)
+        self.assertEquals([ self.target ], self.logger.handlers)
+        self.logger.info("direct")
+        self.assertEquals("direct", self.target.messages[-1])
+
+    def test_close(self):
+        handler = self.install()
+        for i in range(1000):
+            self.logger.info("record %d", i)
+        handler.close()
+        self.assertEquals([ "record %d" % (i, ) for i in range(1000) ], self.target.messages)
+
+        # Records are handled directly after closing
+        self.logger.info("after")
+        self.assertEquals("after", self.target.messages[-1])
+
+    def test_level(self):
+        self.target.setLevel(logging.WARNING)
+        other = ListHandler(logging.INFO)
+        self.logger.addHandler(other)
+
+        handler = self.install()
+        self.assertEquals(logging.INFO, handler.level)
+        self.logger.debug("debug")
+        self.logger.info("info")
+        self.logger.warning("warning")
+        handler.flush()
+        self.assertEquals([ "warning" ], self.target.messages)
+        self.assertEquals([ "info", "warning" ], other.messages)
+
+    def test_drop(self):
+        handler = self.install(max_size = 10)
+        self.block_target()
+        for i in range(30):
+            self.logger.info("record %d", i)
+        self.assertEquals(20, handler.dropped)
+
+        # Warnings wait for space in the queue
+        timer = threading.Timer(0.1, self.target.gate.set)
+        timer.start()
+        self.logger.warning("kept")
+        timer.join()
+        handler.flush()
+        self.assertEquals(20, handler.dropped)
+        self.assertEquals(
+            [ "first" ] + [ "record %d" % (i, ) for i in range(10) ],
+            self.target.messages[:11])
+        self.assertEquals(
+            sorted([ "kept", "20 log records were dropped because the log queue was full." ]),
+            sorted(self.target.messages[11:]))
+
+    def test_drop_threads(self):
+        handler = self.install(max_size = 10)
+        self.block_target()
+
+        def log(index):
+            for i in range(500):
+                self.logger.info("record %d %d", index, i)
+            for i in range(500):
+                handler.enqueue(handler.prepare(self.logger.makeRecord(
+                    self.logger.name, logging.INFO, __file__, 0, "direct %d %d", (index, i), None)))
+
+        threads = [ threading.Thread(target = log, args = (i, )) for i in range(4) ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.target.gate.set()
+        handler.flush()
+
+        self.assertEquals(4 * 1000 - 10, handler.dropped)
+        self.assertEquals(1 + 10 + 1, len(self.target.messages))
+
+    def test_block(self):
+        handler = self.install(max_size = 10, overflow = asynclog.BLOCK)
+        self.block_target()
+        timer = threading.Timer(0.1, self.target.gate.set)
+        timer.start()
+        for i in range(30):
+            self.logger.info("record %d", i)
+        timer.join()
+        handler.flush()
+        self.assertEquals(0, handler.dropped)
+        self.assertEquals([ "first" ] + [ "record %d" % (i, ) for i in range(30) ], self.target.messages)
+
+    def test_sample(self):
+        handler = self.install(max_size = 10, overflow = asynclog.SAMPLE, sample_every = 5)
+        self.block_target()
+        timer = threading.Timer(0.1, self.target.gate.set)
+        timer.start()
+        for i in range(15):
+            self.logger.info("record %d", i)
+        timer.join()
+        handler.flush()
+
+        # Records 10 to 13 overflow and are dropped, record 14 waits
+        self.assertEquals(4, handler.dropped)
+        self.assertEquals(
+            [ "first" ] + [ "record %d" % (i, ) for i in range(10) ],
+            self.target.messages[:11])
+        self.assertEquals(
+            sorted([ "record 14", "4 log records were dropped because the log queue was full." ]),
+            sorted(self.target.messages[11:]))
+
+    def test_batch(self):
+        if not hasattr(logging.StreamHandler, "terminator"):
+            self.skipTest("batched writes need Python 3")
+
+        stream = CountingStream()
+        stream.gate = threading.Event()
+        self.logger.removeHandler(self.target)
+        self.logger.addHandler(logging.StreamHandler(stream))
+        handler = self.install()
+
+        self.logger.info("first")
+        self.assertTrue(stream.entered.wait(5))
+        for i in range(100):
+            self.logger.info("record %d", i)
+        stream.gate.set()
+        handler.flush()
+
+        self.assertEquals([ "first\n", "".join("record %d\n" % (i, ) for i in range(100)) ], stream.writes)
+
+    def test_invalid_overflow(self):
+        self.assertRaises(ValueError, asynclog.AsyncHandler, [], overflow = "wait")
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.bejson_test module.
+"""
+
+
+import io
+import unittest
+
+from mlabutils import bejson, ejson
+
+
+class BinaryEJSONTest(unittest.TestCase):
+    def assertRoundTrip(self, value):
+        self.assertEquals(value, bejson.loads(bejson.dumps(value)))
+
+    def test_scalars(self):
+        for value in (None, True, False, 0, -1, 2 ** 40, -2 ** 70, 10 ** 30, 1.5, -0.25, "", "abc"):
+            self.assertRoundTrip(value)
+
+    def test_containers(self):
+        self.assertRoundTrip([])
+        self.assertRoundTrip({})
+        self.assertRoundTrip([ 1, [ 2, [ 3, {} ] ], { "a": [ "b", None ] } ])
+        self.assertRoundTrip({ "a": { "a": "a" }, True: 1, None: 2 })
+
+    def test_types_preserved(self):
+        value = bejson.loads(bejson.dumps([ 1, 1.0, True ]))
+        self.assertEquals([ int, float, bool ], [ type(v) for v in value ])
+
+    def test_string_table(self):
+        data = bejson.dumps([ "factory" ] * 100)
+        self.assertEquals(1, data.count(b"factory"))
+
+    def test_file(self):
+        value = ejson.Parser().parse_file("tests/radio-observer.json")
+
+        f = io.BytesIO()
+        bejson.dump(value, f)
+        f.seek(0)
+        self.assertEquals(value, bejson.load(f))
+
+    def test_compact(self):
+        text = u"{ stations: [ { key: a, bands: [ 1, 2 ] }, { key: b, gains: [ 0.5 ] } ] }"
+        value = ejson.Parser(compact = True).parse_string(text)
+
+        self.assertEquals(ejson.Parser().parse_string(text), bejson.loads(bejson.dumps(value)))
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, bejson.loads, b"{}")
+        self.assertRaises(ValueError, bejson.loads, bejson.dumps(1) + b"\x00")
+        self.assertRaises(TypeError, bejson.dumps, object())
@@ -6,9 +6,23 @@ Author: Jan Milík <milikjan@fit.cvut.cz>
 """
 
 
+import copy
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
 import unittest
 
-from mlabutils import config
+try:
+	import concurrent.futures
+	HAS_FUTURES = True
+except ImportError:
+	HAS_FUTURES = False
+
+from mlabutils import config, ejson
 
 
 class LoadFileTest(unittest.TestCase):
@@ -16,3 +30,539 @@ class LoadFileTest(unittest.TestCase):
 		value = config.load_file("tests/radio-observer.json")
 		self.assertIsNotNone(value)
 
+	def test_load_file_without_cache(self):
+		value = config.load_file("tests/radio-observer.json", use_cache = False)
+		self.assertIsNotNone(value)
+
+	def test_load_deep_file(self):
+		directory = tempfile.mkdtemp()
+		try:
+			file_name = os.path.join(directory, "deep.json")
+			with open(file_name, "w") as f:
+				f.write("{ a: " * 10000 + "[ 1 ]" + " }" * 10000)
+
+			for i in range(2):
+				value = config.load_file(file_name)
+				for j in range(10000):
+					value = value["a"]
+				self.assertEquals([ 1 ], value)
+		finally:
+			shutil.rmtree(directory)
+
+
+class BuilderTest(unittest.TestCase):
+	def test_build_compact(self):
+		builder = config.Builder()
+		builder.add_factory("station", lambda c: ("station", c))
+
+		value = ejson.Parser(compact = True).parse_string(u"[ { factory: station, bands: [ 1, 2 ] } ]")
+		self.assertEquals(
+			[ ("station", { "factory": "station", "bands": [ 1, 2 ] }) ],
+			builder.build(value))
+
+
+	def _make_builder(self, **kwargs):
+		builder = config.Builder(**kwargs)
+		self.created = []
+		def factory(c):
+			self.created.append(c)
+			return Station(c)
+		builder.add_factory("station", factory)
+		return builder
+
+	def test_factory_keys(self):
+		builder = self._make_builder()
+		builder.add_factory("other", lambda c: "other")
+
+		records = []
+		handler = logging.Handler()
+		handler.emit = records.append
+		builder.logger.addHandler(handler)
+		try:
+			self.assertIsInstance(builder.build({ "type": "station" }), Station)
+			self.assertIsInstance(builder.build({ "type": "station", "factory": "other" }), Station)
+			self.assertEquals(1, len(records))
+			self.assertIsInstance(builder.build({ "type": "station", "factory": "station" }), Station)
+			self.assertEquals(1, len(records))
+		finally:
+			builder.logger.removeHandler(handler)
+
+	def test_cache(self):
+		builder = self._make_builder(use_cache = True)
+		value = ejson.Parser().parse_string(u"""[
+			{ factory: station, sink: { factory: station, path: "/dev/null" } },
+			{ factory: station, sink: { factory: station, path: "/dev/null" } },
+			{ factory: station, sink: { factory: station, path: "/dev/zero" } },
+			{ factory: station, gain: 1 },
+			{ factory: station, gain: 1.0 },
+			{ factory: station, gain: true },
+		]""")
+
+		a, b, c, d, e, f = builder.build(value)
+		self.assertIs(a, b)
+		self.assertIsNot(a, c)
+		self.assertIsNot(a.config["sink"], c.config["sink"])
+		self.assertEquals(7, len(self.created))
+		self.assertEquals((7, 2), (builder.cache_misses, builder.cache_hits))
+		self.assertEquals([ int, float, bool ], [ type(s.config["gain"]) for s in (d, e, f) ])
+
+		self.assertIs(a, builder.build(value)[0])
+		builder.clear_cache()
+		self.assertIsNot(a, builder.build(value)[0])
+
+	def test_cache_clone(self):
+		builder = self._make_builder(use_cache = True, clone = copy.copy)
+		a, b = builder.build([ { "factory": "station", "x": [ 1 ] } ] * 2)
+
+		self.assertIsNot(a, b)
+		self.assertEquals(a.config, b.config)
+		self.assertEquals(1, len(self.created))
+
+	def test_no_cache(self):
+		builder = self._make_builder()
+		a, b = builder.build([ { "factory": "station" } ] * 2)
+
+		self.assertIsNot(a, b)
+		self.assertEquals((0, 0), (builder.cache_misses, builder.cache_hits))
+
+
+	def test_lazy(self):
+		builder = self._make_builder(lazy = True)
+		value = builder.build({
+			"configuration": "b",
+			"configurations": [
+				{ "factory": "station", "key": "a", "sink": { "factory": "station", "key": "a.sink" } },
+				{ "factory": "station", "key": "b", "sink": { "factory": "station", "key": "b.sink" } },
+			],
+		})
+		self.assertEquals([], self.created)
+
+		a, b = value["configurations"]
+		self.assertIsInstance(b, config.LazyObject)
+		self.assertEquals("b", b._config["key"])
+		self.assertFalse(b.is_resolved())
+
+		self.assertEquals("b", b.config["key"])
+		self.assertTrue(b.is_resolved())
+		self.assertIsInstance(b.resolve(), Station)
+		self.assertIs(b.resolve(), b.resolve())
+		self.assertEquals([ "b" ], [ c["key"] for c in self.created ])
+
+		self.assertEquals("b.sink", b.config["sink"].config["key"])
+		self.assertEquals([ "b", "b.sink" ], [ c["key"] for c in self.created ])
+		self.assertFalse(a.is_resolved())
+
+		b.extra = 1
+		self.assertEquals(1, b.resolve().extra)
+
+	def test_lazy_cache(self):
+		builder = self._make_builder(lazy = True, use_cache = True)
+		a, b = builder.build([ { "factory": "station" } ] * 2)
+
+		self.assertIs(a, b)
+		copied = copy.copy(a)
+		self.assertFalse(copied.is_resolved())
+		self.assertIsInstance(copied.resolve(), Station)
+		self.assertFalse(a.is_resolved())
+		self.assertIsNot(copied.resolve(), a.resolve())
+
+
+	def _make_slow_builder(self, **kwargs):
+		builder = config.Builder(**kwargs)
+		self.events = []
+		lock = threading.Lock()
+		def factory(c):
+			with lock:
+				self.events.append(("start", c.get("key")))
+			time.sleep(0.05)
+			with lock:
+				self.events.append(("end", c.get("key")))
+			return Station(c)
+		builder.add_factory("station", factory)
+		return builder
+
+	def test_concurrent(self):
+		value = {
+			"stations": [
+				{ "factory": "station", "key": k, "sink": { "factory": "station", "key": k + ".sink" } }
+				for k in "abcd"
+			],
+			"gains": [ 1, 2 ],
+		}
+
+		serial = self._make_builder().build(value)
+		started = time.time()
+		result = self._make_slow_builder(workers = 8).build(value)
+		elapsed = time.time() - started
+
+		self.assertEquals([ 1, 2 ], result["gains"])
+		self.assertEquals(
+			[ (s.config["key"], s.config["sink"].config["key"]) for s in serial["stations"] ],
+			[ (s.config["key"], s.config["sink"].config["key"]) for s in result["stations"] ])
+		for k in "abcd":
+			self.assertTrue(self.events.index(("end", k + ".sink")) < self.events.index(("start", k)))
+		if HAS_FUTURES:
+			self.assertTrue(elapsed < 0.3, elapsed)
+
+	def test_concurrent_depends_on(self):
+		builder = self._make_slow_builder(workers = 4)
+		result = builder.build([
+			{ "factory": "station", "key": "client", "depends_on": [ "server", "database" ] },
+			{ "factory": "station", "key": "server", "depends_on": "database" },
+			{ "factory": "station", "key": "database" },
+			{ "factory": "station", "key": "other" },
+		])
+
+		self.assertEquals([ "client", "server", "database", "other" ], [ s.config["key"] for s in result ])
+		self.assertTrue(self.events.index(("end", "database")) < self.events.index(("start", "server")))
+		self.assertTrue(self.events.index(("end", "server")) < self.events.index(("start", "client")))
+
+		self.assertRaises(ValueError, builder.build, [ { "factory": "station", "depends_on": "missing" } ])
+		self.assertRaises(ValueError, builder.build, [
+			{ "factory": "station", "key": "a", "depends_on": "b" },
+			{ "factory": "station", "key": "b", "depends_on": "a" },
+		])
+
+	def test_concurrent_cache(self):
+		builder = self._make_builder(workers = 4, use_cache = True)
+		a, b = builder.build([ { "factory": "station", "sink": { "factory": "station" } } ] * 2)
+
+		self.assertIs(a, b)
+		self.assertEquals(2, len(self.created))
+		self.assertIs(a, builder.build([ { "factory": "station", "sink": { "factory": "station" } } ])[0])
+
+	def test_concurrent_cached_dependency(self):
+		builder = self._make_builder(workers = 2, use_cache = True)
+		a, b = builder.build([
+			{ "factory": "station", "key": "a" },
+			{ "factory": "station", "key": "b", "depends_on": "a", "band": 1 },
+		])
+		# Only the dependent object changes, its dependency comes from the cache
+		c, d = builder.build([
+			{ "factory": "station", "key": "a" },
+			{ "factory": "station", "key": "b", "depends_on": "a", "band": 2 },
+		])
+
+		self.assertIs(a, c)
+		self.assertIsNot(b, d)
+		self.assertEquals(2, d.config["band"])
+		self.assertEquals(3, len(self.created))
+
+	def test_concurrent_error(self):
+		builder = config.Builder(workers = 2)
+		def factory(c):
+			raise IOError("Device not found.")
+		builder.add_factory("device", factory)
+
+		self.assertRaises(IOError, builder.build, [ { "factory": "device" } ])
+
+
+	def test_deep(self):
+		value = leaf = { "factory": "station", "key": "leaf" }
+		for i in range(10000):
+			value = { "children": [ value ] }
+
+		for kwargs in ({}, { "use_cache": True }, { "workers": 2 }):
+			result = self._make_builder(**kwargs).build(value)
+			for i in range(10000):
+				result = result["children"][0]
+			self.assertIsInstance(result, Station)
+			self.assertEquals("leaf", result.config["key"])
+
+	def test_deep_cache(self):
+		# Equal configs share the cached object no matter if they are
+		# processed recursively or past the recursion limit
+		leaf = { "factory": "station", "key": "leaf", "bands": [ 1, 2 ] }
+		value = leaf
+		for i in range(config.Builder.MAX_RECURSION_DEPTH + 10):
+			value = { "children": [ value ] }
+
+		builder = self._make_builder(use_cache = True)
+		result = builder.build({ "shallow": leaf, "deep": value })
+		deep = result["deep"]
+		for i in range(config.Builder.MAX_RECURSION_DEPTH + 10):
+			deep = deep["children"][0]
+		self.assertIs(result["shallow"], deep)
+		self.assertEquals(1, len(self.created))
+
+	def test_rebuild(self):
+		builder = self._make_builder()
+		old = {
+			"stations": [
+				{ "factory": "station", "key": "a", "band": 1 },
+				{ "factory": "station", "key": "b", "band": 2 },
+				{ "factory": "station", "key": "c", "band": 3 },
+			],
+			"root": { "factory": "station", "backend": { "factory": "station", "key": "backend" } },
+		}
+		first = builder.rebuild(old)
+		self.assertEquals(5, len(first.created))
+		self.assertEquals([], first.reused)
+		self.assertEquals([], first.removed)
+
+		new = copy.deepcopy(old)
+		new["stations"][1]["band"] = 20
+		del new["stations"][2]
+		new["root"]["name"] = "root"
+		second = builder.rebuild(new, first)
+
+		old_stations = first.result["stations"]
+		new_stations = second.result["stations"]
+		self.assertIs(old_stations[0], new_stations[0])
+		self.assertIsNot(old_stations[1], new_stations[1])
+		self.assertEquals(20, new_stations[1].config["band"])
+		self.assertIsNot(first.result["root"], second.result["root"])
+		self.assertIs(first.result["root"].config["backend"], second.result["root"].config["backend"])
+
+		self.assertEquals(2, len(second.created))
+		self.assertEquals(2, len(second.reused))
+		self.assertEquals(
+			set(map(id, [ old_stations[1], old_stations[2], first.result["root"] ])),
+			set(map(id, second.removed)))
+
+		# Equal configurations don't share objects
+		third = builder.rebuild([ old["stations"][0], old["stations"][0] ], second)
+		self.assertEquals(1, len(third.reused))
+		self.assertEquals(1, len(third.created))
+		self.assertIsNot(third.result[0], third.result[1])
+
+		# Nothing is reused after the factories change
+		builder.add_factory("other", Station)
+		fourth = builder.rebuild(old["stations"][0], third)
+		self.assertEquals([], fourth.reused)
+		self.assertEquals(set(map(id, third.result)), set(map(id, fourth.removed)))
+
+
+class FactoryRegistryTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		with open(os.path.join(self.directory, "lazy_factories.py"), "w") as f:
+			f.write("class Device(object):\n")
+			f.write("\tdef __init__(self, config):\n")
+			f.write("\t\tself.config = config\n")
+		sys.path.insert(0, self.directory)
+
+	def tearDown(self):
+		sys.path.remove(self.directory)
+		sys.modules.pop("lazy_factories", None)
+		shutil.rmtree(self.directory)
+
+	def test_dotted_path(self):
+		for path in ("lazy_factories.Device", "lazy_factories:Device"):
+			sys.modules.pop("lazy_factories", None)
+			builder = config.Builder()
+			builder.add_factory("device", path)
+			self.assertNotIn("lazy_factories", sys.modules)
+			self.assertNotIn("device", builder.factories)
+
+			self.assertEquals([ "x" ], builder.build([ "x" ]))
+			self.assertNotIn("lazy_factories", sys.modules)
+
+			device = builder.build({ "factory": "device", "name": "a" })
+			self.assertEquals("Device", type(device).__name__)
+			self.assertEquals("a", device.config["name"])
+			self.assertIs(sys.modules["lazy_factories"].Device, builder.factories["device"])
+
+	def test_override(self):
+		builder = config.Builder()
+		builder.add_factory("device", "lazy_factories.Device")
+		builder.add_factory("device", Station)
+		self.assertIsInstance(builder.build({ "factory": "device" }), Station)
+		self.assertNotIn("lazy_factories", sys.modules)
+
+		builder.add_factory("device", "lazy_factories.Device")
+		self.assertEquals("Device", type(builder.build({ "factory": "device" })).__name__)
+
+	def test_import_error(self):
+		builder = config.Builder()
+		builder.add_factory("device", "lazy_factories.Missing")
+		builder.add_factory("other", "missing_module_of_factories.Device")
+		self.assertRaises(AttributeError, builder.build, { "factory": "device" })
+		self.assertRaises(ImportError, builder.build, { "factory": "other" })
+		builder.add_factory("bad", "Device")
+		self.assertRaises(ValueError, builder.build, { "factory": "bad" })
+
+	def test_entry_points(self):
+		loaded = []
+
+		class EntryPoint(object):
+			def __init__(self, name, factory):
+				self.name = name
+				self.factory = factory
+
+			def load(self):
+				loaded.append(self.name)
+				return self.factory
+
+		original = config._iter_entry_points
+		config._iter_entry_points = lambda group: [
+			EntryPoint("station", Station),
+			EntryPoint("unused", Station),
+		] if group == config.Builder.ENTRY_POINT_GROUP else []
+		try:
+			builder = config.Builder()
+			self.assertEquals([ "station", "unused" ], builder.add_entry_points())
+			self.assertEquals([], builder.add_entry_points("other.group"))
+			self.assertEquals([], loaded)
+
+			for i in range(3):
+				self.assertIsInstance(builder.build({ "factory": "station" }), Station)
+			self.assertEquals([ "station" ], loaded)
+		finally:
+			config._iter_entry_points = original
+
+
+class DiffTest(unittest.TestCase):
+	def check(self, old, new):
+		operations = config.diff(old, new)
+		self.assertEquals(new, config.patch(copy.deepcopy(old), operations))
+		return operations
+
+	def test_same(self):
+		value = ejson.Parser().parse_file("tests/radio-observer.json")
+		self.assertEquals([], self.check(value, copy.deepcopy(value)))
+		self.assertEquals([], config.diff([ 1, { "a": [] } ], [ 1, { "a": [] } ]))
+
+	def test_dict(self):
+		self.assertEquals(
+			sorted([
+				("remove", ("b", ), None),
+				("add", ("c", ), [ 1 ]),
+				("replace", ("a", "x"), 2),
+			]),
+			sorted(self.check({ "a": { "x": 1, "y": 1 }, "b": 1 }, { "a": { "x": 2, "y": 1 }, "c": [ 1 ] })))
+
+	def test_types(self):
+		self.assertEquals([ ("replace", (0, ), 1.0) ], self.check([ 1 ], [ 1.0 ]))
+		self.assertEquals([ ("replace", (0, ), True) ], self.check([ 1 ], [ True ]))
+		self.assertEquals([ ("replace", ("a", ), [ 1 ]) ], self.check({ "a": { "b": 1 } }, { "a": [ 1 ] }))
+		self.assertEquals([ ("replace", (), [ 1 ]) ], self.check({ "a": 1 }, [ 1 ]))
+
+	def test_list(self):
+		self.assertEquals(
+			[ ("replace", (1, ), 5) ],
+			self.check([ 1, 2, 3 ], [ 1, 5, 3 ]))
+		self.assertEquals(
+			[ ("remove", (3, ), None), ("remove", (2, ), None) ],
+			self.check([ 1, 2, 3, 4 ], [ 1, 2 ]))
+		self.assertEquals(
+			[ ("add", (2, ), 3), ("add", (3, ), { "a": 1 }) ],
+			self.check([ 1, 2 ], [ 1, 2, 3, { "a": 1 } ]))
+
+	def test_keyed_list(self):
+		def station(key, band = 1):
+			return { "key": key, "factory": "station", "band": band }
+
+		old = [ station("a"), station("b"), station("c"), station("d") ]
+
+		# Insertion and removal don't touch the other items
+		self.assertEquals(
+			[ ("remove", (1, ), None), ("add", (0, ), station("x")) ],
+			self.check(old, [ station("x"), station("a"), station("c"), station("d") ]))
+
+		# Items are changed in place
+		self.assertEquals(
+			[ ("replace", (3, "band"), 2) ],
+			self.check(old, [ station("a"), station("b"), station("c"), station("d", 2) ]))
+
+		# Reordering
+		operations = self.check(old, [ station("d"), station("a", 3), station("b"), station("c") ])
+		self.assertEquals(
+			[ ("move", (0, ), 3), ("replace", (1, "band"), 3) ],
+			operations)
+
+		# Duplicate keys are compared item by item
+		self.check([ station("a"), station("a") ], [ station("a", 2), station("b") ])
+		self.check(old, [ station("a"), 1 ])
+
+	def test_config(self):
+		old = ejson.Parser().parse_file("tests/radio-observer.json")
+		new = copy.deepcopy(old)
+		configurations = new["configurations"]
+		configurations[0]["children"][0]["bins"] = 1024
+		configurations.append(dict(configurations[0], key = "copy"))
+		configurations.reverse()
+
+		operations = self.check(old, new)
+		self.assertIn(("replace", ("configurations", len(configurations) - 1, "children", 0, "bins"), 1024), operations)
+
+	def test_patch_errors(self):
+		self.assertRaises(ValueError, config.patch, [ 1 ], [ ("add", (), 1) ])
+		self.assertRaises(ValueError, config.patch, [ 1 ], [ ("copy", (0, ), 1) ])
+
+
+class Station(object):
+	def __init__(self, config):
+		self.config = config
+
+
+class ParseCacheTest(unittest.TestCase):
+	def setUp(self):
+		self.directory = tempfile.mkdtemp()
+		self.file_name = os.path.join(self.directory, "test.json")
+		self._write("{ a: 1 }")
+
+	def tearDown(self):
+		shutil.rmtree(self.directory)
+
+	def _write(self, text, mtime = None):
+		with open(self.file_name, "w") as f:
+			f.write(text)
+		if mtime is not None:
+			os.utime(self.file_name, (mtime, mtime))
+
+	def test_hit(self):
+		cache = config.ParseCache()
+
+		self.assertEquals({ "a": 1 }, cache.parse_file(self.file_name))
+		value = cache.parse_file(self.file_name)
+		self.assertEquals({ "a": 1 }, value)
+		self.assertEquals((1, 1), (cache.hits, cache.misses))
+
+		# Callers get their own copy
+		value["a"] = 2
+		self.assertEquals({ "a": 1 }, cache.parse_file(self.file_name))
+
+	def test_stale(self):
+		cache = config.ParseCache()
+
+		cache.parse_file(self.file_name)
+		self._write("{ a: 22 }")
+		self.assertEquals({ "a": 22 }, cache.parse_file(self.file_name))
+		self.assertEquals(2, cache.misses)
+
+	def test_hash(self):
+		mtime = time.time() - 100
+		self._write("{ a: 1 }", mtime)
+
+		cache = config.ParseCache(use_hash = True)
+		cache.parse_file(self.file_name)
+		self._write("{ a: 2 }", mtime)
+		self.assertEquals({ "a": 2 }, cache.parse_file(self.file_name))
+
+	def test_eviction(self):
+		cache = config.ParseCache(max_entries = 1)
+		other_name = os.path.join(self.directory, "other.json")
+		with open(other_name, "w") as f:
+			f.write("[ 1 ]")
+
+		cache.parse_file(self.file_name)
+		cache.parse_file(other_name)
+		cache.parse_file(self.file_name)
+		self.assertEquals((0, 3), (cache.hits, cache.misses))
+
+	def test_disk_cache(self):
+		cache_dir = os.path.join(self.directory, "cache")
+
+		config.ParseCache(cache_dir = cache_dir).parse_file(self.file_name)
+
+		cache = config.ParseCache(cache_dir = cache_dir)
+		self.assertEquals({ "a": 1 }, cache.parse_file(self.file_name))
+		self.assertEquals((1, 0), (cache.hits, cache.misses))
+
+	def test_parse_error_not_cached(self):
+		self._write("{ a: 1 ")
+
+		cache = config.ParseCache()
+		self.assertIsInstance(cache.parse_file(self.file_name), config.ejson.ParseError)
+		self.assertEquals(0, len(cache._entries))
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.ejson_speedups_test module.
+
+Conformance tests run against both the pure-Python and the accelerated
+(C extension) EJSON lexer.
+"""
+
+
+import random
+import unittest
+
+from mlabutils import ejson
+
+
+CORPUS = [
+    "",
+    "   \n\t ",
+    "true TRUE False nUlL keyword_1 _x",
+    "0 -0 12 -34 1.5 -2. 3e5 4E-2 5.5e+3 1e 1e+ - -a 01",
+    "\"\" \"abc\" \"a\\\"b\" \"a\\\\\" \"\\u00e9\\n\" \"unterminated",
+    "\"line\nbreak\"",
+    "( ) [ ] { } , ; : =",
+    "// comment\n1 /* block\ncomment */ 2 /* unterminated",
+    "/ 1",
+    "{ a: [ 1, 2.5, \"x\" ], b = { c: null }; d \"e\" }",
+    "[ 1, 2 @ 3 ]",
+    u"{ \"kéy\": \"välue ☃\", x : 1 }",
+]
+
+
+def token_tuples(tokens):
+    return [(t.type, t.offset, t.text, t.value) for t in tokens]
+
+
+class LexerConformanceMixin(object):
+    ACCELERATED = False
+
+    def make_lexer(self):
+        lexer = ejson.Lexer(accelerated = self.ACCELERATED)
+        self.assertEquals(self.ACCELERATED, lexer.accelerated)
+        return lexer
+
+    def reference_tokens(self, text):
+        return token_tuples(ejson.Lexer(accelerated = False).tokenize(text))
+
+    def test_corpus(self):
+        for text in CORPUS:
+            self.assertEquals(
+                self.reference_tokens(text),
+                token_tuples(self.make_lexer().tokenize(text)),
+                text)
+
+    def test_values(self):
+        tokens = self.make_lexer().tokenize("TRUE false Null x 7 -7.25 \"a\\tb\" [")
+        self.assertEquals(
+            [ True, False, None, "x", 7, -7.25, "a\tb", "[", None ],
+            [ t.value for t in tokens ])
+        self.assertEquals(int, type(tokens[4].value))
+
+    def test_unknown(self):
+        tokens = self.make_lexer().tokenize("1 @ 2")
+        self.assertEquals(
+            [ ("NUMBER", 0), ("UNKNOWN", 2), ("EOF", 5) ],
+            [ (t.type, t.offset) for t in tokens ])
+        self.assertEquals("@ 2", tokens[1].text)
+
+    def test_offset(self):
+        tokens = self.make_lexer().tokenize("[ 1 ] [ 2 ]", 5)
+        self.assertEquals([ "LBRACKET", "NUMBER", "RBRACKET", "EOF" ], [ t.type for t in tokens ])
+        self.assertEquals(6, tokens[0].offset)
+
+    def test_scan(self):
+        tokens = self.make_lexer().scan("[ 1 ]")
+        self.assertEquals(
+            [ "LBRACKET", "NUMBER", "RBRACKET", "EOF", "EOF" ],
+            [ next(tokens).type for i in range(5) ])
+
+    def test_file(self):
+        with open("tests/radio-observer.json") as f:
+            text = f.read()
+        self.assertEquals(self.reference_tokens(text), token_tuples(self.make_lexer().tokenize(text)))
+
+    def test_random(self):
+        rnd = random.Random(42)
+        alphabet = "aeZ_09-+.eE\"\\/*\n\t ,;:=[]{}()#@"
+        for i in range(2000):
+            text = "".join(rnd.choice(alphabet) for j in range(rnd.randint(0, 30)))
+            self.assertEquals(
+                self.reference_tokens(text),
+                token_tuples(self.make_lexer().tokenize(text)),
+                repr(text))
+
+
+class PythonLexerConformanceTest(LexerConformanceMixin, unittest.TestCase):
+    ACCELERATED = False
+
+
+@unittest.skipIf(not ejson.ACCELERATED, "C extension not built")
+class AcceleratedLexerConformanceTest(LexerConformanceMixin, unittest.TestCase):
+    ACCELERATED = True
+
+    def test_subclass_not_accelerated(self):
+        class CustomLexer(ejson.Lexer):
+            pass
+
+        self.assertFalse(CustomLexer().accelerated)
+
+    def test_parser(self):
+        value = ejson.Parser().parse_file("tests/radio-observer.json")
+
+        with open("tests/radio-observer.json") as f:
+            tokens = ejson.Lexer(accelerated = False).tokenize(f.read())
+        self.assertEquals(ejson.Parser().parse_tokens(tokens), value)
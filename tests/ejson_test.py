@@ -6,6 +6,14 @@ Author: Jan Milík <milikjan@fit.cvut.cz>
 """
 
 
+import array
+import copy
+import io
+import os
+import pickle
+import random
+import shutil
+import tempfile
 import unittest
 
 from mlabutils import ejson
@@ -32,6 +40,74 @@ class LexerTest(unittest.TestCase):
         self.assertEquals("0", token.text)
         self.assertEquals(0, token.value)
 
+    def test_decode_number(self):
+        self.assertEquals(0, ejson.decode_number("-0"))
+        self.assertEquals(32768, ejson.decode_number("32768"))
+        self.assertIsInstance(ejson.decode_number("32768"), int)
+        self.assertEquals(-1.5, ejson.decode_number("-1.5"))
+        self.assertEquals(1.0, ejson.decode_number("1."))
+        self.assertEquals(2.5e-3, ejson.decode_number("2.5e-3"))
+        self.assertEquals(1e10, ejson.decode_number("1E+10"))
+
+    def test_decode_string(self):
+        self.assertEquals("", ejson.decode_string('""'))
+        self.assertEquals("abc", ejson.decode_string('"abc"'))
+        self.assertEquals("\" \\ / \b \f \n \r \t", ejson.decode_string(r'"\" \\ \/ \b \f \n \r \t"'))
+        self.assertEquals("A", ejson.decode_string(r'"\u0041"'))
+
+        expected = u"\u00e9 \U0001f600"
+        if str is bytes:
+            expected = expected.encode("utf-8")
+        self.assertEquals(expected, ejson.decode_string(r'"\u00e9 \ud83d\ude00"'))
+
+        self.assertEquals(r"\x41\q", ejson.decode_string(r'"\x41\q"'))
+
+    def test_decode_unicode_string(self):
+        # Unicode documents on Python 2 give unicode strings
+        self.assertEquals(u"\u00e9x \U0001f600", ejson.decode_string(u'"\\u00e9x \\ud83d\\ude00"'))
+        self.assertEquals(u"\u00e9 \u00e9", ejson.decode_string(u'"\u00e9 \\u00e9"'))
+        self.assertEquals([ u"\u00e9x", u"\t" ], ejson.Parser().parse_string(u'[ "\\u00e9x", "\\t" ]'))
+        self.assertEquals(
+            [ [ u"\u00e9x" ] ],
+            list(ejson.Parser().iterparse(io.StringIO(u'[ "\\u00e9x" ]'))))
+
+    def test_no_eval(self):
+        lexer = ejson.Lexer()
+
+        tokens = lexer.scan('"" + __import__("os").getcwd() + ""')
+        self.assertEquals("", next(tokens).value)
+        self.assertEquals("UNKNOWN", next(tokens).type)
+
+    def test_number_without_exponent_digits(self):
+        tokens = ejson.Lexer().tokenize("1e")
+        self.assertEquals(["NUMBER", "KEYWORD", "EOF"], [t.type for t in tokens])
+
+    def test_compiled_matches_sequential(self):
+        with open("tests/radio-observer.json") as f:
+            text = f.read()
+
+        compiled = ejson.Lexer(compiled = True).scan(text)
+        sequential = ejson.Lexer(compiled = False).scan(text)
+
+        while True:
+            a = next(compiled)
+            b = next(sequential)
+            self.assertEquals(
+                (a.type, a.offset, a.text, a.value),
+                (b.type, b.offset, b.text, b.value))
+            if a.type == "EOF":
+                break
+
+    def test_unknown_token(self):
+        lexer = ejson.Lexer()
+
+        tokens = lexer.scan("1 @ 2")
+
+        self.assertEquals("NUMBER", next(tokens).type)
+        token = next(tokens)
+        self.assertEquals("UNKNOWN", token.type)
+        self.assertEquals("@ 2", token.text)
+
 
 class ParserTest(unittest.TestCase):
     def test_constructor(self):
@@ -88,6 +164,9 @@ class ParserTest(unittest.TestCase):
         value = parser.parse_string("/* some comment */true")
         self.assertEquals(True, value)
 
+        value = parser.parse_string("/* multi\nline\ncomment */true")
+        self.assertEquals(True, value)
+
     def test_parse_file(self):
         parser = ejson.Parser()
 
@@ -110,3 +189,506 @@ class ParserTest(unittest.TestCase):
         value = parser.parse_string("{ a: 1, b: 2, c: 3 ")
         self.assertIsInstance(value, ejson.ParseError)
 
+    def test_error_location(self):
+        parser = ejson.Parser()
+
+        value = parser.parse_string("{\n  a: 1,\n  /* multi\n  line */ b: ]\n}")
+        self.assertIsInstance(value, ejson.ParseError)
+        self.assertEquals((4, 14), (value.location.line, value.location.column))
+        self.assertEquals("Unexpected token at line 4, column 14: ']'.", str(value))
+
+        value = parser.parse_buffer(b"[\n1 }")
+        self.assertEquals((2, 3), (value.location.line, value.location.column))
+
+        value = parser.parse_tokens(ejson.Lexer().tokenize("[ 1 }"))
+        self.assertIsNone(value.location)
+        self.assertEquals("Unexpected token at offset 4: '}'.", str(value))
+
+    def test_syntax_error_in_nested_value(self):
+        parser = ejson.Parser()
+
+        value = parser.parse_string("{ a: [ 1, 2 } ")
+        self.assertIsInstance(value, ejson.ParseError)
+        self.assertEquals("}", value.token.text)
+
+    def test_separators(self):
+        parser = ejson.Parser()
+
+        value = parser.parse_string("[ 1,, 2;, 3 ; ]")
+        self.assertEquals([1, 2, 3], value)
+
+        value = parser.parse_string("{ a = 1; b: 2,, c 3 }")
+        self.assertEquals({ "a": 1, "b": 2, "c": 3 }, value)
+
+        value = parser.parse_string("[ , 1 ]")
+        self.assertIsInstance(value, ejson.ParseError)
+
+        value = parser.parse_string("{ , a: 1 }")
+        self.assertIsInstance(value, ejson.ParseError)
+
+    def test_deep_nesting(self):
+        parser = ejson.Parser()
+        depth = 10000
+
+        value = parser.parse_string(u"[" * depth + u"1" + u"]" * depth)
+        for i in range(depth):
+            self.assertEquals(1, len(value))
+            value = value[0]
+        self.assertEquals(1, value)
+
+        value = parser.parse_string(u"{ a: " * depth + u"[ 1, { b: 2 } ]" + u" }" * depth)
+        for i in range(depth):
+            value = value["a"]
+        self.assertEquals([ 1, { "b": 2 } ], value)
+
+        value = parser.parse_string(u"[" * depth + u"]" * (depth - 1))
+        self.assertIsInstance(value, ejson.ParseError)
+        self.assertEquals("EOF", value.token.type)
+
+        # Records and arrays on both sides of the recursion limit
+        parser = ejson.Parser(compact = True)
+        depth = ejson.Parser.MAX_RECURSION_DEPTH + 5
+        value = parser.parse_string(u"{ a: [ 1, 2, " * depth + u"3" + u" ] }" * depth)
+        for i in range(depth):
+            self.assertIsInstance(value, ejson.Record)
+            self.assertEquals([ 1, 2 ], list(value["a"][:2]))
+            value = value["a"][2]
+        self.assertEquals(3, value)
+
+    def test_parse_tokens(self):
+        parser = ejson.Parser()
+
+        tokens = ejson.Lexer().tokenize("{ a: [ true, null, \"x\" ] }")
+        self.assertEquals("EOF", tokens[-1].type)
+        self.assertEquals({ "a": [ True, None, "x" ] }, parser.parse_tokens(tokens))
+
+
+class CompactParserTest(unittest.TestCase):
+    TEXT = u"""[
+        { key: "a", factory: "pipeline", bands: [ 1, 2 ] },
+        { factory: "pipeline", key: "b", gains: [ 0.5, 1.0 ] },
+        { key: "c", "not a field": 1, mixed: [ 1, 2.5 ], flags: [ true, false ] },
+        { _private: 1, items: 2, class: 3 },
+        { },
+    ]"""
+
+    def test_intern_keys(self):
+        value = ejson.Parser(intern_keys = True).parse_string(self.TEXT)
+
+        keys = [ [ k for k in item if k == "factory" ][0] for item in value[:2] ]
+        self.assertIs(keys[0], keys[1])
+        self.assertEquals(ejson.Parser().parse_string(self.TEXT), value)
+
+    def test_records(self):
+        value = ejson.Parser(compact = True).parse_string(self.TEXT)
+
+        a, b, c, d, e = value
+        self.assertIsInstance(a, ejson.Record)
+        self.assertIs(type(a), type(ejson.Parser(compact = True).parse_string(u"{ key: 1, factory: 2, bands: 3 }")))
+        self.assertNotEqual(type(a), type(b))
+        self.assertEquals([ "bands", "factory", "key" ], list(a))
+        self.assertEquals("a", a["key"])
+        self.assertEquals("a", a.key)
+        self.assertEquals("pipeline", a.get("factory"))
+        self.assertIsNone(a.get("missing"))
+        self.assertRaises(KeyError, lambda: a["missing"])
+        self.assertTrue("key" in a)
+        self.assertEquals(3, len(a))
+        self.assertEquals({ "key": "b", "factory": "pipeline", "gains": array.array("d", [ 0.5, 1.0 ]) }, b)
+        self.assertTrue(isinstance(a, ejson.Mapping))
+        self.assertRaises(AttributeError, setattr, a, "key", "x")
+        self.assertFalse(hasattr(a, "__dict__"))
+
+        # Keys which aren't identifiers, private or clash with methods
+        self.assertIsInstance(c, dict)
+        self.assertIsInstance(d, dict)
+        self.assertEquals({}, e)
+
+    def test_arrays(self):
+        a, b, c = ejson.Parser(compact = True).parse_string(self.TEXT)[:3]
+
+        self.assertEquals(array.array("l", [ 1, 2 ]), a["bands"])
+        self.assertEquals(array.array("d", [ 0.5, 1.0 ]), b["gains"])
+        self.assertEquals([ 1, 2.5 ], c["mixed"])
+        self.assertEquals([ True, False ], c["flags"])
+        self.assertEquals([ 10 ** 30 ], ejson.Parser(compact = True).parse_string(u"[ 1000000000000000000000000000000 ]"))
+
+    def test_copy(self):
+        value = ejson.Parser(compact = True).parse_string(self.TEXT)
+
+        self.assertEquals(value, pickle.loads(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)))
+        self.assertEquals(value, copy.deepcopy(value))
+
+    def test_write(self):
+        value = ejson.Parser(compact = True).parse_string(self.TEXT)
+
+        self.assertEquals(ejson.Parser().parse_string(self.TEXT), ejson.Parser().parse_string(ejson.dumps(value)))
+
+
+class IterParseTest(unittest.TestCase):
+    def _iterparse(self, text, items = False, chunk_size = 3):
+        return list(ejson.Parser().iterparse(io.StringIO(text), items, chunk_size))
+
+    def test_scan_file_matches_scan(self):
+        with open("tests/radio-observer.json") as f:
+            text = f.read()
+
+        expected = ejson.Lexer().tokenize(text)
+        for chunk_size in (1, 7, 4096):
+            with open("tests/radio-observer.json") as f:
+                tokens = ejson.Lexer().scan_file(f, chunk_size)
+                for token in expected:
+                    actual = next(tokens)
+                    self.assertEquals(
+                        (token.type, token.offset, token.value),
+                        (actual.type, actual.offset, actual.value))
+
+    def test_top_level_values(self):
+        values = self._iterparse(u'1 "a b c" /* long\ncomment */ [ 1, [ 2 ] ], { a: 3 }; null')
+        self.assertEquals([1, "a b c", [1, [2]], { "a": 3 }, None], values)
+
+    def test_items(self):
+        values = self._iterparse(u'[ { a: 1 }, 2 // comment\n, [ 3 ] ]', items = True)
+        self.assertEquals([{ "a": 1 }, 2, [3]], values)
+
+    def test_items_lazy(self):
+        values = ejson.Parser().iterparse(io.StringIO(u"[ 1, 2, ] ]"), items = True, chunk_size = 2)
+        self.assertEquals(1, next(values))
+        self.assertEquals(2, next(values))
+        self.assertRaises(ejson.ParseError, next, values)
+
+    def test_error_location(self):
+        try:
+            self._iterparse(u"[ 1 ]\n// comment\n{ a: 1\n b: 2, ]", chunk_size = 4)
+        except ejson.ParseError as e:
+            self.assertEquals((4, 8), (e.location.line, e.location.column))
+        else:
+            self.fail("ParseError not raised")
+
+    def test_syntax_error(self):
+        self.assertRaises(ejson.ParseError, self._iterparse, u"[ 1, 2 ")
+        self.assertRaises(ejson.ParseError, self._iterparse, u"{ a: 1 ]")
+        self.assertRaises(ejson.ParseError, self._iterparse, u", 1")
+        self.assertRaises(ejson.ParseError, self._iterparse, u"1 }")
+        self.assertRaises(ejson.ParseError, self._iterparse, u"[ 1 ", items = True)
+        self.assertRaises(ejson.ParseError, self._iterparse, u"1", items = True)
+
+    def test_iterparse_file_name(self):
+        values = list(ejson.iterparse("tests/radio-observer.json"))
+        self.assertEquals(1, len(values))
+        self.assertEquals(ejson.Parser().parse_file("tests/radio-observer.json"), values[0])
+
+        values = list(ejson.iterparse(u"tests/radio-observer.json"))
+        self.assertEquals(1, len(values))
+
+    def test_scan_file_unknown(self):
+        reads = []
+
+        class File(io.StringIO):
+            def read(self, size = -1):
+                reads.append(size)
+                return io.StringIO.read(self, size)
+
+        f = File(u"[ 1, @ ]" + u" 2" * 10000)
+        tokens = ejson.Lexer().scan_file(f, 4)
+        self.assertEquals(["LBRACKET", "NUMBER", "COMMA"], [next(tokens).type for i in range(3)])
+        token = next(tokens)
+        self.assertEquals("UNKNOWN", token.type)
+        self.assertEquals(5, token.offset)
+        self.assertTrue(len(reads) < 5)
+
+    def test_scan_file_partial_tokens(self):
+        text = u'"a b\\" c" /* x */ -1 // y\n"\\\\" -2.5e3'
+        expected = ejson.Lexer().tokenize(text)
+        for chunk_size in range(1, 6):
+            tokens = ejson.Lexer().scan_file(io.StringIO(text), chunk_size)
+            self.assertEquals(
+                [ (token.type, token.offset) for token in expected ],
+                [ (token.type, token.offset) for token in [ next(tokens) for token in expected ] ])
+
+
+class ParseBufferTest(unittest.TestCase):
+    def test_parse_file_mmap(self):
+        parser = ejson.Parser()
+
+        self.assertEquals(
+            parser.parse_file("tests/radio-observer.json"),
+            parser.parse_file("tests/radio-observer.json", use_mmap = True))
+
+    def test_parse_buffer(self):
+        parser = ejson.Parser()
+
+        value = parser.parse_buffer(memoryview(b'{ a: [ 1, 2.5, "x y", true ] }'))
+        self.assertEquals({ "a": [ 1, 2.5, "x y", True ] }, value)
+
+    def test_parse_buffer_window(self):
+        parser = ejson.Parser()
+        text = "{ a: [ %s ], b: { c: [ [ 1 ], { d: 2 } ] } }" % (", ".join(str(i) for i in range(100)), )
+
+        window = ejson._TokenWindow.WINDOW
+        ejson._TokenWindow.WINDOW = 4
+        try:
+            self.assertEquals(parser.parse_string(text), parser.parse_buffer(text.encode("utf-8")))
+            compact = ejson.Parser(compact = True)
+            self.assertEquals(repr(compact.parse_string(text)), repr(compact.parse_buffer(text.encode("utf-8"))))
+
+            value = parser.parse_buffer(("[ %s, @ ]" % (", ".join(str(i) for i in range(100)), )).encode("utf-8"))
+            self.assertIsInstance(value, ejson.ParseError)
+            self.assertEquals("UNKNOWN", value.token.type)
+            self.assertEquals((1, 393), (value.location.line, value.location.column))
+        finally:
+            ejson._TokenWindow.WINDOW = window
+
+    def test_buffer_tokens(self):
+        tokens = ejson.Lexer().tokenize(bytearray(b"[ 12 ]"))
+
+        self.assertIsInstance(tokens[0], ejson.BufferToken)
+        self.assertEquals("[", tokens[0].text)
+        self.assertEquals(2, tokens[1].offset)
+        self.assertEquals(12, tokens[1].value)
+        self.assertEquals(["LBRACKET", "NUMBER", "RBRACKET", "EOF"], [t.type for t in tokens])
+
+    def test_syntax_error(self):
+        parser = ejson.Parser()
+
+        value = parser.parse_buffer(bytearray(b"[ 1 }"))
+        self.assertIsInstance(value, ejson.ParseError)
+        self.assertNotIsInstance(value.token, ejson.BufferToken)
+        self.assertEquals("}", value.token.text)
+
+
+class ParseFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_names = []
+        for i in range(4):
+            file_name = os.path.join(self.directory, "station%d.json" % (i, ))
+            with open(file_name, "w") as f:
+                f.write("{ index: %d, bands: [ 10100, 11000 ] }" % (i, ))
+            self.file_names.append(file_name)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def expected(self):
+        return [{ "index": i, "bands": [ 10100, 11000 ] } for i in range(4)]
+
+    def test_serial(self):
+        self.assertEquals(self.expected(), ejson.parse_files(self.file_names))
+
+    def test_parallel(self):
+        values = ejson.parse_files(self.file_names, workers = 2, min_parallel = 1)
+        self.assertEquals(self.expected(), values)
+
+    def test_as_completed(self):
+        values = ejson.parse_files(self.file_names, workers = 2, as_completed = True, min_parallel = 1)
+        values = sorted(values, key = lambda item: item[1]["index"])
+        self.assertEquals(list(zip(self.file_names, self.expected())), values)
+
+    def test_syntax_error(self):
+        with open(self.file_names[2], "w") as f:
+            f.write("{ index: 2,\n  bands: [ 10100 }")
+
+        for min_parallel in (1, 100):
+            try:
+                ejson.parse_files(self.file_names, workers = 2, min_parallel = min_parallel)
+            except ejson.ParseError as e:
+                self.assertEquals(self.file_names[2], e.file_name)
+                self.assertEquals(2, e.location.line)
+                self.assertTrue(str(e).startswith(self.file_names[2] + ": "))
+            else:
+                self.fail("ParseError not raised")
+
+
+class IncrementalParserTest(unittest.TestCase):
+    TEXT = u"{ a: [ 1, { b: 2 }, [ 3 ] ], c: { d: \"x\" } }"
+
+    def edit(self, parser, old, new, occurrence = 0):
+        start = -1
+        for i in range(occurrence + 1):
+            start = parser.text.index(old, start + 1)
+        return parser.edit(start, start + len(old), new)
+
+    def test_edit_nested_value(self):
+        parser = ejson.IncrementalParser()
+        value = parser.parse(self.TEXT)
+
+        self.assertIs(value, self.edit(parser, "2", "20"))
+        self.assertEquals({ "a": [ 1, { "b": 20 }, [ 3 ] ], "c": { "d": "x" } }, value)
+        self.assertEquals((parser.text.index("{ b"), parser.text.index("}, [") + 1), parser.reparsed)
+
+        self.edit(parser, "3", "3, 4")
+        self.edit(parser, "\"x\"", "[ y ]")
+        self.edit(parser, "1", "-1.5")
+        self.assertEquals(ejson.Parser().parse_string(parser.text), value)
+
+    def test_fall_back_to_parent(self):
+        parser = ejson.IncrementalParser()
+        parser.parse(u"[ [ 1 ], 3 ]")
+
+        self.assertEquals([ [ 1 ], [ 2 ], 3 ], self.edit(parser, "1 ", "1 ] [ 2 "))
+        self.assertEquals((0, len(parser.text)), parser.reparsed)
+
+    def test_comment_hides_bracket(self):
+        parser = ejson.IncrementalParser()
+        parser.parse(u"[ 1, [ 2 ], 3 ]")
+
+        self.assertIsInstance(self.edit(parser, "2 ", "2 ] //"), ejson.ParseError)
+        self.assertEquals([ 1, [ 2 ], 3 ], self.edit(parser, " //]", ""))
+
+    def test_error_recovery(self):
+        parser = ejson.IncrementalParser()
+        parser.parse(self.TEXT)
+
+        self.assertIsInstance(self.edit(parser, "b: 2", "b: }"), ejson.ParseError)
+        self.assertEquals(1, parser.value.location.line)
+        self.assertEquals({ "b": 2 }, self.edit(parser, "b: }", "b: 2")["a"][1])
+
+    def test_random_edits(self):
+        rnd = random.Random(1)
+        with open("tests/radio-observer.json") as f:
+            text = f.read()
+        alphabet = [ u"1", u"x", u" ", u",", u"[", u"]", u"{", u"}", u"\"", u":", u"//", u"\n", u"" ]
+
+        parser = ejson.IncrementalParser()
+        parser.parse(text)
+        for i in range(300):
+            start = rnd.randint(0, len(parser.text))
+            end = min(len(parser.text), start + rnd.randint(0, 3))
+            replacement = u"".join(rnd.choice(alphabet) for j in range(rnd.randint(0, 3)))
+            value = parser.edit(start, end, replacement)
+
+            expected = ejson.Parser().parse_string(parser.text)
+            if isinstance(expected, ejson.ParseError):
+                self.assertIsInstance(value, ejson.ParseError)
+            else:
+                self.assertEquals(expected, value, repr(parser.text))
+
+
+class ExtractTest(unittest.TestCase):
+    TEXT = u"""{
+        name: "observer",
+        stations: [
+            { key: "a", bands: [ 1, 2 ], "x.y": { z: true } },
+            { key: "b", bands: [ 3 ], /* ] } */ "note": "[{" },
+            { key: "c" },
+        ],
+        name: "last",
+    }"""
+
+    def evaluate(self, value, steps):
+        if not steps:
+            return [ value ]
+        step = steps[0]
+        if isinstance(value, list) and step is ejson.WILDCARD:
+            items = value
+        elif isinstance(value, list) and isinstance(step, int):
+            items = value[step:step + 1]
+        elif isinstance(value, dict) and step is ejson.WILDCARD:
+            items = list(value.values())
+        elif isinstance(value, dict) and step in value:
+            items = [ value[step] ]
+        else:
+            items = []
+        return [ result for item in items for result in self.evaluate(item, steps[1:]) ]
+
+    def test_paths(self):
+        self.assertEquals([ [ 3 ] ], ejson.extract(self.TEXT, "stations[1].bands"))
+        self.assertEquals([ "a", "b", "c" ], ejson.extract(self.TEXT, "stations[*].key"))
+        self.assertEquals([ 1, 2, 3 ], ejson.extract(self.TEXT, "stations.*.bands[*]"))
+        self.assertEquals([ True ], ejson.extract(self.TEXT, u'stations[0]["x.y"].z'))
+        self.assertEquals([ "[{" ], ejson.extract(self.TEXT, [ "stations", 1, "note" ]))
+        self.assertEquals([], ejson.extract(self.TEXT, "stations[3]"))
+        self.assertEquals([], ejson.extract(self.TEXT, "name.first"))
+        self.assertEquals([ "last" ], ejson.extract(self.TEXT, "name"))
+        self.assertEquals([ ejson.Parser().parse_string(self.TEXT) ], ejson.extract(self.TEXT, ""))
+
+    def test_file(self):
+        with open("tests/radio-observer.json") as f:
+            value = ejson.Parser().parse_string(f.read())
+            f.seek(0)
+            self.assertEquals(
+                [ value["configurations"][0]["children"] ],
+                ejson.extract(f, "configurations[0].children"))
+
+    def test_matches_parsed_value(self):
+        with open("tests/radio-observer.json") as f:
+            text = f.read()
+        value = ejson.Parser().parse_string(text)
+
+        for path in (
+                    "configurations[*].children[*]",
+                    "configurations[0].children[0].children[*].factory",
+                    "*",
+                    "*[*].*",
+                    "logging.*",
+                    "configurations[1][0]",
+                ):
+            # Python 2 dictionaries don't keep the document order.
+            assertCountEqual = getattr(self, "assertCountEqual", None) or self.assertItemsEqual
+            assertCountEqual(self.evaluate(value, ejson.parse_path(path)), ejson.extract(text, path), path)
+
+    def test_parse_path(self):
+        self.assertEquals(
+            [ "a", "b", 0, ejson.WILDCARD, ejson.WILDCARD, "x.y", "*" ],
+            ejson.parse_path(u'a.b[0][*].*["x.y"]["*"]'))
+        self.assertRaises(ValueError, ejson.parse_path, "a[b]")
+        self.assertRaises(ValueError, ejson.parse_path, "a[0]b")
+        self.assertRaises(ValueError, ejson.parse_path, "a..b")
+
+    def test_syntax_error(self):
+        self.assertRaises(ejson.ParseError, ejson.extract, u"{ a: [ 1, } }", "b")
+        self.assertRaises(ejson.ParseError, ejson.extract, u"{ a: \"x }", "b")
+        self.assertRaises(ejson.ParseError, ejson.extract, u"{ a: 1 } 2", "a")
+
+        try:
+            ejson.extract(u"{\n a: 1,\n b: [ 1 2 : ] }", "b")
+        except ejson.ParseError as e:
+            self.assertEquals((3, 11), (e.location.line, e.location.column))
+        else:
+            self.fail("ParseError not raised")
+
+
+class WriterTest(unittest.TestCase):
+    def assertRoundTrip(self, value, **kwargs):
+        text = ejson.dumps(value, **kwargs)
+        self.assertEquals(value, ejson.Parser().parse_string(text))
+
+    def test_compact(self):
+        self.assertEquals('{"a":[1,2.5,null,true,false,"x"]}', ejson.dumps({ "a": [ 1, 2.5, None, True, False, "x" ] }))
+        self.assertEquals("[]", ejson.dumps([]))
+        self.assertEquals("{}", ejson.dumps({}))
+
+    def test_indent(self):
+        self.assertEquals('{\n  "a": [\n    1,\n    {}\n  ]\n}', ejson.dumps({ "a": [ 1, {} ] }, indent = 2))
+
+    def test_sort_keys(self):
+        value = { "b": 1, "a": 2, "C": 3 }
+        self.assertEquals('{"C":3,"a":2,"b":1}', ejson.dumps(value, sort_keys = True))
+        self.assertEquals('{"a":2,"b":1,"C":3}', ejson.dumps(value, sort_keys = lambda key: key.lower()))
+
+    def test_strings(self):
+        for value in ("", "a b", "\"", "\\", "a\\", "\\\"", "line\nbreak\ttab\r\x08\x0c"):
+            self.assertRoundTrip([ value, "next" ])
+
+    def test_keyword_keys(self):
+        self.assertRoundTrip({ True: 1, None: 2 })
+        self.assertRaises(TypeError, ejson.dumps, { 1: 2 })
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, ejson.dumps, float("nan"))
+        self.assertRaises(TypeError, ejson.dumps, object())
+
+    def test_round_trip(self):
+        value = ejson.Parser().parse_file("tests/radio-observer.json")
+
+        self.assertRoundTrip(value)
+        self.assertRoundTrip(value, indent = 4, sort_keys = True)
+
+    def test_dump(self):
+        value = [ { "key": "item%d" % (i, ), "values": list(range(i % 7)) } for i in range(500) ]
+
+        f = io.StringIO() if str is not bytes else io.BytesIO()
+        ejson.dump(value, f, indent = "\t", chunk_size = 64)
+        self.assertEquals(ejson.dumps(value, indent = "\t"), f.getvalue())
+        self.assertEquals(value, ejson.Parser().parse_string(f.getvalue()))
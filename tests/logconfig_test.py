@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.logconfig_test module.
+"""
+
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from mlabutils import ejson, logconfig
+
+
+class LogConfigTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "app.log")
+        # Not registered in the logging module, so no one else adds handlers
+        self.logger = logging.Logger("logconfig_test")
+        self.logger.propagate = False
+
+        self.stderr = sys.stderr
+        sys.stderr = StringIO()
+
+    def tearDown(self):
+        sys.stderr = self.stderr
+        for handler in self.logger.handlers:
+            handler.close()
+        shutil.rmtree(self.directory)
+
+    def configure(self, sinks, **kwargs):
+        return logconfig.configure(sinks, self.logger, **kwargs)
+
+    def read(self, file_name = None):
+        with open(file_name or self.file_name) as f:
+            return f.read().splitlines()
+
+    def test_get_level(self):
+        self.assertEquals(logging.DEBUG, logconfig.get_level("debug"))
+        self.assertEquals(logging.WARNING, logconfig.get_level("Warning"))
+        self.assertEquals(15, logconfig.get_level(15))
+        self.assertRaises(ValueError, logconfig.get_level, "verbose")
+        self.assertRaises(ValueError, logconfig.get_level, None)
+
+    def test_sinks(self):
+        handlers = self.configure([
+            { "file_name": self.file_name, "log_level": "debug" },
+            { "file_name": "-", "log_level": "warning", "format": "%(levelname)s %(message)s" },
+        ])
+        self.assertEquals(handlers, self.logger.handlers)
+        self.assertEquals(logging.DEBUG, self.logger.level)
+
+        self.logger.debug("Debug %d.", 1)
+        self.logger.warning("Warning %d.", 2)
+
+        lines = self.read()
+        self.assertEquals(2, len(lines))
+        self.assertTrue(lines[0].endswith("  logconfig_test  DEBUG  Debug 1."))
+        self.assertTrue(lines[1].endswith("  logconfig_test  WARNING  Warning 2."))
+        self.assertEquals("WARNING Warning 2.\n", sys.stderr.getvalue())
+
+    def test_config_section(self):
+        with open(os.path.join(os.path.dirname(__file__), "radio-observer.json")) as f:
+            sinks = ejson.extract(f, "logging")[0]
+        self.assertEquals([ "debug", "warning" ], [ sink["log_level"] for sink in sinks ])
+
+        sinks[0]["file_name"] = self.file_name
+        handlers = self.configure(sinks)
+        self.assertEquals([ logging.DEBUG, logging.WARNING ], [ handler.level for handler in handlers ])
+        self.assertIs(sys.stderr, handlers[1].stream)
+
+    def test_level(self):
+        calls = []
+
+        def render(value):
+            calls.append(value)
+            return "<%d>" % (value, )
+
+        self.configure([
+            { "file_name": self.file_name, "log_level": "info" },
+            { "file_name": "-", "log_level": "warning" },
+        ])
+        self.assertEquals(logging.INFO, self.logger.level)
+
+        self.logger.debug("Value %s.", logconfig.Lazy(render, 1))
+        self.logger.info("Value %s.", logconfig.Lazy(render, 2))
+        self.assertEquals([ 2 ], calls)
+        self.assertEquals(1, len(self.read()))
+        self.assertEquals("", sys.stderr.getvalue())
+
+    def test_shared_formatter(self):
+        handlers = self.configure([
+            { "file_name": self.file_name, "log_level": "debug" },
+            { "file_name": "-", "log_level": "debug" },
+            { "file_name": "-", "format": "%(message)s" },
+        ])
+        self.assertIs(handlers[0].formatter, handlers[1].formatter)
+        self.assertIsNot(handlers[0].formatter, handlers[2].formatter)
+
+        record = logging.makeLogRecord({ "msg": "Value %d.", "args": (1, ) })
+        text = handlers[0].formatter.format(record)
+        self.assertTrue(text.endswith("Value 1."))
+        record.msg = "Changed"
+        record.args = None
+        self.assertIs(text, handlers[1].formatter.format(record))
+        self.assertEquals("Changed", handlers[2].formatter.format(record))
+
+    def test_rotating(self):
+        self.configure([
+            { "file_name": self.file_name, "format": "%(message)s", "max_bytes": 100, "backup_count": 2 },
+        ])
+        for i in range(40):
+            self.logger.info("Record %02d.", i)
+        self.assertEquals(3, len([ name for name in os.listdir(self.directory) if name.startswith("app.log") ]))
+        self.assertEquals("Record 39.", self.read()[-1])
+        self.assertTrue(len(self.read()) < 10)
+
+    def test_buffer(self):
+        handlers = self.configure([
+            { "file_name": self.file_name, "log_level": "debug", "format": "%(message)s", "buffer": 10 },
+        ])
+        self.assertEquals(logging.DEBUG, handlers[0].level)
+        for i in range(15):
+            self.logger.debug("Record %d.", i)
+        self.assertEquals(10, len(self.read()))
+
+        self.logger.error("Error.")
+        self.assertEquals(16, len(self.read()))
+
+        self.logger.info("Record.")
+        handlers[0].flush()
+        self.assertEquals("Record.", self.read()[-1])
+
+        target = handlers[0].target
+        self.logger.info("Last record.")
+        self.logger.removeHandler(handlers[0])
+        handlers[0].close()
+        self.assertEquals("Last record.", self.read()[-1])
+        self.assertIsNone(target.stream)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, self.configure, [ { "log_level": "debug" } ])
+        self.assertRaises(ValueError, self.configure, [ { "file_name": "-", "level": "debug" } ])
+        self.assertRaises(ValueError, self.configure, [ { "file_name": "-", "log_level": "verbose" } ])
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
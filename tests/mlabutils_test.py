@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.mlabutils_test module.
+"""
+
+
+import unittest
+
+from mlabutils import BufferedIterator, IteratorWrapper
+
+
+class IteratorWrapperTest(unittest.TestCase):
+    def test_stop_element(self):
+        iterator = IteratorWrapper(iter([1]), use_stop_element = True, stop_element = "END")
+
+        self.assertEquals(1, next(iterator))
+        self.assertEquals("END", next(iterator))
+        self.assertEquals("END", next(iterator))
+
+    def test_take_while(self):
+        iterator = BufferedIterator(range(10))
+
+        self.assertEquals([0, 1, 2], list(iterator.take_while(lambda x: x < 3)))
+
+
+class BufferedIteratorTest(unittest.TestCase):
+    def test_peek(self):
+        iterator = BufferedIterator(range(3))
+
+        self.assertEquals(0, iterator.peek())
+        self.assertEquals(0, iterator.peek())
+        self.assertEquals(0, next(iterator))
+        self.assertEquals(1, iterator.next())
+        self.assertEquals(2, iterator.peek())
+        self.assertEquals([2], list(iterator))
+
+    def test_peek_list(self):
+        iterator = BufferedIterator(range(5))
+
+        view = iterator.peek_list(3)
+        self.assertEquals(3, len(view))
+        self.assertEquals([0, 1, 2], view)
+        self.assertEquals([0, 1, 2], list(view))
+        self.assertEquals(2, view[-1])
+        self.assertEquals([1, 2], view[1:])
+        self.assertRaises(IndexError, lambda: view[3])
+
+        self.assertEquals(0, next(iterator))
+        self.assertEquals([1, 2, 3], iterator.peek_list(3))
+        self.assertEquals([1, 2, 3, 4], list(iterator))
+
+    def test_peek_list_past_end(self):
+        iterator = BufferedIterator(range(2))
+        self.assertRaises(StopIteration, iterator.peek_list, 3)
+
+        iterator = BufferedIterator(range(2), use_stop_element = True)
+        self.assertEquals([0, 1, None], iterator.peek_list(3))
@@ -0,0 +1,196 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""tests.watch_test module.
+"""
+
+
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from mlabutils import config, ejson, watch
+
+
+CONFIG = """{
+    configurations: [
+        { key: "a", factory: station, band: 1 },
+        { key: "b", factory: station, band: %d },
+    ],
+}
+"""
+
+
+class Station(object):
+    def __init__(self, config):
+        if config["band"] == 0:
+            raise ValueError("Invalid band.")
+        self.config = config
+
+
+class WatcherTestMixin(object):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "app.conf")
+        self.write("a")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, data, file_name = None):
+        with open(file_name or self.file_name, "w") as f:
+            f.write(data)
+
+    def write_later(self, data, file_name = None):
+        timer = threading.Timer(0.1, self.write, (data, file_name))
+        timer.start()
+        self.addCleanup(timer.join)
+
+    def test_change(self):
+        watcher = self.create_watcher()
+        try:
+            self.assertFalse(watcher.wait(0.05))
+            self.write_later("bb")
+            self.assertTrue(watcher.wait(5))
+            self.assertFalse(watcher.wait(0.05))
+        finally:
+            watcher.close()
+
+    def test_replace(self):
+        watcher = self.create_watcher()
+        try:
+            other = os.path.join(self.directory, "other.conf")
+            self.write_later("bb", other)
+            self.assertFalse(watcher.wait(0.3))
+
+            os.rename(other, self.file_name)
+            self.assertTrue(watcher.wait(5))
+        finally:
+            watcher.close()
+
+
+class PollingWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self):
+        return watch.PollingWatcher(self.file_name, 0.01)
+
+
+class InotifyWatcherTest(WatcherTestMixin, unittest.TestCase):
+    def create_watcher(self):
+        try:
+            return watch.InotifyWatcher(self.file_name)
+        except OSError:
+            self.skipTest("inotify is not available")
+
+
+class ConfigReloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.file_name = os.path.join(self.directory, "app.conf")
+        self.write(CONFIG % (2, ))
+
+        self.builder = config.Builder()
+        self.builder.add_factory("station", Station)
+        self.reloader = watch.ConfigReloader(self.file_name, self.builder, interval = 0.01)
+
+    def tearDown(self):
+        self.reloader.stop()
+        shutil.rmtree(self.directory)
+
+    def write(self, data):
+        with open(self.file_name, "w") as f:
+            f.write(data)
+
+    def test_check(self):
+        objects = self.reloader.load()
+        stations = objects["configurations"]
+        self.assertEquals(2, stations[1].config["band"])
+        self.assertIsNone(self.reloader.check())
+
+        # Same contents
+        self.write(CONFIG % (2, ))
+        self.assertIsNone(self.reloader.check())
+
+        self.write(CONFIG % (3, ))
+        delta = self.reloader.check()
+        self.assertEquals([ ("replace", ("configurations", 1, "band"), 3) ], delta.patch)
+        self.assertIs(stations[0], delta.objects["configurations"][0])
+        self.assertEquals(3, delta.objects["configurations"][1].config["band"])
+        self.assertEquals([ delta.objects["configurations"][1] ], delta.created)
+        self.assertEquals([ stations[1] ], delta.removed)
+        self.assertIs(delta.objects, self.reloader.objects)
+        self.assertIs(delta.config, self.reloader.config)
+        self.assertIsNone(self.reloader.check())
+
+    def test_errors(self):
+        self.reloader.load()
+        objects = self.reloader.objects
+
+        logging.getLogger("ConfigReloader").disabled = True
+        try:
+            self.write("{ configurations: [ ")
+            self.assertIsNone(self.reloader.check())
+            os.remove(self.file_name)
+            self.assertIsNone(self.reloader.check())
+        finally:
+            logging.getLogger("ConfigReloader").disabled = False
+        self.assertIs(objects, self.reloader.objects)
+
+        self.write(CONFIG % (3, ))
+        self.assertEquals(1, len(self.reloader.check().patch))
+
+        self.write("{ configurations: [ ")
+        self.assertRaises(ejson.ParseError, self.reloader.load)
+
+    def test_broken_config(self):
+        self.reloader.load()
+        deltas = []
+        changed = threading.Event()
+
+        def callback(delta):
+            deltas.append(delta)
+            changed.set()
+
+        logging.getLogger("ConfigReloader").disabled = True
+        try:
+            self.reloader.start(callback)
+            # Parses, but the factory fails
+            self.write(CONFIG % (0, ))
+            self.assertFalse(changed.wait(0.3))
+            self.assertEquals(2, self.reloader.objects["configurations"][1].config["band"])
+
+            self.write(CONFIG % (5, ))
+            self.assertTrue(changed.wait(5))
+            self.reloader.stop()
+        finally:
+            logging.getLogger("ConfigReloader").disabled = False
+
+        self.assertEquals(1, len(deltas))
+        self.assertEquals(5, deltas[0].objects["configurations"][1].config["band"])
+        self.assertEquals([ ("replace", ("configurations", 1, "band"), 5) ], deltas[0].patch)
+
+    def test_start(self):
+        self.reloader.load()
+        deltas = []
+        changed = threading.Event()
+
+        def callback(delta):
+            deltas.append(delta)
+            changed.set()
+
+        self.reloader.start(callback)
+        self.write(CONFIG % (4, ))
+        self.assertTrue(changed.wait(5))
+        self.reloader.stop()
+
+        self.assertEquals(1, len(deltas))
+        self.assertEquals(4, deltas[0].objects["configurations"][1].config["band"])
+
+
+def main():
+    print(__doc__)
+
+
+if __name__ == "__main__":
+    main()